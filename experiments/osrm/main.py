@@ -2,13 +2,27 @@
 """Main entry point for OSRM preprocessing pipeline."""
 
 import argparse
+import json
 import os
 import sys
+import time
 from datetime import datetime
+from pathlib import Path
 from loguru import logger
-from src.core.download_osm import download_osm
-from src.core.transfer import download_from_s3, upload_to_s3
-from src.core.process import cleanup_docker
+from src.core.download_osm import check_source_unchanged, download_osm, get_osm_source, read_source_state
+from src.core.transfer import TransferWorker, download_from_s3, upload_to_s3
+from src.core.multi_profile import build_profiles, parse_profiles
+from src.core.process import add_cpu_arguments, apply_cpu_arguments, cleanup_docker, stable_outputs
+from src.core.publish import publish
+from src.core.regions import build_regions, load_regions
+from src.core.traffic import update_speeds
+from src.utils.bundle import read_bundle_member
+from src.utils.metrics import export_metrics, record_dataset_sizes, record_stage_duration
+from src.utils.s3_utils import get_storage
+
+
+# Records which extract (and profile) the processed dataset was built from
+BUILD_STAMP = "source.json"
 
 
 def cleanup_local_data():
@@ -17,6 +31,8 @@ def cleanup_local_data():
     import glob
     
     data_dirs = ["data/raw", "data/intermediate", "data/processed"]
+    data_dirs += [str(path) for path in Path("data/profiles").glob("*/*") if path.is_dir()]
+    data_dirs += [str(path) for path in Path("data/regions").glob("*/*") if path.is_dir()]
     total_removed = 0
     
     for data_dir in data_dirs:
@@ -45,14 +61,51 @@ def setup_osrm_environment(args):
     """Set up environment variables for OSRM processing based on arguments."""
     # Always set profile, default to car if not specified
     os.environ["OSRM_PROFILE"] = getattr(args, 'profile', 'car') or 'car'
+    apply_cpu_arguments(args)
+
 
+def read_build_stamp(storage_mode="local", bundle=False):
+    """Return the source state the processed dataset was built from, if recorded."""
+    if storage_mode == "s3":
+        storage = get_storage()
+        if bundle:
+            # Bundled datasets carry the stamp as a member of osrm/processed.tar.zst
+            body = read_bundle_member(storage, "osrm/processed", BUILD_STAMP)
+        else:
+            body = storage.read_object(f"osrm/processed/{BUILD_STAMP}")
+        return json.loads(body) if body else None
+    
+    stamp_file = Path("data/processed") / BUILD_STAMP
+    return json.loads(stamp_file.read_text()) if stamp_file.exists() else None
 
-def download_only(storage_type="s3"):
+
+def write_build_stamp(source_state):
+    """Record the source state and profile alongside the processed dataset."""
+    stamp = dict(source_state, profile=os.environ.get("OSRM_PROFILE", "car"))
+    stamp_file = Path("data/processed") / BUILD_STAMP
+    stamp_file.parent.mkdir(parents=True, exist_ok=True)
+    stamp_file.write_text(json.dumps(stamp, indent=2))
+
+
+def build_is_current(storage_mode, source_state, bundle=False):
+    """True if the processed dataset was built from this extract with the current profile."""
+    stamp = read_build_stamp(storage_mode, bundle)
+    return bool(
+        stamp
+        and source_state.get("md5")
+        and stamp.get("md5") == source_state["md5"]
+        and stamp.get("profile") == os.environ.get("OSRM_PROFILE", "car")
+    )
+
+
+def download_only(storage_type="s3", stream=False, conditional=False):
     """
     Download OSM data only (original functionality).
     
     Args:
         storage_type: "local" or "s3" 
+        stream: Stream the download straight into S3 (S3 storage only)
+        conditional: Skip the download if the upstream extract is unchanged
     
     Returns:
         True if successful, False otherwise
@@ -60,7 +113,7 @@ def download_only(storage_type="s3"):
     logger.info("Starting OSM data download...")
     logger.info(f"Storage type: {storage_type}")
     
-    if not download_osm(storage_type=storage_type, s3_prefix="osrm/raw"):
+    if not download_osm(storage_type=storage_type, s3_prefix="osrm/raw", stream=stream, conditional=conditional):
         logger.error("Download failed")
         return False
     
@@ -68,12 +121,58 @@ def download_only(storage_type="s3"):
     return True
 
 
-def complete_pipeline(storage_mode="local"):
+def queue_stable_outputs(transfers, step, shipped, sync=False):
+    """
+    Queue a background upload of the files that are final after a pipeline step.
+    
+    Intermediate files go straight to osrm/processed, where customize would
+    copy them anyway. The size and mtime of every queued file are recorded in
+    shipped so the final upload can tell which ones still need sending.
+    """
+    files = [path for path in stable_outputs(step) if path.name not in shipped]
+    if not files:
+        return
+    for path in files:
+        stat = path.stat()
+        shipped[path.name] = (stat.st_size, stat.st_mtime_ns)
+    transfers.submit(
+        step, upload_to_s3, "data/intermediate", "osrm/processed",
+        sync=sync, files=[str(path) for path in files]
+    )
+
+
+def unshipped_outputs(shipped):
+    """
+    Return the processed files not already uploaded by queue_stable_outputs.
+    
+    A file also counts as unshipped when its intermediate source changed after
+    it was queued, so a step rewriting an unexpected file is still handled.
+    """
+    remaining = []
+    for path in sorted(Path("data/processed").glob("*.osrm*")):
+        source = Path("data/intermediate") / path.name
+        stat = source.stat() if source.exists() else None
+        if shipped.get(path.name) != (stat and (stat.st_size, stat.st_mtime_ns)):
+            remaining.append(str(path))
+    return remaining
+
+
+def complete_pipeline(
+    storage_mode="local", sync=False, stream=False, conditional=False, bundle=False, pipelined=False, cache=False
+):
     """
     Run complete OSRM preprocessing pipeline.
     
     Args:
         storage_mode: "local" (keep all files local) or "s3" (upload after each step)
+        sync: Only transfer files whose content changed (S3 mode)
+        stream: Stream the OSM download straight into S3 (S3 mode)
+        conditional: Skip the download when the upstream extract is unchanged,
+            and the whole run when the processed dataset was built from it
+        bundle: Upload the processed dataset as one compressed bundle (S3 mode)
+        pipelined: Upload each step's final outputs in the background while
+            the next step runs (S3 mode, not combined with bundle)
+        cache: Restore steps from the S3 stage cache when their inputs are unchanged
     
     Returns:
         True if successful, False otherwise
@@ -84,12 +183,28 @@ def complete_pipeline(storage_mode="local"):
     logger.info(f"Started: {start_time}")
     
     from src.core.process import run_docker_compose_step, get_compose_file_for_step
+    from src.core.stage_cache import run_cached_step
     from src.core.transfer import download_from_s3, upload_to_s3
     
+    run_step = run_cached_step if cache else run_docker_compose_step
+    if pipelined and (storage_mode != "s3" or bundle):
+        logger.warning("Pipelined uploads need S3 storage without --bundle, running sequentially")
+        pipelined = False
+    transfers = TransferWorker()
+    shipped = {}
+    
     try:
         # Step 1: Download OSM data
         logger.info("\nStep 1: Download OSM Data")
-        if not download_osm(storage_type=storage_mode):
+        stage_start = time.monotonic()
+        source_state = check_source_unchanged(storage_mode) if conditional else None
+        if source_state and build_is_current(storage_mode, source_state, bundle):
+            logger.success("Upstream extract unchanged and processed dataset is current, nothing to do")
+            return True
+        
+        if source_state:
+            logger.info("Upstream extract unchanged, reusing stored copy")
+        elif not download_osm(storage_type=storage_mode, stream=stream):
             logger.error(f"Failed to download OSM data with {storage_mode} storage")
             return False
         logger.success("Step 1 completed: OSM data ready")
@@ -99,37 +214,65 @@ def complete_pipeline(storage_mode="local"):
         # For S3 storage, always download OSM data from S3 (overwrites local)
         if storage_mode == "s3":
             logger.info("S3 mode: Downloading OSM data from S3 for extraction (overwrites local)")
-            if not download_from_s3("osrm/raw", "data/raw", "california-latest.osm.pbf"):
+            if not download_from_s3("osrm/raw", "data/raw", "california-latest.osm.pbf", sync=sync):
                 logger.error("Failed to download OSM data from S3 for extraction")
                 return False
+        record_stage_duration("download", time.monotonic() - stage_start)
         
-        if not run_docker_compose_step("extract", timeout=1800):
+        if not run_step("extract", timeout=1800):
             logger.error("OSRM extract processing failed")
             return False
         cleanup_docker(get_compose_file_for_step("extract"))
+        if pipelined:
+            queue_stable_outputs(transfers, "extract", shipped, sync=sync)
         logger.success("Step 2 completed: OSRM extraction finished")
         
         # Step 3: OSRM Partition processing
         logger.info("\nStep 3: OSRM Partition Processing")
-        if not run_docker_compose_step("partition", timeout=1800):
+        if not run_step("partition", timeout=1800):
             logger.error("OSRM partition processing failed")
             return False
         cleanup_docker(get_compose_file_for_step("partition"))
+        if pipelined:
+            queue_stable_outputs(transfers, "partition", shipped, sync=sync)
         logger.success("Step 3 completed: OSRM partition finished")
         
         # Step 4: OSRM Customize processing
         logger.info("\nStep 4: OSRM Customize Processing")
-        if not run_docker_compose_step("customize", timeout=1800):
+        if not run_step("customize", timeout=1800):
             logger.error("OSRM customize processing failed")
             return False
         cleanup_docker(get_compose_file_for_step("customize"))
         
+        # Record which extract this dataset was built from for conditional runs
+        source_state = read_source_state(storage_mode)
+        if source_state:
+            write_build_stamp(source_state)
+        
         # Upload final processed data to S3 if using S3 storage
-        if storage_mode == "s3":
+        stage_start = time.monotonic()
+        if pipelined:
+            if not transfers.wait_all():
+                logger.error("Failed to upload intermediate outputs to S3")
+                return False
+            remaining = unshipped_outputs(shipped)
+            logger.info(f"S3 mode: {len(shipped)} files already uploaded, uploading remaining {len(remaining)}")
+            if remaining and not upload_to_s3("data/processed", "osrm/processed", sync=sync, files=remaining):
+                logger.error("Failed to upload processed files to S3")
+                return False
+            # The stamp goes last so it never describes a partially uploaded dataset
+            if (Path("data/processed") / BUILD_STAMP).exists() and not upload_to_s3(
+                "data/processed", "osrm/processed", BUILD_STAMP
+            ):
+                logger.error("Failed to upload build stamp to S3")
+                return False
+        elif storage_mode == "s3":
             logger.info("S3 mode: Uploading final processed data to S3")
-            if not upload_to_s3("data/processed", "osrm/processed"):
+            if not upload_to_s3("data/processed", "osrm/processed", sync=sync, bundle=bundle):
                 logger.error("Failed to upload processed files to S3")
                 return False
+        if storage_mode == "s3":
+            record_stage_duration("upload", time.monotonic() - stage_start)
         logger.success("Step 4 completed: OSRM customize finished")
         
         # Pipeline completion
@@ -157,14 +300,21 @@ def complete_pipeline(storage_mode="local"):
     except Exception as e:
         logger.error(f"Pipeline failed with error: {e}")
         return False
+    finally:
+        transfers.close()
 
 
 
 
-def download_server_data():
+def download_server_data(sync=False, bundle=False, s3_path="osrm/processed"):
     """
     Download OSRM processed data from S3 for server deployment.
     
+    Args:
+        sync: Only download files whose content changed since the last run
+        bundle: Restore from the compressed bundle instead of individual objects
+        s3_path: Dataset prefix (osrm/live for traffic-updated data)
+    
     Returns:
         True if successful, False otherwise
     """
@@ -176,7 +326,7 @@ def download_server_data():
     processed_dir.mkdir(parents=True, exist_ok=True)
     
     # Download all processed files from S3
-    if not download_from_s3("osrm/processed", "data/processed"):
+    if not download_from_s3(s3_path, "data/processed", sync=sync, bundle=bundle):
         logger.error("Failed to download processed OSRM data from S3")
         return False
     
@@ -233,9 +383,9 @@ def main():
     parser = argparse.ArgumentParser(description="OSRM preprocessing pipeline")
     parser.add_argument(
         "--operation",
-        choices=["download", "extract", "partition", "customize", "complete-pipeline", "cleanup", "download-server-data"],
+        choices=["download", "update-osm", "update-speeds", "extract", "partition", "customize", "complete-pipeline", "cleanup", "download-server-data", "publish"],
         default="download",
-        help="Operation to perform: download OSM data, individual OSRM processing steps, complete pipeline, cleanup, or download server data from S3"
+        help="Operation to perform: download OSM data, apply OSM replication diffs, re-customize with traffic data, individual OSRM processing steps, complete pipeline, cleanup, download server data from S3, or hot-swap a dataset into a shared-memory server"
     )
     parser.add_argument(
         "--storage",
@@ -255,6 +405,69 @@ def main():
         default=3600,
         help="Timeout in seconds for Docker operations (default: 3600)"
     )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="Only transfer files whose content changed since the last S3 transfer (uses local sync index)"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream the OSM download straight into S3 without a temporary file (S3 storage only)"
+    )
+    parser.add_argument(
+        "--conditional",
+        action="store_true",
+        help="Skip the download (and the pipeline) when the upstream extract has not changed"
+    )
+    parser.add_argument(
+        "--bundle",
+        action="store_true",
+        help="Store processed data in S3 as one zstd-compressed tar bundle (osrm/processed.tar.zst)"
+    )
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="Upload each step's final outputs to S3 while the next step runs (complete pipeline, S3 storage)"
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Reuse extract/partition/customize outputs from the S3 stage cache when inputs are unchanged"
+    )
+    parser.add_argument(
+        "--profiles",
+        type=parse_profiles,
+        help="Build several profiles (e.g. car,foot,bicycle) in parallel from one download (complete pipeline)"
+    )
+    parser.add_argument(
+        "--regions",
+        metavar="FILE",
+        help="Build every region in a region list (e.g. regions.json) concurrently within the memory budget (complete pipeline)"
+    )
+    parser.add_argument(
+        "--speeds",
+        action="append",
+        default=[],
+        help="Segment speed CSV for update-speeds (local path or s3://bucket/key); repeatable"
+    )
+    parser.add_argument(
+        "--turn-penalties",
+        action="append",
+        default=[],
+        help="Turn penalty CSV for update-speeds (local path or s3://bucket/key); repeatable"
+    )
+    parser.add_argument(
+        "--dataset-prefix",
+        default="osrm/processed",
+        help="S3 prefix download-server-data and publish fetch (default: osrm/processed; also osrm/live or osrm/regions/<region>)"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Publish even if the server fails its health check before the swap (e.g. the first load)"
+    )
+    add_cpu_arguments(parser)
     parser.add_argument(
         "--clean-up", "-c",
         action="store_true",
@@ -265,13 +478,60 @@ def main():
     
     # Set up OSRM environment variables from arguments
     setup_osrm_environment(args)
+    operation_start = time.monotonic()
     
     if args.operation == "download":
-        success = download_only(storage_type=args.storage)
+        success = download_only(storage_type=args.storage, stream=args.stream, conditional=args.conditional)
+    elif args.operation == "update-osm":
+        from src.core.update_osm import update_osm
+        success = update_osm(storage_type=args.storage, timeout=args.timeout)
+    elif args.operation == "update-speeds":
+        success = update_speeds(
+            args.speeds,
+            args.turn_penalties,
+            storage_mode=args.storage,
+            sync=args.sync,
+            bundle=args.bundle,
+            timeout=args.timeout
+        )
+    elif args.operation == "publish":
+        success = publish(
+            storage_mode=args.storage,
+            s3_path=args.dataset_prefix,
+            sync=args.sync,
+            bundle=args.bundle,
+            force=args.force,
+            timeout=args.timeout
+        )
     elif args.operation == "download-server-data":
-        success = download_server_data()
+        success = download_server_data(sync=args.sync, bundle=args.bundle, s3_path=args.dataset_prefix)
+    elif args.operation == "complete-pipeline" and args.regions:
+        success = build_regions(
+            load_regions(args.regions),
+            storage_mode=args.storage,
+            sync=args.sync,
+            conditional=args.conditional,
+            timeout=args.timeout
+        )
+    elif args.operation == "complete-pipeline" and args.profiles:
+        success = build_profiles(
+            args.profiles,
+            storage_mode=args.storage,
+            sync=args.sync,
+            stream=args.stream,
+            conditional=args.conditional,
+            timeout=args.timeout
+        )
     elif args.operation == "complete-pipeline":
-        success = complete_pipeline(storage_mode=args.storage)
+        success = complete_pipeline(
+            storage_mode=args.storage,
+            sync=args.sync,
+            stream=args.stream,
+            conditional=args.conditional,
+            bundle=args.bundle,
+            pipelined=args.pipelined,
+            cache=args.cache
+        )
     elif args.operation in ["extract", "partition", "customize"]:
         # Individual OSRM processing steps with S3 storage logic
         from src.core.process import run_docker_compose_step, get_compose_file_for_step
@@ -284,7 +544,7 @@ def main():
         if args.operation == "extract" and args.storage == "s3":
             # Extract: Read from S3 (overwrite local)
             logger.info("S3 mode: Downloading OSM data from S3 for extraction")
-            if not download_from_s3("osrm/raw", "data/raw", "california-latest.osm.pbf"):
+            if not download_from_s3("osrm/raw", "data/raw", "california-latest.osm.pbf", sync=args.sync):
                 logger.error("Failed to download OSM data from S3 for extraction")
                 success = False
         elif args.operation in ["partition", "customize"]:
@@ -301,7 +561,11 @@ def main():
         
         # Run the processing operation
         if success:
-            success = run_docker_compose_step(args.operation, timeout=args.timeout)
+            if args.cache:
+                from src.core.stage_cache import run_cached_step
+                success = run_cached_step(args.operation, timeout=args.timeout)
+            else:
+                success = run_docker_compose_step(args.operation, timeout=args.timeout)
         
         # Always cleanup docker containers after processing
         cleanup_docker(get_compose_file_for_step(args.operation))
@@ -309,7 +573,7 @@ def main():
         # Post-processing: Handle S3 uploads for customize step
         if success and args.storage == "s3" and args.operation == "customize":
             logger.info("S3 mode: Uploading processed data to S3")
-            if not upload_to_s3("data/processed", "osrm/processed"):
+            if not upload_to_s3("data/processed", "osrm/processed", sync=args.sync, bundle=args.bundle):
                 logger.error("Failed to upload processed data to S3")
                 success = False
     elif args.operation == "cleanup":
@@ -319,6 +583,11 @@ def main():
         logger.error(f"Unknown operation: {args.operation}")
         success = False
     
+    # Export run metrics before any cleanup removes the datasets they describe
+    _, osm_filename = get_osm_source()
+    record_dataset_sizes(Path("data/raw") / osm_filename)
+    export_metrics(args.operation, bool(success), time.monotonic() - operation_start)
+    
     # Run cleanup after operation if requested
     if success and args.clean_up and args.operation != "cleanup":
         logger.info("Running post-operation cleanup...")
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""Load generation and latency benchmarks against osrm-routed."""
+
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import re
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, unquote
+import httpx
+import numpy as np
+from loguru import logger
+from src.client.osrm import OSRMClient, OSRMError, Request
+
+
+SERVICES = ["route", "table", "nearest", "match", "trip"]
+PERCENTILES = {"p50": 50, "p95": 95, "p99": 99, "p99.9": 99.9}
+
+# Matches request paths in plain path lists, URLs and web server access logs
+QUERY_PATTERN = re.compile(r"/(route|table|nearest|match|trip)/v1/[\w-]+/([^\s?\"]+)(?:\?([^\s\"]*))?")
+
+
+@dataclass(slots=True)
+class Sample:
+    service: str
+    latency: float  # seconds, from the scheduled send time in open-loop mode
+    error: Optional[str]  # OSRM code or exception name, None on success
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Parse "route=0.7,table=0.3" into normalized service weights."""
+    mix = {}
+    for part in value.split(","):
+        service, _, weight = part.strip().partition("=")
+        if service not in SERVICES:
+            raise argparse.ArgumentTypeError(f"Unknown service {service!r}; expected one of {', '.join(SERVICES)}")
+        mix[service] = float(weight or 1)
+    total = sum(mix.values())
+    if total <= 0:
+        raise argparse.ArgumentTypeError("Service weights must add up to more than 0")
+    return {service: weight / total for service, weight in mix.items()}
+
+
+def load_coordinates(path: Path) -> np.ndarray:
+    """
+    Read a coordinate set: a JSON list of [lon, lat] or a CSV with lon,lat columns.
+
+    A CSV header row (any non-numeric first row) is skipped. Consecutive rows
+    are treated as a trace by the match workload.
+    """
+    if path.suffix == ".json":
+        return np.asarray(json.loads(path.read_text()), dtype=np.float64).reshape(-1, 2)
+    rows = []
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            try:
+                rows.append((float(row[0]), float(row[1])))
+            except (ValueError, IndexError):
+                if rows:
+                    raise ValueError(f"{path}: invalid coordinate row {row}") from None
+    return np.array(rows, dtype=np.float64).reshape(-1, 2)
+
+
+def random_coordinates(bbox: Tuple[float, float, float, float], count: int, rng: np.random.Generator) -> np.ndarray:
+    """Uniform random points in min_lon,min_lat,max_lon,max_lat."""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return np.column_stack([rng.uniform(min_lon, max_lon, count), rng.uniform(min_lat, max_lat, count)])
+
+
+def synthetic_requests(
+    coordinates: np.ndarray,
+    mix: Dict[str, float],
+    rng: np.random.Generator,
+    route_points: int = 2,
+    table_size: int = 10,
+    trace_length: int = 10
+) -> Iterator[Request]:
+    """
+    Endless requests drawn from a coordinate set.
+
+    route/table/trip pick random points, nearest one point, and match a run of
+    consecutive points (with one-second timestamps) so recorded traces stay traces.
+    """
+    services = list(mix)
+    weights = np.array([mix[service] for service in services])
+    sizes = {"route": route_points, "table": table_size, "trip": table_size}
+    count = len(coordinates)
+    while True:
+        service = services[rng.choice(len(services), p=weights)]
+        if service == "nearest":
+            yield Request("nearest", coordinates[rng.integers(count)].reshape(1, 2))
+        elif service == "match":
+            length = min(trace_length, count)
+            start = rng.integers(count - length + 1)
+            yield Request("match", coordinates[start:start + length], {"timestamps": list(range(length))})
+        else:
+            yield Request(service, coordinates[rng.choice(count, size=min(sizes[service], count), replace=False)])
+
+
+def parse_query_log(path: Path) -> List[Request]:
+    """
+    Read recorded queries: one request path or URL per line, or access log lines.
+
+    Query options are replayed as recorded, except geometries, which the
+    client always requests as GeoJSON.
+    """
+    requests = []
+    for line in path.read_text().splitlines():
+        match = QUERY_PATTERN.search(line)
+        if not match:
+            continue
+        service, coordinates, query = match.groups()
+        try:
+            points = [[float(value) for value in pair.split(",")] for pair in unquote(coordinates).split(";")]
+        except ValueError:
+            continue
+        options = {name: value for name, value in parse_qsl(query or "", keep_blank_values=True) if name != "geometries"}
+        requests.append(Request(service, points, options))
+    if not requests:
+        raise ValueError(f"No OSRM queries found in {path}")
+    return requests
+
+
+async def timed_request(client: OSRMClient, request: Request, started: float) -> Sample:
+    try:
+        await client.request(request)
+        error = None
+    except OSRMError as e:
+        error = e.code
+    except (httpx.HTTPError, ValueError) as e:
+        error = type(e).__name__
+    return Sample(request.service, time.perf_counter() - started, error)
+
+
+async def closed_loop(
+    client: OSRMClient,
+    requests: Iterator[Request],
+    concurrency: int,
+    duration: Optional[float] = None,
+    total: Optional[int] = None
+) -> Tuple[List[Sample], float]:
+    """
+    N clients each sending their next request as soon as the previous one returns.
+
+    Returns:
+        Samples and elapsed seconds
+    """
+    samples: List[Sample] = []
+    issued = itertools.count()
+    start = time.perf_counter()
+    deadline = start + duration if duration else None
+
+    async def worker():
+        while (deadline is None or time.perf_counter() < deadline) and (total is None or next(issued) < total):
+            samples.append(await timed_request(client, next(requests), time.perf_counter()))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - start
+
+
+async def open_loop(
+    client: OSRMClient,
+    requests: Iterator[Request],
+    rate: float,
+    duration: Optional[float] = None,
+    total: Optional[int] = None,
+    max_outstanding: int = 1024,
+    poisson: bool = False,
+    rng: Optional[np.random.Generator] = None
+) -> Tuple[List[Sample], float, int]:
+    """
+    Send requests at a fixed arrival rate, whether or not earlier ones returned.
+
+    Latency is measured from each request's scheduled send time, so a server
+    falling behind shows up as queueing delay instead of a lower send rate
+    (no coordinated omission). Arrivals beyond max_outstanding are dropped
+    and counted.
+
+    Returns:
+        Samples, elapsed seconds and the number of dropped arrivals
+    """
+    rng = rng or np.random.default_rng()
+    samples: List[Sample] = []
+    pending = set()
+    dropped = 0
+    start = time.perf_counter()
+    offset = 0.0
+    for index in itertools.count():
+        if (total is not None and index >= total) or (duration and offset >= duration):
+            break
+        scheduled = start + offset
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(pending) >= max_outstanding:
+            dropped += 1
+        else:
+            task = asyncio.create_task(timed_request(client, next(requests), scheduled))
+            pending.add(task)
+            task.add_done_callback(lambda done: (pending.discard(done), samples.append(done.result())))
+        offset += rng.exponential(1 / rate) if poisson else 1 / rate
+    if pending:
+        await asyncio.gather(*pending)
+    return samples, time.perf_counter() - start, dropped
+
+
+def latency_stats(latencies: np.ndarray) -> Dict[str, Optional[float]]:
+    if not len(latencies):
+        return {name: None for name in [*PERCENTILES, "mean", "max"]}
+    values = np.percentile(latencies * 1000, list(PERCENTILES.values()))
+    stats = {name: round(float(value), 3) for name, value in zip(PERCENTILES, values)}
+    stats["mean"] = round(float(latencies.mean() * 1000), 3)
+    stats["max"] = round(float(latencies.max() * 1000), 3)
+    return stats
+
+
+def summarize(samples: List[Sample], elapsed: float, dropped: int = 0) -> Dict[str, Any]:
+    """
+    Build the report body: QPS, error rates and latency percentiles (ms).
+
+    Percentiles cover successful requests; errors are reported by code.
+    """
+    def section(group: List[Sample]) -> Dict[str, Any]:
+        errors: Dict[str, int] = {}
+        for sample in group:
+            if sample.error:
+                errors[sample.error] = errors.get(sample.error, 0) + 1
+        latencies = np.array([sample.latency for sample in group if not sample.error])
+        return {
+            "requests": len(group),
+            "qps": round(len(latencies) / elapsed, 2) if elapsed else None,
+            "error_rate": round(sum(errors.values()) / len(group), 5) if group else 0.0,
+            "errors": errors,
+            "latency_ms": latency_stats(latencies),
+        }
+
+    report = section(samples)
+    report["elapsed_s"] = round(elapsed, 3)
+    report["dropped"] = dropped
+    report["services"] = {
+        service: section([sample for sample in samples if sample.service == service])
+        for service in sorted({sample.service for sample in samples})
+    }
+    return report
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    rng = np.random.default_rng(args.seed)
+    if args.log:
+        requests = itertools.cycle(parse_query_log(Path(args.log)))
+        workload = {"log": args.log}
+    else:
+        if args.coordinates:
+            coordinates = load_coordinates(Path(args.coordinates))
+        else:
+            coordinates = random_coordinates(args.bbox, args.points, rng)
+        requests = synthetic_requests(coordinates, args.mix, rng, args.route_points, args.table_size, args.trace_length)
+        workload = {"coordinates": args.coordinates or f"random in {args.bbox}", "mix": args.mix}
+
+    pool_size = args.concurrency if args.mode == "closed" else args.max_outstanding
+    async with OSRMClient(args.url, profile=args.profile, concurrency=pool_size, timeout=args.timeout) as client:
+        if args.warmup:
+            await closed_loop(client, requests, args.concurrency, total=args.warmup)
+        duration = None if args.requests and not args.duration else (args.duration or 30)
+        logger.info(f"Running {args.mode}-loop benchmark against {client.base_url}")
+        if args.mode == "closed":
+            samples, elapsed = await closed_loop(client, requests, args.concurrency, duration, args.requests)
+            dropped = 0
+        else:
+            samples, elapsed, dropped = await open_loop(
+                client, requests, args.rate, duration, args.requests, args.max_outstanding, args.poisson, rng
+            )
+
+    report = {
+        "label": args.label,
+        "server": client.base_url,
+        "mode": args.mode,
+        "concurrency": args.concurrency if args.mode == "closed" else None,
+        "target_rate": args.rate if args.mode == "open" else None,
+        "workload": workload,
+    }
+    report.update(summarize(samples, elapsed, dropped))
+    return report
+
+
+def parse_bbox(value: str) -> Tuple[float, float, float, float]:
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected min_lon,min_lat,max_lon,max_lat, got {value!r}") from None
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def main():
+    """Main entry point with CLI argument parsing."""
+    parser = argparse.ArgumentParser(description="Benchmark osrm-routed throughput and tail latency")
+    parser.add_argument("--url", help="Server URL (default: OSRM_SERVER_URL or http://localhost:5000)")
+    parser.add_argument("--profile", default="driving", help="Profile segment of request paths (default: driving)")
+    parser.add_argument(
+        "--mode",
+        choices=["closed", "open"],
+        default="closed",
+        help="closed: --concurrency clients back to back; open: fixed arrival --rate (default: closed)"
+    )
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients in closed-loop mode (default: 16)")
+    parser.add_argument("--rate", type=float, default=100, help="Arrivals per second in open-loop mode (default: 100)")
+    parser.add_argument("--poisson", action="store_true", help="Exponential inter-arrival times instead of a fixed interval")
+    parser.add_argument(
+        "--max-outstanding",
+        type=int,
+        default=1024,
+        help="Open-loop requests in flight before arrivals are dropped (default: 1024)"
+    )
+    parser.add_argument("--duration", type=float, help="Seconds to run (default: 30 unless --requests is given)")
+    parser.add_argument("--requests", type=int, help="Stop after this many requests")
+    parser.add_argument("--warmup", type=int, default=0, help="Unrecorded requests sent first (default: 0)")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds (default: 30)")
+
+    workload = parser.add_argument_group("workload")
+    workload.add_argument("--mix", type=parse_mix, default={"route": 1.0}, help="Service weights, e.g. route=0.7,table=0.2,nearest=0.1")
+    workload.add_argument("--coordinates", help="Coordinate set (CSV lon,lat or JSON list)")
+    workload.add_argument(
+        "--bbox",
+        type=parse_bbox,
+        default=(-122.52, 37.70, -122.35, 37.83),
+        help="Random coordinates in min_lon,min_lat,max_lon,max_lat (default: San Francisco)"
+    )
+    workload.add_argument("--points", type=int, default=1000, help="Random coordinates to draw from --bbox (default: 1000)")
+    workload.add_argument("--log", help="Replay recorded queries (request paths, URLs or access log lines) instead")
+    workload.add_argument("--route-points", type=int, default=2, help="Coordinates per route request (default: 2)")
+    workload.add_argument("--table-size", type=int, default=10, help="Coordinates per table/trip request (default: 10)")
+    workload.add_argument("--trace-length", type=int, default=10, help="Points per match request (default: 10)")
+    workload.add_argument("--seed", type=int, help="Random seed for reproducible workloads")
+
+    parser.add_argument("--label", help="Free-form label stored in the report (e.g. OSRM_THREADS=4)")
+    parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+        logger.success(f"Report written to {args.output}")
+    else:
+        print(text)
+    latency = report["latency_ms"]
+    logger.info(
+        f"{report['requests']} requests, {report['qps']} QPS, error rate {report['error_rate']:.2%}, "
+        f"p50 {latency['p50']} ms, p99 {latency['p99']} ms"
+    )
+    if not report["requests"] or report["error_rate"] == 1:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
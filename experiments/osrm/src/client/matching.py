@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+"""Streaming batch map-matching of GPS trace archives through /match."""
+
+import argparse
+import asyncio
+import math
+import os
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from loguru import logger
+from src.client.osrm import MatchResult, OSRMClient, Request
+
+
+DEFAULT_MAX_MATCHING_SIZE = 100
+# Windows stitched into one output row before it is written; longer segments span several rows
+DEFAULT_PART_WINDOWS = 50
+READ_BATCH_ROWS = 65536
+
+OUTPUT_SCHEMA = pa.schema([
+    ("vehicle_id", pa.string()),
+    ("segment", pa.int32()),
+    ("part", pa.int32()),
+    ("start_time", pa.int64()),
+    ("end_time", pa.int64()),
+    ("points", pa.int32()),
+    ("matched_points", pa.int32()),
+    ("confidence", pa.float32()),
+    ("failed_windows", pa.int32()),
+    ("geometry", pa.list_(pa.list_(pa.float64(), 2))),
+])
+
+
+@dataclass
+class Columns:
+    """Names of the input columns."""
+    vehicle: str = "vehicle_id"
+    time: str = "timestamp"
+    lon: str = "lon"
+    lat: str = "lat"
+
+
+@dataclass(slots=True)
+class Window:
+    """
+    Up to window_size consecutive points of one trace segment.
+
+    Consecutive windows overlap so every point is matched with context on both
+    sides. The window owns points [own_start, own_end) and only those are
+    stitched into the output; the overlap is split at its middle.
+    """
+    vehicle: str
+    segment: int
+    index: int
+    times: np.ndarray
+    points: np.ndarray
+    own_start: int
+    own_end: int
+    final: bool
+
+
+@dataclass
+class OpenTrace:
+    segment: int
+    windows: int = 0
+    times: List[int] = field(default_factory=list)
+    points: List[Tuple[float, float]] = field(default_factory=list)
+    skip: int = 0  # leading points owned by the previous window
+
+
+class Segmenter:
+    """
+    Turn a stream of GPS points into overlapping match windows.
+
+    Points are grouped per vehicle and a segment ends at a time gap over
+    max_gap. Memory stays bounded: each open trace holds at most one window
+    of points, and a trace is closed when it falls max_gap behind the newest
+    timestamp seen (time-ordered input) or when more than max_open traces
+    are open (vehicle-ordered input).
+    """
+
+    def __init__(self, window: int, overlap: int, max_gap: float, max_open: int = 100000, min_points: int = 2):
+        if not 0 < overlap < window:
+            raise ValueError("overlap must be between 0 and the window size")
+        self.window = window
+        self.overlap = overlap
+        self.max_gap = max_gap
+        self.max_open = max_open
+        self.min_points = min_points
+        self.open: "OrderedDict[str, OpenTrace]" = OrderedDict()
+        self.segments: Dict[str, int] = {}
+        self.watermark = float("-inf")
+        self.stats = {"points": 0, "invalid": 0, "out_of_order": 0, "short_segments": 0}
+
+    def window_from(self, vehicle: str, trace: OpenTrace, count: int, final: bool) -> Window:
+        own_end = count if final else count - (self.overlap - self.overlap // 2)
+        window = Window(
+            vehicle=vehicle, segment=trace.segment, index=trace.windows,
+            times=np.array(trace.times[:count], dtype=np.int64),
+            points=np.array(trace.points[:count], dtype=np.float64),
+            own_start=trace.skip, own_end=own_end, final=final,
+        )
+        trace.windows += 1
+        return window
+
+    def close(self, vehicle: str) -> Iterator[Window]:
+        trace = self.open.pop(vehicle)
+        if trace.windows == 0 and len(trace.points) < self.min_points:
+            self.stats["short_segments"] += 1
+            self.segments[vehicle] -= 1  # the number is reused by the next segment
+            return
+        yield self.window_from(vehicle, trace, len(trace.points), final=True)
+
+    def add(self, vehicle: str, timestamp: int, lon: float, lat: float) -> Iterator[Window]:
+        self.stats["points"] += 1
+        if vehicle is None or not (math.isfinite(lon) and math.isfinite(lat)):
+            self.stats["invalid"] += 1
+            return
+        trace = self.open.get(vehicle)
+        if trace is not None:
+            if timestamp < trace.times[-1]:
+                self.stats["out_of_order"] += 1
+                return
+            if timestamp - trace.times[-1] > self.max_gap:
+                yield from self.close(vehicle)
+                trace = None
+        if trace is None:
+            self.segments[vehicle] = self.segments.get(vehicle, -1) + 1
+            trace = self.open[vehicle] = OpenTrace(segment=self.segments[vehicle])
+        self.open.move_to_end(vehicle)
+        trace.times.append(timestamp)
+        trace.points.append((lon, lat))
+
+        if len(trace.points) == self.window:
+            yield self.window_from(vehicle, trace, self.window, final=False)
+            # The next window starts with the overlap and owns its second half
+            del trace.times[:self.window - self.overlap]
+            del trace.points[:self.window - self.overlap]
+            trace.skip = self.overlap // 2
+
+        self.watermark = max(self.watermark, timestamp)
+        if len(self.open) > self.max_open:
+            yield from self.close(next(iter(self.open)))
+
+    def expire(self) -> Iterator[Window]:
+        """Close traces that fell more than max_gap behind the newest timestamp."""
+        stale = [vehicle for vehicle, trace in self.open.items() if self.watermark - trace.times[-1] > self.max_gap]
+        for vehicle in stale:
+            yield from self.close(vehicle)
+
+    def finish(self) -> Iterator[Window]:
+        for vehicle in list(self.open):
+            yield from self.close(vehicle)
+
+
+def read_batches(paths: Iterable[Path], columns: Columns) -> Iterator[pa.RecordBatch]:
+    """Stream record batches from CSV and Parquet files, one file after another."""
+    names = [columns.vehicle, columns.time, columns.lon, columns.lat]
+    for path in paths:
+        path = Path(path)
+        if path.suffix == ".parquet":
+            yield from pq.ParquetFile(path).iter_batches(batch_size=READ_BATCH_ROWS, columns=names)
+        else:
+            options = pa_csv.ConvertOptions(include_columns=names, column_types={columns.vehicle: pa.string()})
+            yield from pa_csv.open_csv(path, convert_options=options)
+
+
+def epoch_seconds(column: pa.Array) -> np.ndarray:
+    if pa.types.is_timestamp(column.type):
+        column = column.cast(pa.timestamp("s"), safe=False).cast(pa.int64())
+    return np.asarray(column.to_numpy(zero_copy_only=False), dtype=np.float64).astype(np.int64)
+
+
+def windows_from(batches: Iterable[pa.RecordBatch], segmenter: Segmenter, columns: Columns) -> Iterator[Window]:
+    for batch in batches:
+        vehicles = batch.column(columns.vehicle).cast(pa.string()).to_pylist()
+        times = epoch_seconds(batch.column(columns.time)).tolist()
+        lons = np.asarray(batch.column(columns.lon).to_numpy(zero_copy_only=False), dtype=np.float64).tolist()
+        lats = np.asarray(batch.column(columns.lat).to_numpy(zero_copy_only=False), dtype=np.float64).tolist()
+        for vehicle, timestamp, lon, lat in zip(vehicles, times, lons, lats):
+            yield from segmenter.add(vehicle, timestamp, lon, lat)
+        yield from segmenter.expire()
+    yield from segmenter.finish()
+
+
+def nearest_vertex(geometry: np.ndarray, location: np.ndarray, start: int = 0) -> int:
+    """Index of the geometry vertex closest to location, searching from start."""
+    return start + int(np.argmin(((geometry[start:] - location) ** 2).sum(axis=1)))
+
+
+def stitch_window(window: Window, result: Union[MatchResult, Exception]) -> Tuple[List[np.ndarray], int, float]:
+    """
+    Cut a window's matched geometry down to the points it owns.
+
+    A matching that also covers points outside the owned range is cut at the
+    geometry vertex nearest its first owned tracepoint and at the one nearest
+    the first tracepoint after the owned range, which is where the next
+    window's piece starts.
+
+    Returns:
+        Geometry pieces, number of owned points matched, and their summed confidence
+    """
+    if isinstance(result, Exception):
+        return [], 0, 0.0
+    own = slice(window.own_start, window.own_end)
+    owned_index = result.matchings_index[own]
+    pieces = []
+    matched = 0
+    confidence = 0.0
+    for matching_index in np.unique(owned_index[owned_index >= 0]):
+        matching = result.matchings[matching_index]
+        members = np.flatnonzero(result.matchings_index == matching_index)
+        owned = members[(members >= window.own_start) & (members < window.own_end)]
+        matched += len(owned)
+        confidence += float(result.confidences[matching_index]) * len(owned)
+        geometry = matching.geometry
+        if geometry is None or not len(geometry):
+            continue
+        start, end = 0, len(geometry)
+        if members[0] < owned[0]:
+            start = nearest_vertex(geometry, result.tracepoints.locations[owned[0]])
+        if members[-1] > owned[-1]:
+            # Run on to the next window's first point, where its piece starts
+            boundary = members[members > owned[-1]][0]
+            end = nearest_vertex(geometry, result.tracepoints.locations[boundary], start) + 1
+        pieces.append(geometry[start:end])
+    return pieces, matched, confidence
+
+
+class SegmentStitcher:
+    """
+    Stitch a segment's windows in order as they return, a part at a time.
+
+    Each window is cut down to its owned piece as soon as every earlier
+    window of the segment is in, and then released. A row is produced every
+    part_windows windows and at the final one, so only the geometry of the
+    current part and the windows that returned ahead of an earlier one are
+    held. The last vertex written is kept to join the next piece.
+    """
+
+    def __init__(self, part_windows: int):
+        self.part_windows = part_windows
+        self.part = 0
+        self.next_window = 0
+        self.early: Dict[int, Tuple[Window, Union[MatchResult, Exception]]] = {}
+        self.join: Optional[np.ndarray] = None
+        self.done = False
+        self._reset()
+
+    def _reset(self):
+        self.windows = 0
+        self.pieces: List[np.ndarray] = []
+        self.points = 0
+        self.matched = 0
+        self.confidence = 0.0
+        self.failed = 0
+        self.start_time: Optional[int] = None
+
+    def add(self, window: Window, result: Union[MatchResult, Exception]) -> List[Dict[str, object]]:
+        """Take a returned window, returning the rows of any parts it completes."""
+        self.early[window.index] = (window, result)
+        rows = []
+        while self.next_window in self.early:
+            window, result = self.early.pop(self.next_window)
+            self.next_window += 1
+            self._append(window, result)
+            if window.final or self.windows == self.part_windows:
+                rows.append(self._row(window))
+            self.done = window.final
+        return rows
+
+    def _append(self, window: Window, result: Union[MatchResult, Exception]):
+        pieces, matched, confidence = stitch_window(window, result)
+        for piece in pieces:
+            # Neighbouring pieces share their joining vertex
+            if self.join is not None and len(piece) and np.array_equal(self.join, piece[0]):
+                piece = piece[1:]
+            if len(piece):
+                self.pieces.append(piece)
+                self.join = piece[-1]
+        if self.start_time is None:
+            self.start_time = int(window.times[window.own_start])
+        self.windows += 1
+        self.points += window.own_end - window.own_start
+        self.matched += matched
+        self.confidence += confidence
+        self.failed += isinstance(result, Exception)
+
+    def _row(self, last: Window) -> Dict[str, object]:
+        row = {
+            "vehicle_id": last.vehicle,
+            "segment": last.segment,
+            "part": self.part,
+            "start_time": self.start_time,
+            "end_time": int(last.times[last.own_end - 1]),
+            "points": self.points,
+            "matched_points": self.matched,
+            "confidence": self.confidence / self.matched if self.matched else None,
+            "failed_windows": self.failed,
+            "geometry": np.concatenate(self.pieces) if self.pieces else np.empty((0, 2)),
+        }
+        self.part += 1
+        self._reset()
+        return row
+
+
+class ColumnarWriter:
+    """Buffer output rows and write them as Parquet row groups or Arrow IPC batches."""
+
+    def __init__(self, path: Path, rows_per_batch: int = 1000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.rows_per_batch = rows_per_batch
+        self.rows: List[Dict[str, object]] = []
+        self.written = 0
+        if self.path.suffix in (".arrow", ".feather"):
+            self.writer = pa.ipc.new_file(self.path, OUTPUT_SCHEMA)
+        else:
+            self.writer = pq.ParquetWriter(self.path, OUTPUT_SCHEMA, compression="zstd")
+
+    def write(self, row: Dict[str, object]):
+        self.rows.append(row)
+        if len(self.rows) >= self.rows_per_batch:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        columns = {name: [row[name] for row in self.rows] for name in OUTPUT_SCHEMA.names if name != "geometry"}
+        geometries = [row["geometry"] for row in self.rows]
+        offsets = np.concatenate([[0], np.cumsum([len(geometry) for geometry in geometries])]).astype(np.int32)
+        flat = np.concatenate(geometries).reshape(-1) if geometries else np.empty(0)
+        columns["geometry"] = pa.ListArray.from_arrays(
+            pa.array(offsets), pa.FixedSizeListArray.from_arrays(pa.array(flat, pa.float64()), 2)
+        )
+        batch = pa.RecordBatch.from_pydict(columns, schema=OUTPUT_SCHEMA)
+        self.writer.write_batch(batch)
+        self.written += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+async def match_traces(
+    paths: List[Path],
+    output: Path,
+    columns: Optional[Columns] = None,
+    max_gap: float = 300,
+    window: Optional[int] = None,
+    overlap: int = 10,
+    radius: Optional[float] = None,
+    client: Optional[OSRMClient] = None,
+    part_windows: int = DEFAULT_PART_WINDOWS
+) -> bool:
+    """
+    Map-match every trace in CSV/Parquet files and write the matched geometry.
+
+    Input rows (vehicle, timestamp, lon, lat) are read in batches. Points are
+    split into segments per vehicle at time gaps and then into overlapping
+    windows within the server's --max-matching-size. The windows are matched
+    concurrently through the client's pool and stitched back in order as
+    they return. Each segment is written as a row with its geometry and mean
+    confidence, or as several rows (parts) of part_windows windows each when
+    it is longer. Memory stays roughly constant: one window of points per
+    open trace, the geometry of one part per segment being matched, and
+    windows that returned before an earlier window of their segment.
+
+    Args:
+        paths: CSV or Parquet trace files
+        output: .parquet (default) or .arrow file to write
+        columns: Input column names
+        max_gap: Seconds without a point that end a segment
+        window: Points per /match request (default: OSRM_MAX_MATCHING_SIZE or 100)
+        overlap: Points shared by consecutive windows
+        radius: GPS accuracy in metres passed as the radius of every point
+        client: Client to use (default: a new OSRMClient)
+        part_windows: Windows per output row of a long segment
+
+    Returns:
+        True if every window was matched, False if any failed
+    """
+    columns = columns or Columns()
+    window = window or int(os.getenv("OSRM_MAX_MATCHING_SIZE", DEFAULT_MAX_MATCHING_SIZE))
+    segmenter = Segmenter(window, overlap, max_gap)
+    writer = ColumnarWriter(output)
+    own_client = client is None
+    client = client or OSRMClient()
+    in_flight: Dict[int, Window] = {}
+    segments: Dict[Tuple[str, int], SegmentStitcher] = {}
+    failed = 0
+    start = time.monotonic()
+
+    def requests() -> Iterator[Request]:
+        for index, item in enumerate(windows_from(read_batches(paths, columns), segmenter, columns)):
+            in_flight[index] = item
+            options = {"timestamps": item.times, "overview": "full", "gaps": "ignore"}
+            if radius is not None:
+                options["radiuses"] = [radius] * len(item.points)
+            yield Request("match", item.points, options)
+
+    try:
+        async for index, result in client.stream(requests()):
+            item = in_flight.pop(index)
+            if isinstance(result, Exception):
+                failed += 1
+                logger.debug(f"Window {item.index} of {item.vehicle}/{item.segment} failed: {result}")
+            stitcher = segments.get((item.vehicle, item.segment))
+            if stitcher is None:
+                stitcher = segments[(item.vehicle, item.segment)] = SegmentStitcher(part_windows)
+            for row in stitcher.add(item, result):
+                writer.write(row)
+            if stitcher.done:
+                del segments[(item.vehicle, item.segment)]
+    finally:
+        writer.close()
+        if own_client:
+            await client.close()
+
+    stats = segmenter.stats
+    logger.info(
+        f"Matched {stats['points']} points into {writer.written} segment rows in {time.monotonic() - start:.1f}s "
+        f"({stats['invalid']} invalid and {stats['out_of_order']} out-of-order points dropped, "
+        f"{stats['short_segments']} single-point segments skipped)"
+    )
+    if failed:
+        logger.error(f"{failed} windows failed to match; their points are missing from {output}")
+        return False
+    logger.success(f"Matched traces written to {output}")
+    return True
+
+
+def main():
+    """Main entry point with CLI argument parsing."""
+    parser = argparse.ArgumentParser(description="Map-match GPS trace archives with OSRM")
+    parser.add_argument("inputs", nargs="+", help="Trace files (.csv or .parquet)")
+    parser.add_argument("--output", required=True, help="Output file (.parquet, or .arrow for Arrow IPC)")
+    parser.add_argument("--url", help="Server URL (default: OSRM_SERVER_URL or http://localhost:5000)")
+    parser.add_argument("--profile", default="driving", help="Profile segment of request paths (default: driving)")
+    parser.add_argument("--vehicle-column", default="vehicle_id", help="Vehicle id column (default: vehicle_id)")
+    parser.add_argument("--time-column", default="timestamp", help="Epoch seconds or timestamp column (default: timestamp)")
+    parser.add_argument("--lon-column", default="lon", help="Longitude column (default: lon)")
+    parser.add_argument("--lat-column", default="lat", help="Latitude column (default: lat)")
+    parser.add_argument("--max-gap", type=float, default=300, help="Seconds without a point that end a segment (default: 300)")
+    parser.add_argument(
+        "--window",
+        type=int,
+        help="Points per /match request, as --max-matching-size on osrm-routed (default: OSRM_MAX_MATCHING_SIZE or 100)"
+    )
+    parser.add_argument("--overlap", type=int, default=10, help="Points shared by consecutive windows (default: 10)")
+    parser.add_argument("--radius", type=float, help="GPS accuracy in metres for every point (default: OSRM's)")
+    parser.add_argument("--concurrency", type=int, help="Windows in flight (default: OSRM_CLIENT_CONCURRENCY or 64)")
+    parser.add_argument(
+        "--part-windows",
+        type=int,
+        default=DEFAULT_PART_WINDOWS,
+        help="Windows per output row; longer segments are split into parts (default: 50)"
+    )
+
+    args = parser.parse_args()
+    columns = Columns(args.vehicle_column, args.time_column, args.lon_column, args.lat_column)
+
+    async def run() -> bool:
+        async with OSRMClient(args.url, profile=args.profile, concurrency=args.concurrency) as client:
+            return await match_traces(
+                [Path(path) for path in args.inputs], Path(args.output), columns,
+                args.max_gap, args.window, args.overlap, args.radius, client, args.part_windows
+            )
+
+    if not asyncio.run(run()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
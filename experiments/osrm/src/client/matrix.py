@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""Large origin/destination matrices assembled from tiled /table requests."""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from loguru import logger
+from src.client.benchmark import load_coordinates
+from src.client.osrm import OSRMClient, Request, TableResult
+
+
+DEFAULT_MAX_TABLE_SIZE = 100
+MANIFEST = "manifest.json"
+DONE = "tiles_done.npy"
+
+# Done flags are flushed after this many tiles (the matrices are flushed first)
+CHECKPOINT_TILES = 256
+
+
+@dataclass(frozen=True)
+class TilePlan:
+    """Split of an N x M matrix into blocks that fit one /table request."""
+    rows: int
+    cols: int
+    tile_rows: int
+    tile_cols: int
+
+    @classmethod
+    def for_limit(cls, rows: int, cols: int, max_table_size: int) -> "TilePlan":
+        """
+        Choose block sizes so sources x destinations stay within max_table_size².
+
+        This is osrm-routed's --max-table-size check, so the default of 100
+        allows 100 x 100 blocks. The budget goes to the smaller side first: a
+        5 x 20000 matrix uses 5-row blocks with 2000 columns rather than
+        square ones.
+        """
+        if max_table_size < 1:
+            raise ValueError("max_table_size must be at least 1")
+        budget = max_table_size * max_table_size
+        tile_rows = tile_cols = max_table_size
+        if rows < tile_rows:
+            tile_rows, tile_cols = rows, budget // rows
+        elif cols < tile_cols:
+            tile_rows, tile_cols = budget // cols, cols
+        return cls(rows, cols, max(1, min(tile_rows, rows)), max(1, min(tile_cols, cols)))
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return -(-self.rows // self.tile_rows), -(-self.cols // self.tile_cols)
+
+    def bounds(self, tile_row: int, tile_col: int) -> Tuple[slice, slice]:
+        row = tile_row * self.tile_rows
+        col = tile_col * self.tile_cols
+        return slice(row, min(row + self.tile_rows, self.rows)), slice(col, min(col + self.tile_cols, self.cols))
+
+
+def table_request(origins: np.ndarray, destinations: np.ndarray, rows: slice, cols: slice, distances: bool) -> Request:
+    """One /table request covering origins[rows] x destinations[cols]."""
+    sources = origins[rows]
+    targets = destinations[cols]
+    options = {
+        "sources": np.arange(len(sources)),
+        "destinations": np.arange(len(sources), len(sources) + len(targets)),
+        "annotations": "duration,distance" if distances else "duration",
+    }
+    return Request("table", np.concatenate([sources, targets]), options)
+
+
+def inputs_digest(origins: np.ndarray, destinations: np.ndarray, plan: TilePlan, profile: str) -> str:
+    digest = hashlib.md5()
+    for array in (origins, destinations):
+        digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+    digest.update(json.dumps([plan.tile_rows, plan.tile_cols, profile]).encode())
+    return digest.hexdigest()
+
+
+class MatrixStore:
+    """
+    Memory-mapped float32 .npy matrices plus per-tile done flags.
+
+    Cells start as NaN and stay NaN where OSRM finds no route. The manifest
+    ties the files to their inputs and tiling, so a resumed run never mixes
+    blocks of a different matrix.
+    """
+
+    def __init__(self, output_dir: Path, plan: TilePlan, digest: str, distances: bool):
+        self.output_dir = Path(output_dir)
+        self.plan = plan
+        manifest = {
+            "shape": [plan.rows, plan.cols],
+            "tile": [plan.tile_rows, plan.tile_cols],
+            "inputs_md5": digest,
+            "distances": distances,
+        }
+        manifest_path = self.output_dir / MANIFEST
+        names = ["durations"] + (["distances"] if distances else [])
+        files = [self.output_dir / f"{name}.npy" for name in names] + [self.output_dir / DONE]
+        self.resumed = (
+            manifest_path.exists() and json.loads(manifest_path.read_text()) == manifest
+            and all(path.exists() for path in files)
+        )
+        if manifest_path.exists() and not self.resumed:
+            logger.warning(f"{self.output_dir} holds a different or incomplete matrix; starting over")
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        mode = "r+" if self.resumed else "w+"
+        self.matrices: Dict[str, np.memmap] = {
+            name: np.lib.format.open_memmap(
+                self.output_dir / f"{name}.npy", mode=mode, dtype=np.float32, shape=(plan.rows, plan.cols)
+            )
+            for name in names
+        }
+        self.done = np.lib.format.open_memmap(self.output_dir / DONE, mode=mode, dtype=np.bool_, shape=plan.shape)
+        if not self.resumed:
+            for matrix in self.matrices.values():
+                matrix[:] = np.nan
+            self.done[:] = False
+            self.flush()
+            manifest_path.write_text(json.dumps(manifest, indent=2))
+
+    def pending(self) -> List[Tuple[int, int]]:
+        return [tuple(int(index) for index in tile) for tile in np.argwhere(~self.done)]
+
+    def write(self, tile: Tuple[int, int], result: TableResult) -> bool:
+        """Store one tile's blocks; False if the response does not fit the tile."""
+        rows, cols = self.plan.bounds(*tile)
+        shape = (rows.stop - rows.start, cols.stop - cols.start)
+        blocks = {"durations": result.durations, "distances": result.distances}
+        if any(blocks[name] is None or blocks[name].shape != shape for name in self.matrices):
+            return False
+        for name, matrix in self.matrices.items():
+            matrix[rows, cols] = blocks[name]
+        self.done[tile] = True
+        return True
+
+    def flush(self):
+        # Matrix blocks reach disk before the flags that mark them done
+        for matrix in self.matrices.values():
+            matrix.flush()
+        self.done.flush()
+
+
+async def compute_matrix(
+    origins: np.ndarray,
+    destinations: np.ndarray,
+    output_dir: str,
+    max_table_size: Optional[int] = None,
+    distances: bool = True,
+    client: Optional[OSRMClient] = None,
+    attempts: int = 3
+) -> bool:
+    """
+    Compute an origins x destinations matrix into memory-mapped .npy files.
+
+    Tiles the matrix into /table requests within the server's max-table-size
+    and runs them concurrently through the client's connection pool. Every
+    block is written straight into <output_dir>/durations.npy (and
+    distances.npy), float32 in seconds and metres. Completed tiles are
+    recorded in tiles_done.npy. A rerun with the same inputs only requests
+    the missing tiles.
+
+    Args:
+        origins: (N, 2) lon/lat
+        destinations: (M, 2) lon/lat
+        output_dir: Directory for the .npy files and manifest
+        max_table_size: Server --max-table-size (default: OSRM_MAX_TABLE_SIZE or 100)
+        distances: Also compute the distance matrix
+        client: Client to use (default: a new OSRMClient)
+        attempts: Passes over failed tiles before giving up
+
+    Returns:
+        True if every tile completed, False otherwise
+    """
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+    destinations = np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+    max_table_size = max_table_size or int(os.getenv("OSRM_MAX_TABLE_SIZE", DEFAULT_MAX_TABLE_SIZE))
+    plan = TilePlan.for_limit(len(origins), len(destinations), max_table_size)
+    own_client = client is None
+    client = client or OSRMClient()
+    store = MatrixStore(Path(output_dir), plan, inputs_digest(origins, destinations, plan, client.profile), distances)
+
+    pending = store.pending()
+    total = plan.shape[0] * plan.shape[1]
+    logger.info(
+        f"{plan.rows}x{plan.cols} matrix in {plan.tile_rows}x{plan.tile_cols} tiles: "
+        f"{len(pending)} of {total} to compute" + (" (resumed)" if store.resumed else "")
+    )
+    start = time.monotonic()
+    errors: Dict[str, int] = {}
+    try:
+        for attempt in range(attempts):
+            if not pending:
+                break
+            if attempt:
+                logger.warning(f"Retrying {len(pending)} failed tiles (attempt {attempt + 1}/{attempts})")
+            tiles = pending
+
+            def requests() -> Iterator[Request]:
+                for tile in tiles:
+                    yield table_request(origins, destinations, *plan.bounds(*tile), distances)
+
+            written = 0
+            async for index, result in client.stream(requests()):
+                if isinstance(result, Exception) or not store.write(tiles[index], result):
+                    name = getattr(result, "code", type(result).__name__)
+                    errors[name] = errors.get(name, 0) + 1
+                    continue
+                written += 1
+                if written % CHECKPOINT_TILES == 0:
+                    store.flush()
+            store.flush()
+            pending = store.pending()
+    finally:
+        store.flush()
+        if own_client:
+            await client.close()
+
+    elapsed = time.monotonic() - start
+    if pending:
+        logger.error(f"{len(pending)} of {total} tiles failed ({errors}); rerun to resume")
+        return False
+    cells = plan.rows * plan.cols
+    logger.success(f"Matrix complete in {output_dir} ({elapsed:.1f}s, {cells / max(elapsed, 1e-9):,.0f} cells/s)")
+    return True
+
+
+def main():
+    """Main entry point with CLI argument parsing."""
+    parser = argparse.ArgumentParser(description="Compute a large OSRM duration/distance matrix")
+    parser.add_argument("--origins", required=True, help="Origin coordinates (CSV lon,lat or JSON list)")
+    parser.add_argument("--destinations", help="Destination coordinates (default: the origins)")
+    parser.add_argument("--output", required=True, help="Directory for durations.npy, distances.npy and progress")
+    parser.add_argument("--url", help="Server URL (default: OSRM_SERVER_URL or http://localhost:5000)")
+    parser.add_argument("--profile", default="driving", help="Profile segment of request paths (default: driving)")
+    parser.add_argument(
+        "--max-table-size",
+        type=int,
+        help="osrm-routed --max-table-size; tiles hold up to its square of cells (default: OSRM_MAX_TABLE_SIZE or 100)"
+    )
+    parser.add_argument("--concurrency", type=int, help="Tiles in flight (default: OSRM_CLIENT_CONCURRENCY or 64)")
+    parser.add_argument("--no-distances", action="store_true", help="Only compute durations")
+
+    args = parser.parse_args()
+
+    origins = load_coordinates(Path(args.origins))
+    destinations = load_coordinates(Path(args.destinations)) if args.destinations else origins
+
+    async def run() -> bool:
+        async with OSRMClient(args.url, profile=args.profile, concurrency=args.concurrency) as client:
+            return await compute_matrix(
+                origins, destinations, args.output, args.max_table_size, distances=not args.no_distances, client=client
+            )
+
+    if not asyncio.run(run()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
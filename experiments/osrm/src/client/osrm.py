@@ -0,0 +1,240 @@
+"""Pooled asyncio client for the osrm-routed HTTP API."""
+
+import asyncio
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import httpx
+import numpy as np
+from src.client.results import (
+    DECODERS, MatchResult, NearestResult, RouteResult, TableResult, TripResult
+)
+
+
+DEFAULT_SERVER_URL = "http://localhost:5000"
+DEFAULT_CONCURRENCY = 64
+
+# Options OSRM separates with "," rather than ";"
+COMMA_OPTIONS = {"annotations", "exclude", "waypoints_per_route"}
+
+Result = Union[RouteResult, TableResult, NearestResult, MatchResult, TripResult]
+Coordinates = Union[np.ndarray, Sequence[Sequence[float]]]
+
+
+class OSRMError(Exception):
+    """Error response from osrm-routed (e.g. NoRoute, InvalidQuery) or an unusable reply."""
+
+    def __init__(self, code: str, message: str = "", status: Optional[int] = None):
+        super().__init__(f"{code}: {message}" if message else code)
+        self.code = code
+        self.message = message
+        self.status = status
+
+
+@dataclass
+class Request:
+    """One API call for OSRMClient.batch: a service, its coordinates and options."""
+    service: str
+    coordinates: Coordinates
+    options: Dict[str, Any] = field(default_factory=dict)
+
+
+def format_coordinates(coordinates: Coordinates) -> str:
+    """Format (n, 2) lon/lat pairs as OSRM's "lon,lat;lon,lat" path segment."""
+    array = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    return ";".join(f"{lon:.6f},{lat:.6f}" for lon, lat in array.tolist())
+
+
+def format_option(name: str, value: Any) -> str:
+    """Format an option value: booleans lower-case, sequences ";"-separated (None for unset entries)."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, str) or not isinstance(value, (Sequence, np.ndarray)):
+        return str(value)
+    separator = "," if name in COMMA_OPTIONS else ";"
+    return separator.join(
+        "" if item is None else (
+            ",".join(str(part) for part in item) if isinstance(item, (Sequence, np.ndarray)) and not isinstance(item, str)
+            else format_option(name, item)
+        )
+        for item in (value.tolist() if isinstance(value, np.ndarray) else value)
+    )
+
+
+class OSRMClient:
+    """
+    Async client keeping a pool of keep-alive connections to one osrm-routed.
+
+    Every call decodes straight into the typed results of src.client.results,
+    with coordinates, durations and distances as numpy arrays. Geometries are
+    always requested as GeoJSON and hints are off unless asked for, which keeps
+    responses small.
+
+    Use as an async context manager so the pool is closed:
+
+        async with OSRMClient() as client:
+            result = await client.route([[-122.42, 37.77], [-122.27, 37.80]])
+            results = await client.batch(Request("table", coords) for coords in chunks)
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        profile: str = "driving",
+        concurrency: Optional[int] = None,
+        timeout: float = 30,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        """
+        Args:
+            base_url: Server URL (default: OSRM_SERVER_URL or http://localhost:5000)
+            profile: Profile segment of request paths
+            concurrency: Pooled connections and in-flight batch requests
+                (default: OSRM_CLIENT_CONCURRENCY or 64)
+            timeout: Per-request timeout in seconds
+            transport: Optional httpx transport (e.g. for tests)
+        """
+        self.base_url = (base_url or os.getenv("OSRM_SERVER_URL", DEFAULT_SERVER_URL)).rstrip("/")
+        self.profile = profile
+        self.concurrency = concurrency or int(os.getenv("OSRM_CLIENT_CONCURRENCY", DEFAULT_CONCURRENCY))
+        limits = httpx.Limits(
+            max_connections=self.concurrency,
+            max_keepalive_connections=self.concurrency,
+            keepalive_expiry=60,
+        )
+        self.http = httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=timeout, transport=transport)
+
+    async def __aenter__(self) -> "OSRMClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self.http.aclose()
+
+    def path(self, service: str, coordinates: Coordinates) -> str:
+        return f"/{service}/v1/{self.profile}/{format_coordinates(coordinates)}"
+
+    def params(self, service: str, options: Dict[str, Any]) -> Dict[str, str]:
+        if options.get("geometries", "geojson") != "geojson":
+            raise ValueError("OSRMClient decodes GeoJSON geometries only")
+        defaults = {"generate_hints": False}
+        if service in ("route", "match", "trip"):
+            defaults["geometries"] = "geojson"
+        return {name: format_option(name, value) for name, value in {**defaults, **options}.items()}
+
+    async def get(self, path: str, params: Optional[Dict[str, str]] = None) -> httpx.Response:
+        response = await self.http.get(path, params=params)
+        if response.status_code != 200:
+            try:
+                body = json.loads(response.content)
+            except ValueError:
+                raise OSRMError("HTTPError", response.text[:200], response.status_code) from None
+            raise OSRMError(body.get("code", "HTTPError"), body.get("message", ""), response.status_code)
+        return response
+
+    async def request(self, request: Request) -> Result:
+        """Run one Request and decode its result."""
+        if request.service not in DECODERS:
+            raise ValueError(f"Unknown service {request.service!r}; expected one of {', '.join(DECODERS)}")
+        response = await self.get(self.path(request.service, request.coordinates), self.params(request.service, request.options))
+        body = json.loads(response.content)
+        if body.get("code") != "Ok":
+            raise OSRMError(body.get("code", "Unknown"), body.get("message", ""), response.status_code)
+        try:
+            return DECODERS[request.service](body)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            raise OSRMError("InvalidResponse", f"{request.service} response missing or malformed {e}", response.status_code) from e
+
+    async def route(self, coordinates: Coordinates, **options) -> RouteResult:
+        """Route through the coordinates in order (options as in the OSRM route API)."""
+        return await self.request(Request("route", coordinates, options))
+
+    async def table(self, coordinates: Coordinates, **options) -> TableResult:
+        """Duration (and, with annotations="duration,distance", distance) matrix."""
+        return await self.request(Request("table", coordinates, options))
+
+    async def nearest(self, coordinate: Sequence[float], number: int = 1, **options) -> NearestResult:
+        """Snap one coordinate to its nearest road segments."""
+        return await self.request(Request("nearest", [coordinate], {"number": number, **options}))
+
+    async def match(self, coordinates: Coordinates, **options) -> MatchResult:
+        """Map-match a GPS trace (timestamps and radiuses as options)."""
+        return await self.request(Request("match", coordinates, options))
+
+    async def trip(self, coordinates: Coordinates, **options) -> TripResult:
+        """Solve the travelling salesman problem over the coordinates."""
+        return await self.request(Request("trip", coordinates, options))
+
+    async def tile(self, x: int, y: int, z: int) -> bytes:
+        """Vector tile (Mapbox Vector Tile bytes) of the routing graph; z must be 12 or more."""
+        response = await self.get(f"/tile/v1/{self.profile}/tile({x},{y},{z}).mvt")
+        return response.content
+
+    async def stream(
+        self,
+        requests: Iterable[Request],
+        concurrency: Optional[int] = None
+    ) -> AsyncIterator[Tuple[int, Union[Result, Exception]]]:
+        """
+        Run requests with bounded concurrency, yielding (index, result) as they complete.
+
+        requests is consumed lazily, so a generator of millions of requests
+        never materializes. A failed request yields its OSRMError or
+        httpx.HTTPError in place of the result; the batch carries on.
+
+        Args:
+            requests: Requests to run
+            concurrency: Requests in flight at once (default: the pool size)
+        """
+        workers_count = min(concurrency or self.concurrency, self.concurrency)
+        iterator = enumerate(requests)
+        completed: asyncio.Queue = asyncio.Queue(maxsize=workers_count)
+
+        failures: List[Exception] = []
+
+        async def worker():
+            try:
+                for index, request in iterator:
+                    try:
+                        result = await self.request(request)
+                    except (OSRMError, httpx.HTTPError, ValueError) as e:
+                        result = e
+                    await completed.put((index, result))
+            except Exception as e:
+                # e.g. the request iterable itself failed
+                failures.append(e)
+            await completed.put(None)
+
+        workers = [asyncio.create_task(worker()) for _ in range(workers_count)]
+        try:
+            running = len(workers)
+            while running:
+                item = await completed.get()
+                if item is None:
+                    running -= 1
+                else:
+                    yield item
+            if failures:
+                raise failures[0]
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def batch(
+        self,
+        requests: Iterable[Request],
+        concurrency: Optional[int] = None
+    ) -> List[Union[Result, Exception]]:
+        """
+        Run requests with bounded concurrency and return results in request order.
+
+        Failed requests have their exception in place of the result.
+        """
+        results: Dict[int, Union[Result, Exception]] = {}
+        async for index, result in self.stream(requests, concurrency):
+            results[index] = result
+        return [results[index] for index in range(len(results))]
@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""Caching, request-coalescing HTTP proxy in front of osrm-routed."""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+import h11
+import httpx
+from loguru import logger
+from src.client.osrm import DEFAULT_SERVER_URL
+from src.core.publish import current_release
+
+
+MB = 1024 * 1024
+UNVERSIONED = "unversioned"
+STATS_PATH = "/_proxy/stats"
+
+# Query options whose value equals OSRM's default are dropped from the cache key and the upstream request
+OPTION_DEFAULTS = {
+    "route": {"alternatives": "false", "steps": "false", "annotations": "false", "geometries": "polyline",
+              "overview": "simplified", "continue_straight": "default"},
+    "match": {"steps": "false", "annotations": "false", "geometries": "polyline", "overview": "simplified",
+              "gaps": "split", "tidy": "false"},
+    "trip": {"steps": "false", "annotations": "false", "geometries": "polyline", "overview": "simplified",
+             "roundtrip": "true", "source": "any", "destination": "any"},
+    "table": {"annotations": "duration"},
+    "nearest": {"number": "1"},
+}
+COMMON_DEFAULTS = {"generate_hints": "true", "skip_waypoints": "false"}
+
+
+@dataclass(slots=True)
+class CachedResponse:
+    status: int
+    content_type: str
+    body: bytes
+
+
+def normalize_target(target: str, precision: int = 5) -> Optional[str]:
+    """
+    Canonical form of an OSRM API request target, or None if it is not cacheable.
+
+    Coordinates are rounded to precision decimals (5 is about 1 m), option
+    names are sorted, booleans lower-cased and options at their default
+    dropped. Identical questions asked differently share one cache entry, and
+    the normalized target is what goes upstream, so a cached answer is exactly
+    the answer to its key.
+    """
+    url = urlsplit(target)
+    parts = url.path.split("/")
+    if len(parts) != 5 or parts[0] or parts[2] != "v1":
+        return None
+    _, service, version, profile, coordinates = parts
+    if service == "tile":
+        return url.path if not url.query else None
+    if service not in OPTION_DEFAULTS:
+        return None
+
+    suffix = ""
+    if coordinates.endswith(".json"):
+        coordinates, suffix = coordinates[:-len(".json")], ".json"
+    try:
+        points = [[round(float(value), precision) for value in pair.split(",")] for pair in coordinates.split(";")]
+    except ValueError:
+        return None  # polyline(...) coordinates are passed through uncached
+    if any(len(point) != 2 for point in points):
+        return None
+    coordinates = ";".join(f"{lon:.{precision}f},{lat:.{precision}f}" for lon, lat in points)
+
+    defaults = {**COMMON_DEFAULTS, **OPTION_DEFAULTS[service]}
+    options = {}
+    for name, value in parse_qsl(url.query, keep_blank_values=True):
+        value = value.lower() if value.lower() in ("true", "false") else value
+        if defaults.get(name) != value:
+            options[name] = value
+    query = urlencode(sorted(options.items()), safe=",;")
+    return f"/{service}/{version}/{profile}/{coordinates}{suffix}" + (f"?{query}" if query else "")
+
+
+def origin_form(target: str) -> Optional[str]:
+    """
+    Path and query of a request target, or None unless it is a plain /path.
+
+    Absolute-form (http://host/...) and //host targets would make httpx
+    ignore the upstream base URL, turning the proxy into an open proxy.
+    """
+    if not target.startswith("/") or target.startswith("//"):
+        return None
+    url = urlsplit(target)
+    if url.scheme or url.netloc:
+        return None
+    return url.path + (f"?{url.query}" if url.query else "")
+
+
+class MemoryCache:
+    """LRU of responses bounded by total body size."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: CachedResponse):
+        if len(entry.body) > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old.body)
+        self.entries[key] = entry
+        self.size += len(entry.body)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted.body)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+class DiskCache:
+    """
+    Second cache tier: one file per response under <directory>/<dataset version>/.
+
+    Files are evicted oldest first once max_bytes is exceeded. Directories of
+    other dataset versions are deleted when the version changes.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.version: Optional[str] = None
+        self.size = 0
+        self.files: "OrderedDict[Path, int]" = OrderedDict()
+        # get/put run in worker threads
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def filename(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def set_version(self, version: str):
+        """Switch to a dataset version, dropping every other version's files."""
+        with self.lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            current = self.directory / version
+            current.mkdir(exist_ok=True)
+            self.version = version
+            for path in self.directory.iterdir():
+                if path.is_dir() and path.name != version:
+                    # A put still finishing into the old version may race the removal; ignore it
+                    shutil.rmtree(path, ignore_errors=True)
+                    logger.info(f"Dropped disk cache of dataset {path.name}")
+            files = sorted((path.stat().st_mtime, path) for path in current.iterdir() if path.is_file())
+            self.files = OrderedDict((path, path.stat().st_size) for _, path in files)
+            self.size = sum(self.files.values())
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        if self.version is None:
+            return None
+        path = self.directory / self.version / self.filename(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            if path in self.files:
+                self.files.move_to_end(path)
+        header, _, body = data.partition(b"\n")
+        status, _, content_type = header.decode().partition(" ")
+        return CachedResponse(int(status), content_type, body)
+
+    def put(self, key: str, entry: CachedResponse):
+        if self.version is None:
+            return
+        path = self.directory / self.version / self.filename(key)
+        data = f"{entry.status} {entry.content_type}\n".encode() + entry.body
+        if len(data) > self.max_bytes:
+            return
+        temp = path.with_name(f".{path.name}.{threading.get_ident()}")
+        try:
+            temp.write_bytes(data)
+            os.replace(temp, path)
+        except FileNotFoundError:
+            return  # the version directory was dropped meanwhile
+        with self.lock:
+            if path.parent.name != self.version:
+                return  # written just before a version switch, which dropped or will drop it
+            self.size += len(data) - self.files.pop(path, 0)
+            self.files[path] = len(data)
+            while self.size > self.max_bytes:
+                evicted, size = self.files.popitem(last=False)
+                evicted.unlink(missing_ok=True)
+                self.size -= size
+
+
+class CachingProxy:
+    """
+    HTTP/1.1 proxy answering OSRM API GETs from cache where it can.
+
+    Lookups go memory LRU, then disk tier, then upstream. Concurrent requests
+    for the same normalized target share one upstream call. Every cache key
+    includes the dataset version (the release data/releases/current points
+    at), and both tiers are emptied when it changes, so no answer outlives
+    the data it was computed from.
+    """
+
+    def __init__(
+        self,
+        upstream: str,
+        memory_bytes: int = 256 * MB,
+        disk_dir: Optional[str] = None,
+        disk_bytes: int = 2048 * MB,
+        precision: int = 5,
+        version_interval: float = 5,
+        version_source: Callable[[], Optional[str]] = current_release,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.precision = precision
+        self.version_interval = version_interval
+        self.version_source = version_source
+        self.memory = MemoryCache(memory_bytes)
+        self.disk = DiskCache(Path(disk_dir), disk_bytes) if disk_dir else None
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.stats = {
+            "hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0, "rejected": 0, "upstream_errors": 0
+        }
+        self.version = UNVERSIONED
+        self.disk_version: Optional[str] = None
+        self.version_checked = float("-inf")
+        self.upstream = httpx.AsyncClient(
+            base_url=upstream.rstrip("/"),
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=64),
+            timeout=60,
+            transport=transport,
+        )
+
+    async def close(self):
+        await self.upstream.aclose()
+
+    async def refresh_version(self) -> str:
+        """Re-read the dataset version at most every version_interval seconds."""
+        now = time.monotonic()
+        if now - self.version_checked < self.version_interval:
+            return self.version
+        self.version_checked = now
+        version = self.version_source() or UNVERSIONED
+        if version != self.version:
+            logger.info(f"Dataset version {self.version} -> {version}; dropping cached responses")
+            self.version = version
+            self.memory.clear()
+        if self.disk and self.disk_version != version:
+            self.disk_version = version
+            # Deleting the previous version's files must not block the event loop
+            await asyncio.to_thread(self.disk.set_version, version)
+        return self.version
+
+    async def fetch(self, target: str) -> CachedResponse:
+        response = await self.upstream.get(target)
+        return CachedResponse(response.status_code, response.headers.get("content-type", "application/json"), response.content)
+
+    async def handle(self, target: str) -> Tuple[CachedResponse, str]:
+        """
+        Answer one GET target.
+
+        Returns:
+            The response and its cache state: HIT, DISK, MISS, COALESCED or BYPASS
+        """
+        if target == STATS_PATH:
+            body = json.dumps({
+                **self.stats, "version": self.version,
+                "entries": len(self.memory.entries), "bytes": self.memory.size,
+                "disk_bytes": self.disk.size if self.disk else 0,
+            }).encode()
+            return CachedResponse(200, "application/json", body), "BYPASS"
+
+        path = origin_form(target)
+        if path is None:
+            self.stats["rejected"] += 1
+            return CachedResponse(400, "text/plain", b"Only origin-form targets (/path?query) are proxied\n"), "BYPASS"
+        normalized = normalize_target(path, self.precision)
+        if normalized is None:
+            self.stats["bypassed"] += 1
+            return await self.fetch(path), "BYPASS"
+
+        key = f"{await self.refresh_version()}:{normalized}"
+        cached = self.memory.get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached, "HIT"
+        if self.disk:
+            cached = await asyncio.to_thread(self.disk.get, key)
+            if cached is not None:
+                self.stats["disk_hits"] += 1
+                self.memory.put(key, cached)
+                return cached, "DISK"
+
+        while (pending := self.in_flight.get(key)) is not None:
+            try:
+                response = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise  # this request itself was cancelled
+                continue  # the leading request's client went away: take over, or join the next leader
+            self.stats["coalesced"] += 1
+            return response, "COALESCED"
+
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            response = await self.fetch(normalized)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # waiters re-raise it; this one must not be reported as unretrieved
+            raise
+        finally:
+            del self.in_flight[key]
+        future.set_result(response)
+        # Only complete answers are cached; errors such as NoRoute are cheap to recompute
+        if response.status == 200 and key.startswith(f"{self.version}:"):
+            self.memory.put(key, response)
+            if self.disk:
+                await asyncio.to_thread(self.disk.put, key, response)
+        return response, "MISS"
+
+    @staticmethod
+    async def next_event(connection: h11.Connection, reader: asyncio.StreamReader):
+        while True:
+            event = connection.next_event()
+            if event is not h11.NEED_DATA:
+                return event
+            connection.receive_data(await reader.read(65536))
+
+    async def respond(self, method: str, target: str) -> Tuple[CachedResponse, str]:
+        if method != "GET":
+            return CachedResponse(405, "text/plain", b"Only GET is proxied\n"), "BYPASS"
+        try:
+            return await self.handle(target)
+        except httpx.HTTPError as e:
+            self.stats["upstream_errors"] += 1
+            logger.warning(f"Upstream request {target} failed: {e}")
+            body = json.dumps({"code": "UpstreamError", "message": str(e) or type(e).__name__}).encode()
+            return CachedResponse(502, "application/json", body), "BYPASS"
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve keep-alive HTTP/1.1 requests on one client connection."""
+        connection = h11.Connection(h11.SERVER)
+        try:
+            while True:
+                request = await self.next_event(connection, reader)
+                if not isinstance(request, h11.Request):
+                    break  # client closed the connection
+                while not isinstance(await self.next_event(connection, reader), h11.EndOfMessage):
+                    pass  # OSRM requests carry no body
+                response, state = await self.respond(request.method.decode(), request.target.decode())
+                headers = [
+                    ("content-type", response.content_type),
+                    ("content-length", str(len(response.body))),
+                    ("x-cache", state),
+                    ("x-dataset-version", self.version),
+                ]
+                writer.write(connection.send(h11.Response(status_code=response.status, headers=headers)))
+                writer.write(connection.send(h11.Data(data=response.body)))
+                writer.write(connection.send(h11.EndOfMessage()))
+                await writer.drain()
+                if connection.our_state is h11.MUST_CLOSE:
+                    break
+                connection.start_next_cycle()
+        except (h11.RemoteProtocolError, ConnectionError) as e:
+            logger.debug(f"Client connection ended: {e}")
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> asyncio.Server:
+        server = await asyncio.start_server(self.serve_connection, host, port)
+        logger.info(f"Caching proxy on {host}:{port} -> {self.upstream.base_url}")
+        return server
+
+
+def main():
+    """Main entry point with CLI argument parsing."""
+    parser = argparse.ArgumentParser(description="Caching, request-coalescing proxy for osrm-routed")
+    parser.add_argument("--host", default=os.getenv("PROXY_HOST", "0.0.0.0"), help="Listen address (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PROXY_PORT", "5001")), help="Listen port (default: 5001)")
+    parser.add_argument("--upstream", default=os.getenv("OSRM_SERVER_URL", DEFAULT_SERVER_URL), help="osrm-routed URL")
+    parser.add_argument(
+        "--cache-mb",
+        type=int,
+        default=int(os.getenv("PROXY_CACHE_MB", "256")),
+        help="Memory cache size in MiB (default: 256)"
+    )
+    parser.add_argument("--disk-cache-dir", default=os.getenv("PROXY_DISK_CACHE_DIR"), help="Enable the on-disk tier here")
+    parser.add_argument(
+        "--disk-cache-mb",
+        type=int,
+        default=int(os.getenv("PROXY_DISK_CACHE_MB", "2048")),
+        help="Disk cache size in MiB (default: 2048)"
+    )
+    parser.add_argument(
+        "--precision",
+        type=int,
+        default=int(os.getenv("PROXY_COORDINATE_PRECISION", "5")),
+        help="Decimals coordinates are rounded to (default: 5, about 1 m)"
+    )
+
+    args = parser.parse_args()
+
+    async def run():
+        proxy = CachingProxy(
+            args.upstream,
+            memory_bytes=args.cache_mb * MB,
+            disk_dir=args.disk_cache_dir,
+            disk_bytes=args.disk_cache_mb * MB,
+            precision=args.precision,
+            version_interval=float(os.getenv("PROXY_VERSION_INTERVAL", "5")),
+        )
+        server = await proxy.serve(args.host, args.port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await proxy.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
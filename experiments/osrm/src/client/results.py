@@ -0,0 +1,169 @@
+"""Compact typed results decoded from OSRM HTTP API responses."""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+
+@dataclass(slots=True)
+class Waypoints:
+    """
+    Snapped input coordinates, one row per input.
+
+    Inputs OSRM could not use (unmatched trace points) are NaN rows in
+    locations and distances.
+    """
+    locations: np.ndarray  # (n, 2) lon/lat, float64
+    distances: np.ndarray  # (n,) metres from the input coordinate to the snapped one
+    names: List[str]
+
+
+@dataclass(slots=True)
+class Route:
+    """One route, matching or trip."""
+    distance: float
+    duration: float
+    weight: float
+    geometry: Optional[np.ndarray]  # (n, 2) lon/lat, None with overview=false
+    leg_distances: np.ndarray
+    leg_durations: np.ndarray
+    annotations: Dict[str, np.ndarray] = field(default_factory=dict)  # per segment, concatenated over legs
+    steps: Optional[List[Dict[str, Any]]] = None  # raw steps of all legs, only with steps=true
+
+
+@dataclass(slots=True)
+class RouteResult:
+    routes: List[Route]
+    waypoints: Waypoints
+
+
+@dataclass(slots=True)
+class TableResult:
+    """Matrices are (sources, destinations) float64, NaN where no route exists."""
+    durations: Optional[np.ndarray]
+    distances: Optional[np.ndarray]
+    sources: Waypoints
+    destinations: Waypoints
+
+
+@dataclass(slots=True)
+class NearestResult:
+    waypoints: Waypoints
+
+
+@dataclass(slots=True)
+class MatchResult:
+    matchings: List[Route]
+    confidences: np.ndarray
+    tracepoints: Waypoints
+    matchings_index: np.ndarray  # (n,) matching each trace point belongs to, -1 if unmatched
+    waypoint_index: np.ndarray  # (n,) waypoint index within its matching, -1 if unmatched
+
+
+@dataclass(slots=True)
+class TripResult:
+    trips: List[Route]
+    waypoints: Waypoints
+    trips_index: np.ndarray  # (n,) trip each input coordinate was assigned to
+    waypoint_index: np.ndarray  # (n,) position of each input coordinate within its trip
+
+
+def decode_waypoints(items: List[Optional[Dict[str, Any]]]) -> Waypoints:
+    locations = np.full((len(items), 2), np.nan)
+    distances = np.full(len(items), np.nan)
+    names = []
+    for i, item in enumerate(items):
+        if item is None:
+            names.append("")
+            continue
+        locations[i] = item["location"]
+        distances[i] = item.get("distance", np.nan)
+        names.append(item.get("name", ""))
+    return Waypoints(locations=locations, distances=distances, names=names)
+
+
+def decode_geometry(geometry: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+    """GeoJSON LineString (the client always requests geometries=geojson)."""
+    if geometry is None:
+        return None
+    return np.asarray(geometry["coordinates"], dtype=np.float64).reshape(-1, 2)
+
+
+def decode_route(data: Dict[str, Any]) -> Route:
+    legs = data.get("legs", [])
+    annotations: Dict[str, List[np.ndarray]] = {}
+    for leg in legs:
+        for key, values in leg.get("annotation", {}).items():
+            if isinstance(values, list):
+                annotations.setdefault(key, []).append(np.asarray(values))
+    steps = [step for leg in legs for step in leg.get("steps", [])]
+    return Route(
+        distance=float(data.get("distance", np.nan)),
+        duration=float(data.get("duration", np.nan)),
+        weight=float(data.get("weight", np.nan)),
+        geometry=decode_geometry(data.get("geometry")),
+        leg_distances=np.array([leg.get("distance", np.nan) for leg in legs], dtype=np.float64),
+        leg_durations=np.array([leg.get("duration", np.nan) for leg in legs], dtype=np.float64),
+        annotations={key: np.concatenate(parts) for key, parts in annotations.items()},
+        steps=steps or None,
+    )
+
+
+def decode_matrix(rows: Optional[List[List[Optional[float]]]]) -> Optional[np.ndarray]:
+    # None entries (no route) become NaN
+    return None if rows is None else np.array(rows, dtype=np.float64)
+
+
+def decode_indices(items: List[Optional[Dict[str, Any]]], key: str) -> np.ndarray:
+    return np.array([-1 if item is None else item[key] for item in items], dtype=np.int64)
+
+
+def decode_route_result(body: Dict[str, Any]) -> RouteResult:
+    return RouteResult(
+        routes=[decode_route(route) for route in body.get("routes", [])],
+        waypoints=decode_waypoints(body.get("waypoints", [])),
+    )
+
+
+def decode_table_result(body: Dict[str, Any]) -> TableResult:
+    return TableResult(
+        durations=decode_matrix(body.get("durations")),
+        distances=decode_matrix(body.get("distances")),
+        sources=decode_waypoints(body.get("sources", [])),
+        destinations=decode_waypoints(body.get("destinations", [])),
+    )
+
+
+def decode_nearest_result(body: Dict[str, Any]) -> NearestResult:
+    return NearestResult(waypoints=decode_waypoints(body.get("waypoints", [])))
+
+
+def decode_match_result(body: Dict[str, Any]) -> MatchResult:
+    matchings = body.get("matchings", [])
+    tracepoints = body.get("tracepoints", [])
+    return MatchResult(
+        matchings=[decode_route(matching) for matching in matchings],
+        confidences=np.array([matching.get("confidence", np.nan) for matching in matchings], dtype=np.float64),
+        tracepoints=decode_waypoints(tracepoints),
+        matchings_index=decode_indices(tracepoints, "matchings_index"),
+        waypoint_index=decode_indices(tracepoints, "waypoint_index"),
+    )
+
+
+def decode_trip_result(body: Dict[str, Any]) -> TripResult:
+    waypoints = body.get("waypoints", [])
+    return TripResult(
+        trips=[decode_route(trip) for trip in body.get("trips", [])],
+        waypoints=decode_waypoints(waypoints),
+        trips_index=decode_indices(waypoints, "trips_index"),
+        waypoint_index=decode_indices(waypoints, "waypoint_index"),
+    )
+
+
+DECODERS = {
+    "route": decode_route_result,
+    "table": decode_table_result,
+    "nearest": decode_nearest_result,
+    "match": decode_match_result,
+    "trip": decode_trip_result,
+}
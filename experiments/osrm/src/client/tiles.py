@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""Pre-render osrm-routed vector tiles into a deduplicated MBTiles file."""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+import httpx
+from loguru import logger
+from src.client.osrm import OSRMClient, OSRMError
+from src.utils.s3_utils import get_storage, load_env_once
+
+
+# osrm-routed only serves tiles from zoom 12 up
+MIN_TILE_ZOOM = 12
+DEFAULT_TILES_PREFIX = "osrm/tiles"
+# Tiles inserted per transaction
+COMMIT_TILES = 1000
+
+# Deduplicated MBTiles layout: identical tiles (empty areas, mostly) are stored once in images
+MBTILES_SCHEMA = """
+CREATE TABLE metadata (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE images (tile_id TEXT PRIMARY KEY, tile_data BLOB);
+CREATE TABLE map (
+    zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_id TEXT,
+    PRIMARY KEY (zoom_level, tile_column, tile_row)
+);
+CREATE VIEW tiles AS
+    SELECT map.zoom_level AS zoom_level, map.tile_column AS tile_column,
+           map.tile_row AS tile_row, images.tile_data AS tile_data
+    FROM map JOIN images ON images.tile_id = map.tile_id;
+"""
+
+Bbox = Tuple[float, float, float, float]
+
+
+def tile_xy(lon: float, lat: float, zoom: int) -> Tuple[int, int]:
+    """XYZ (slippy map) tile containing a point."""
+    n = 2 ** zoom
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_range(bbox: Bbox, zoom: int) -> Tuple[range, range]:
+    min_lon, min_lat, max_lon, max_lat = bbox
+    min_x, min_y = tile_xy(min_lon, max_lat, zoom)
+    max_x, max_y = tile_xy(max_lon, min_lat, zoom)
+    return range(min_x, max_x + 1), range(min_y, max_y + 1)
+
+
+def count_tiles(bbox: Bbox, min_zoom: int, max_zoom: int) -> int:
+    return sum(len(xs) * len(ys) for xs, ys in (tile_range(bbox, zoom) for zoom in range(min_zoom, max_zoom + 1)))
+
+
+def enumerate_tiles(bbox: Bbox, min_zoom: int, max_zoom: int) -> Iterator[Tuple[int, int, int]]:
+    """(z, x, y) of every tile covering bbox, lazily, zoom by zoom."""
+    for zoom in range(min_zoom, max_zoom + 1):
+        xs, ys = tile_range(bbox, zoom)
+        for x in xs:
+            for y in ys:
+                yield zoom, x, y
+
+
+class MBTilesWriter:
+    """
+    Write tiles into a new MBTiles file with content-hash deduplication.
+
+    The file is built under a temporary name and renamed into place on
+    close, so readers never see a half-written tileset.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.temp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        self.temp.unlink(missing_ok=True)
+        self.db = sqlite3.connect(self.temp)
+        self.db.executescript(MBTILES_SCHEMA)
+        self.pending = 0
+        self.tiles = 0
+        self.unique = set()
+
+    def add(self, zoom: int, x: int, y: int, data: bytes):
+        tile_id = hashlib.md5(data).hexdigest()
+        if tile_id not in self.unique:
+            self.unique.add(tile_id)
+            # mtime=0 keeps the compressed bytes deterministic
+            self.db.execute("INSERT INTO images VALUES (?, ?)", (tile_id, gzip.compress(data, mtime=0)))
+        # MBTiles rows count from the south (TMS), XYZ rows from the north
+        self.db.execute("INSERT OR REPLACE INTO map VALUES (?, ?, ?, ?)", (zoom, x, (2 ** zoom - 1) - y, tile_id))
+        self.tiles += 1
+        self.pending += 1
+        if self.pending >= COMMIT_TILES:
+            self.db.commit()
+            self.pending = 0
+
+    def close(self, metadata: dict):
+        self.db.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?)", [(k, str(v)) for k, v in metadata.items()])
+        self.db.commit()
+        self.db.execute("VACUUM")
+        self.db.close()
+        os.replace(self.temp, self.path)
+
+    def abort(self):
+        self.db.close()
+        self.temp.unlink(missing_ok=True)
+
+
+async def render_tiles(
+    bbox: Bbox,
+    min_zoom: int,
+    max_zoom: int,
+    output: Path,
+    client: Optional[OSRMClient] = None,
+    concurrency: Optional[int] = None,
+    dataset_version: Optional[str] = None
+) -> bool:
+    """
+    Fetch every /tile covering bbox between min_zoom and max_zoom into MBTiles.
+
+    Tiles are fetched by a fixed pool of workers. Fetched tiles pass through a
+    bounded queue to a single SQLite writer, so a slow disk slows the fetching
+    instead of buffering tiles in memory. Empty tiles (no road data) are left
+    out; identical tiles are stored once.
+
+    Args:
+        bbox: min_lon, min_lat, max_lon, max_lat
+        min_zoom: First zoom level (at least 12, osrm-routed's minimum)
+        max_zoom: Last zoom level
+        output: MBTiles file to write
+        client: Client to use (default: a new OSRMClient)
+        concurrency: Tiles in flight (default: the client's pool size)
+        dataset_version: Release the server is serving, stored as the tileset version
+
+    Returns:
+        True if every tile was fetched, False otherwise
+    """
+    if min_zoom < MIN_TILE_ZOOM or max_zoom < min_zoom:
+        logger.error(f"Zoom range {min_zoom}-{max_zoom} invalid; osrm-routed serves tiles from zoom {MIN_TILE_ZOOM}")
+        return False
+    total = count_tiles(bbox, min_zoom, max_zoom)
+    own_client = client is None
+    client = client or OSRMClient()
+    workers_count = min(concurrency or client.concurrency, client.concurrency)
+    logger.info(f"Rendering {total} tiles (zoom {min_zoom}-{max_zoom}) into {output}")
+
+    writer = MBTilesWriter(output)
+    tiles = enumerate_tiles(bbox, min_zoom, max_zoom)
+    fetched: asyncio.Queue = asyncio.Queue(maxsize=workers_count * 2)
+    stats = {"empty": 0, "failed": 0}
+    start = time.monotonic()
+
+    async def fetch():
+        for zoom, x, y in tiles:
+            try:
+                data = await client.tile(x, y, zoom)
+            except (OSRMError, httpx.HTTPError) as e:
+                stats["failed"] += 1
+                logger.debug(f"Tile {zoom}/{x}/{y} failed: {e}")
+                continue
+            await fetched.put((zoom, x, y, data))
+
+    async def write():
+        while (item := await fetched.get()) is not None:
+            zoom, x, y, data = item
+            if data:
+                writer.add(zoom, x, y, data)
+            else:
+                stats["empty"] += 1
+            done = writer.tiles + stats["empty"]
+            if done % 10000 == 0:
+                logger.info(f"{done}/{total} tiles ({done / (time.monotonic() - start):.0f}/s)")
+
+    writer_task = asyncio.create_task(write())
+    fetchers = asyncio.gather(*(fetch() for _ in range(workers_count)))
+    try:
+        done, _ = await asyncio.wait({writer_task, fetchers}, return_when=asyncio.FIRST_COMPLETED)
+        if writer_task in done:
+            # The writer only stops early by failing, which would leave the fetchers blocked on the queue
+            writer_task.result()
+        fetchers.result()
+        await fetched.put(None)
+        await writer_task
+    except BaseException:
+        writer_task.cancel()
+        fetchers.cancel()
+        await asyncio.gather(writer_task, fetchers, return_exceptions=True)
+        writer.abort()
+        raise
+    finally:
+        if own_client:
+            await client.close()
+
+    if stats["failed"]:
+        # An incomplete tileset must not replace the last complete one
+        writer.abort()
+        logger.error(f"{stats['failed']} tiles failed; {output} left unchanged")
+        return False
+
+    min_lon, min_lat, max_lon, max_lat = bbox
+    metadata = {
+        "name": output.stem,
+        "format": "pbf",
+        "type": "overlay",
+        "description": f"osrm-routed {client.profile} tiles",
+        "bounds": f"{min_lon},{min_lat},{max_lon},{max_lat}",
+        "center": f"{(min_lon + max_lon) / 2},{(min_lat + max_lat) / 2},{min_zoom}",
+        "minzoom": min_zoom,
+        "maxzoom": max_zoom,
+        "json": json.dumps({"vector_layers": [
+            {"id": layer, "minzoom": min_zoom, "maxzoom": max_zoom, "fields": {}} for layer in ("speeds", "turns")
+        ]}),
+    }
+    if dataset_version:
+        metadata["version"] = dataset_version
+    writer.close(metadata)
+    logger.info(
+        f"{writer.tiles} tiles stored as {len(writer.unique)} unique images, {stats['empty']} empty "
+        f"in {time.monotonic() - start:.1f}s"
+    )
+    return True
+
+
+def publish_tiles(path: Path, prefix: Optional[str] = None) -> bool:
+    """Upload an MBTiles file to <TILES_PREFIX>/<name> (default: osrm/tiles), next to osrm/processed."""
+    load_env_once()
+    prefix = prefix or os.getenv("TILES_PREFIX", DEFAULT_TILES_PREFIX)
+    key = f"{prefix}/{path.name}"
+    if not get_storage().upload_file(str(path), key):
+        logger.error(f"Failed to upload {path} to {key}")
+        return False
+    logger.success(f"Published {path} to {key}")
+    return True
+
+
+def parse_bbox(value: str) -> Bbox:
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected min_lon,min_lat,max_lon,max_lat, got {value!r}") from None
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def main():
+    """Main entry point with CLI argument parsing."""
+    parser = argparse.ArgumentParser(description="Pre-render osrm-routed vector tiles into MBTiles")
+    parser.add_argument(
+        "--bbox",
+        type=parse_bbox,
+        required=True,
+        help="Area to render as min_lon,min_lat,max_lon,max_lat"
+    )
+    parser.add_argument("--min-zoom", type=int, default=MIN_TILE_ZOOM, help="First zoom level (default: 12)")
+    parser.add_argument("--max-zoom", type=int, default=14, help="Last zoom level (default: 14)")
+    parser.add_argument("--output", help="MBTiles file (default: data/tiles/<profile>.mbtiles)")
+    parser.add_argument("--url", help="Server URL (default: OSRM_SERVER_URL or http://localhost:5000)")
+    parser.add_argument("--profile", default="driving", help="Profile segment of request paths (default: driving)")
+    parser.add_argument("--concurrency", type=int, help="Tiles in flight (default: OSRM_CLIENT_CONCURRENCY or 64)")
+    parser.add_argument(
+        "--dataset-version",
+        help="Release the server at --url is serving, recorded as the tileset version (e.g. 20250101T000000Z)"
+    )
+    parser.add_argument(
+        "--storage",
+        choices=["local", "s3"],
+        default="local",
+        help="Storage mode: local, or s3 to also publish the file to TILES_PREFIX (default: local)"
+    )
+
+    args = parser.parse_args()
+    output = Path(args.output or f"data/tiles/{args.profile}.mbtiles")
+
+    async def run() -> bool:
+        async with OSRMClient(args.url, profile=args.profile, concurrency=args.concurrency) as client:
+            return await render_tiles(
+                args.bbox, args.min_zoom, args.max_zoom, output, client, dataset_version=args.dataset_version
+            )
+
+    if not asyncio.run(run()):
+        sys.exit(1)
+    if args.storage == "s3" and not publish_tiles(output):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,163 @@
 #!/usr/bin/env python3
 """Download OSM data for OSRM processing with local or S3 storage."""
 
+import hashlib
+import json
 import os
 import sys
 import argparse
 import tempfile
 from pathlib import Path
-from urllib.request import urlretrieve
-from urllib.error import URLError
-from dotenv import load_dotenv
+from typing import Optional, Tuple
+from urllib.request import urlopen
+from urllib.error import HTTPError, URLError
 from loguru import logger
-from src.utils.s3_utils import S3Storage
+from src.utils.http_download import conditional_probe, fetch_published_md5, probe_url, segmented_download
+from src.utils.s3_utils import get_storage, load_env_once
+from src.utils.sync_index import file_md5
 
 
-def download_osm(storage_type="local", s3_prefix="osrm/raw"):
+DEFAULT_OSM_URL = "http://download.geofabrik.de/north-america/us/california-latest.osm.pbf"
+DEFAULT_OSM_FILENAME = "california-latest.osm.pbf"
+
+# S3 user metadata keys carrying the upstream state of a stored extract
+SOURCE_METADATA_KEYS = {
+    "url": "source-url",
+    "etag": "source-etag",
+    "last_modified": "source-last-modified",
+    "md5": "md5",
+}
+
+
+def get_osm_source():
+    """Return the configured (download URL, filename) pair."""
+    load_env_once()
+    return (
+        os.getenv("OSM_DOWNLOAD_URL", DEFAULT_OSM_URL),
+        os.getenv("OSM_FILENAME", DEFAULT_OSM_FILENAME),
+    )
+
+
+def source_state_path(osm_file: Path) -> Path:
+    """Local sidecar holding the upstream state of a downloaded extract."""
+    return osm_file.with_name(osm_file.name + ".source.json")
+
+
+def read_source_state(
+    storage_type="local",
+    s3_prefix="osrm/raw",
+    source: Optional[Tuple[str, str]] = None,
+    raw_dir="data/raw"
+) -> Optional[dict]:
+    """
+    Read the recorded upstream state (URL, ETag, Last-Modified, MD5) of the
+    currently stored extract.
+    
+    Args:
+        storage_type: "local" (sidecar next to data/raw file) or "s3" (object metadata)
+        s3_prefix: S3 prefix of the raw extract (used if storage_type="s3")
+        source: (download URL, filename) pair (default: get_osm_source())
+        raw_dir: Local directory of the extract (used if storage_type="local")
+    
+    Returns:
+        State dict, or None if no extract or no recorded state exists
+    """
+    _, osm_filename = source or get_osm_source()
+    
+    if storage_type == "s3":
+        info = get_storage().get_file_info(f"{s3_prefix}/{osm_filename}")
+        if not info:
+            return None
+        metadata = info.get("metadata", {})
+        state = {field: metadata.get(key) for field, key in SOURCE_METADATA_KEYS.items()}
+    else:
+        osm_file = Path(raw_dir) / osm_filename
+        state_file = source_state_path(osm_file)
+        if not osm_file.exists() or not state_file.exists():
+            return None
+        state = json.loads(state_file.read_text())
+    
+    if not (state.get("etag") or state.get("last_modified")):
+        return None
+    return state
+
+
+def check_source_unchanged(
+    storage_type="local",
+    s3_prefix="osrm/raw",
+    source: Optional[Tuple[str, str]] = None,
+    raw_dir="data/raw"
+) -> Optional[dict]:
+    """
+    Ask the upstream server whether the stored extract is still current.
+    
+    Sends a conditional HEAD with the recorded ETag/Last-Modified.
+    
+    Returns:
+        The recorded state if the server answers 304 Not Modified, else None
+    """
+    osm_url, _ = source or get_osm_source()
+    state = read_source_state(storage_type, s3_prefix, source, raw_dir)
+    if state is None or state.get("url") != osm_url:
+        return None
+    
+    try:
+        if conditional_probe(osm_url, state.get("etag"), state.get("last_modified")) is None:
+            logger.info(f"Upstream extract not modified since {state.get('last_modified') or state.get('etag')}")
+            return state
+    except (HTTPError, URLError) as e:
+        logger.warning(f"Conditional request failed, downloading anyway: {e}")
+    return None
+
+
+def download_osm(
+    storage_type="local",
+    s3_prefix="osrm/raw",
+    stream=False,
+    segments=None,
+    conditional=False,
+    source: Optional[Tuple[str, str]] = None,
+    raw_dir="data/raw"
+):
     """
     Download OSM data with option to store locally or in S3.
     
     Args:
         storage_type: "local" or "s3" 
         s3_prefix: S3 prefix for uploaded files (used if storage_type="s3")
+        stream: Pipe the HTTP response straight into an S3 multipart upload
+            without a local copy (used if storage_type="s3")
+        segments: Concurrent range requests for the download
+            (default: OSM_DOWNLOAD_SEGMENTS or 4, 1 for a single stream)
+        conditional: Skip the download when the upstream ETag/Last-Modified
+            match the stored extract
+        source: (download URL, filename) pair (default: OSM_DOWNLOAD_URL/OSM_FILENAME)
+        raw_dir: Local download directory (used if storage_type="local")
     
     Returns:
         True if successful, False otherwise
     """
     
-    # Load environment variables
-    load_dotenv()
-    
     # Configuration from environment
-    osm_url = os.getenv("OSM_DOWNLOAD_URL", "http://download.geofabrik.de/north-america/us/california-latest.osm.pbf")
-    osm_filename = os.getenv("OSM_FILENAME", "california-latest.osm.pbf")
+    osm_url, osm_filename = source or get_osm_source()
+    segments = segments or int(os.getenv("OSM_DOWNLOAD_SEGMENTS", "4"))
+    
+    if conditional and check_source_unchanged(storage_type, s3_prefix, source, raw_dir):
+        logger.success(f"{osm_filename} is up to date, skipping download")
+        return True
+    
+    if storage_type == "s3" and stream:
+        return stream_osm_to_s3(osm_url, f"{s3_prefix}/{osm_filename}")
     
     # Determine download location
     if storage_type == "s3":
-        # Use temp directory for S3 uploads
-        temp_dir = tempfile.mkdtemp(prefix="osm_download_")
-        data_dir = Path(temp_dir)
+        # Use a stable temp directory for S3 uploads so interrupted downloads resume
+        data_dir = Path(tempfile.gettempdir()) / f"osm_download_{osm_filename}"
+        data_dir.mkdir(parents=True, exist_ok=True)
         logger.info(f"Using temporary directory for S3 upload: {data_dir}")
     else:
         # Use local data directory
-        data_dir = Path("data/raw")
+        data_dir = Path(raw_dir)
         data_dir.mkdir(parents=True, exist_ok=True)
         logger.info(f"Using local directory: {data_dir}")
     
@@ -51,11 +168,15 @@ def download_osm(storage_type="local", s3_prefix="osrm/raw"):
     logger.info(f"Temporary target: {output_file}")
     
     try:
-        urlretrieve(osm_url, output_file)
-    except URLError as e:
+        upstream = probe_url(osm_url)
+    except (HTTPError, URLError) as e:
         logger.error(f"Download failed: {e}")
         return False
     
+    download = segmented_download(osm_url, str(output_file), segments=segments, info=upstream)
+    if not download:
+        return False
+    
     # Verify download
     if not output_file.exists():
         logger.error("File not found after download")
@@ -64,19 +185,23 @@ def download_osm(storage_type="local", s3_prefix="osrm/raw"):
     size_mb = output_file.stat().st_size / (1024 * 1024)
     logger.success(f"Downloaded {size_mb:.2f} MB")
     
+    state = {
+        "url": osm_url,
+        "etag": upstream["etag"],
+        "last_modified": upstream["last_modified"],
+        # Hashed during verification when upstream publishes a .md5
+        "md5": download.md5 or file_md5(output_file),
+    }
+    
     # Handle storage
     if storage_type == "s3":
         logger.info("Uploading to S3")
         try:
-            storage = S3Storage()
+            storage = get_storage()
             s3_key = f"{s3_prefix}/{osm_filename}"
             
-            # Check if file already exists
-            if storage.file_exists(s3_key):
-                logger.info(f"File already exists in S3: {s3_key}, will overwrite")
-            
-            # Upload to S3
-            success = storage.upload_file(str(output_file), s3_key)
+            # Upload to S3 (overwrites any existing object)
+            success = storage.upload_file(str(output_file), s3_key, metadata=source_metadata(state))
             
             # Clean up temp file
             output_file.unlink()
@@ -84,14 +209,7 @@ def download_osm(storage_type="local", s3_prefix="osrm/raw"):
                 output_file.parent.rmdir()
             
             if success:
-                logger.success(f"Uploaded to S3: {s3_key}")
-                
-                # List files in the prefix to confirm
-                files = storage.list_files(s3_prefix)
-                logger.info(f"Files in s3://{storage.bucket}/{s3_prefix}:")
-                for file in files:
-                    if file.startswith(s3_prefix):
-                        logger.info(f"  - {file}")
+                logger.success(f"Uploaded to S3: s3://{storage.bucket}/{s3_key}")
             
             return success
             
@@ -102,10 +220,76 @@ def download_osm(storage_type="local", s3_prefix="osrm/raw"):
                 output_file.unlink()
             return False
     else:
+        source_state_path(output_file).write_text(json.dumps(state, indent=2))
         logger.success(f"File saved locally: {output_file}")
         return True
 
 
+def source_metadata(state: dict) -> dict:
+    """Convert a source state dict into S3 user metadata, dropping empty fields."""
+    return {key: state[field] for field, key in SOURCE_METADATA_KEYS.items() if state.get(field)}
+
+
+class HashingReader:
+    """File-like wrapper that computes the MD5 of everything read through it."""
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self.md5 = hashlib.md5()
+    
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+        self.md5.update(chunk)
+        return chunk
+
+
+def stream_osm_to_s3(osm_url, s3_key):
+    """
+    Stream an OSM extract from its URL directly into S3.
+    
+    The response body is read in multipart-sized chunks that are uploaded
+    while the next chunk downloads, so memory use stays constant and no
+    scratch space is needed for the file. The object metadata records the
+    upstream validators and the published MD5, which the streamed bytes
+    are checked against.
+    
+    Args:
+        osm_url: Source URL of the extract
+        s3_key: Destination S3 object key
+    
+    Returns:
+        True if successful, False otherwise
+    """
+    logger.info(f"Streaming: {osm_url}")
+    expected_md5 = fetch_published_md5(osm_url)
+    try:
+        storage = get_storage()
+        with urlopen(osm_url) as response:
+            state = {
+                "url": osm_url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "md5": expected_md5,
+            }
+            reader = HashingReader(response)
+            success = storage.upload_stream(reader, s3_key, metadata=source_metadata(state))
+    except URLError as e:
+        logger.error(f"Download failed: {e}")
+        return False
+    except Exception as e:
+        logger.error(f"Streaming upload failed: {e}")
+        return False
+    
+    if success and expected_md5 and reader.md5.hexdigest() != expected_md5:
+        logger.error(f"Checksum mismatch: expected {expected_md5}, got {reader.md5.hexdigest()}")
+        storage.delete_file(s3_key)
+        return False
+    
+    if success:
+        logger.success(f"Uploaded to S3: s3://{storage.bucket}/{s3_key}")
+    return success
+
+
 def download_california_osm():
     """Legacy wrapper for backward compatibility."""
     return download_osm()
@@ -125,6 +309,21 @@ def main():
         default="osrm/raw",
         help="S3 prefix for uploaded files (default: osrm/raw)"
     )
+    parser.add_argument(
+        "--segments",
+        type=int,
+        help="Concurrent range requests for the download (default: OSM_DOWNLOAD_SEGMENTS or 4)"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream the download straight into S3 without a temporary file (S3 storage only)"
+    )
+    parser.add_argument(
+        "--conditional",
+        action="store_true",
+        help="Skip the download if the upstream extract has not changed (ETag/Last-Modified)"
+    )
     
     args = parser.parse_args()
     
@@ -133,7 +332,13 @@ def main():
     if args.storage == "s3":
         logger.info(f"S3 prefix: {args.s3_prefix}")
     
-    if not download_osm(storage_type=args.storage, s3_prefix=args.s3_prefix):
+    if not download_osm(
+        storage_type=args.storage,
+        s3_prefix=args.s3_prefix,
+        stream=args.stream,
+        segments=args.segments,
+        conditional=args.conditional
+    ):
         sys.exit(1)
 
 
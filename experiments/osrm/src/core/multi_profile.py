@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Build several routing profiles in parallel from a single OSM download."""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+from loguru import logger
+from src.core.download_osm import download_osm, get_osm_source
+from src.core.process import PIPELINE_STEPS, cleanup_docker, get_compose_file_for_step, run_docker_compose_step
+from src.core.transfer import download_from_s3, upload_to_s3
+from src.utils.budget import ResourceBudget
+from src.utils.staging import link_or_copy
+
+
+PROFILES = ["car", "foot", "bicycle"]
+PROFILES_DIR = Path("data/profiles")
+# Outside osrm/processed, so recursive restores of the default dataset skip it
+PROFILES_PREFIX = "osrm/profiles"
+
+
+def profile_env(profile: str) -> Dict[str, str]:
+    """
+    Environment isolating one profile's docker-compose runs.
+
+    Each profile gets its own data directory mounted at /data and its own
+    compose project, so the same services can run side by side.
+    """
+    return dict(
+        os.environ,
+        OSRM_PROFILE=profile,
+        OSRM_DATA_DIR=f"./{(PROFILES_DIR / profile).as_posix()}",
+        COMPOSE_PROJECT_NAME=f"osrm-{profile}",
+    )
+
+
+def stage_input(osm_file: Path, workdir: Path) -> Path:
+    """Hard-link the shared extract into a profile's raw directory (copy across filesystems)."""
+    target = workdir / "raw" / osm_file.name
+    link_or_copy(osm_file, target)
+    return target
+
+
+def build_profile(
+    profile: str,
+    osm_file: Path,
+    budget: ResourceBudget,
+    cpus: float,
+    memory_gb: float,
+    storage_mode: str = "local",
+    sync: bool = False,
+    timeout: int = 1800
+) -> bool:
+    """
+    Run extract, partition and customize for one profile in its own directory.
+
+    The profile holds its share of the CPU and memory budget for the whole
+    build. In S3 mode the result is published to osrm/profiles/<profile>.
+
+    Returns:
+        True if successful, False otherwise
+    """
+    workdir = PROFILES_DIR / profile
+    env = profile_env(profile)
+    # Run the OSRM tools with the CPUs this build reserved unless configured otherwise
+    env.setdefault("OSRM_THREADS", str(max(1, int(cpus))))
+    staged = stage_input(osm_file, workdir)
+
+    with budget.reserve(cpus, memory_gb, name=profile):
+        start = time.monotonic()
+        logger.info(f"[{profile}] Building in {workdir}")
+        try:
+            for step in PIPELINE_STEPS:
+                success = run_docker_compose_step(step, timeout=timeout, env=env)
+                cleanup_docker(get_compose_file_for_step(step), env=env)
+                if not success:
+                    logger.error(f"[{profile}] {step} failed")
+                    return False
+        finally:
+            staged.unlink(missing_ok=True)
+        logger.success(f"[{profile}] Built in {time.monotonic() - start:.1f}s")
+
+    if storage_mode == "s3":
+        s3_path = f"{PROFILES_PREFIX}/{profile}"
+        if not upload_to_s3(str(workdir / "processed"), s3_path, sync=sync):
+            logger.error(f"[{profile}] Failed to upload to {s3_path}")
+            return False
+    return True
+
+
+def build_profiles(
+    profiles: List[str],
+    storage_mode: str = "local",
+    sync: bool = False,
+    stream: bool = False,
+    conditional: bool = False,
+    timeout: int = 1800
+) -> bool:
+    """
+    Download the extract once and build every profile concurrently.
+
+    Builds are admitted against a shared budget (BUILD_CPU_BUDGET CPUs and
+    BUILD_MEMORY_BUDGET_GB, defaulting to this machine); each build reserves
+    PROFILE_BUILD_CPUS (default: an equal share) and PROFILE_BUILD_MEMORY_GB
+    (default: 12), so builds that do not fit wait for a running one to finish.
+
+    Returns:
+        True if every profile was built (and published), False otherwise
+    """
+    _, osm_filename = get_osm_source()
+    osm_file = Path("data/raw") / osm_filename
+
+    if not download_osm(storage_type=storage_mode, stream=stream, conditional=conditional):
+        logger.error("Failed to download OSM data")
+        return False
+    if storage_mode == "s3" and not download_from_s3("osrm/raw", "data/raw", osm_filename, sync=sync):
+        logger.error("Failed to download OSM data from S3")
+        return False
+
+    budget = ResourceBudget()
+    cpus = float(os.getenv("PROFILE_BUILD_CPUS") or budget.cpus / len(profiles))
+    memory_gb = float(os.getenv("PROFILE_BUILD_MEMORY_GB", "12"))
+    logger.info(
+        f"Building profiles {', '.join(profiles)} within {budget.cpus:g} CPUs / {budget.memory_gb:.0f} GiB "
+        f"({cpus:g} CPUs / {memory_gb:g} GiB each)"
+    )
+
+    with ThreadPoolExecutor(max_workers=len(profiles), thread_name_prefix="profile") as executor:
+        futures = {
+            profile: executor.submit(
+                build_profile, profile, osm_file, budget, cpus, memory_gb, storage_mode, sync, timeout
+            )
+            for profile in profiles
+        }
+        results = {profile: future.result() for profile, future in futures.items()}
+
+    for profile, success in results.items():
+        (logger.success if success else logger.error)(f"Profile {profile}: {'built' if success else 'FAILED'}")
+    return all(results.values())
+
+
+def parse_profiles(value: str) -> List[str]:
+    """Parse a comma-separated profile list for argparse."""
+    profiles = [profile.strip() for profile in value.split(",") if profile.strip()]
+    unknown = [profile for profile in profiles if profile not in PROFILES]
+    if unknown or not profiles:
+        raise argparse.ArgumentTypeError(f"Profiles must be a comma-separated subset of {','.join(PROFILES)}")
+    return list(dict.fromkeys(profiles))
+
+
+def main():
+    """Main entry point with CLI argument parsing."""
+    parser = argparse.ArgumentParser(description="Build several OSRM profiles from one OSM download")
+    parser.add_argument(
+        "--profiles",
+        type=parse_profiles,
+        default=PROFILES,
+        help="Comma-separated profiles to build (default: car,foot,bicycle)"
+    )
+    parser.add_argument(
+        "--storage",
+        choices=["local", "s3"],
+        default="local",
+        help="Storage mode: local or s3 (publish to osrm/profiles/<profile>) (default: local)"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=1800,
+        help="Timeout in seconds per Docker step (default: 1800)"
+    )
+
+    args = parser.parse_args()
+
+    if not build_profiles(args.profiles, storage_mode=args.storage, timeout=args.timeout):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,70 @@
 """Docker processing operations for OSRM pipeline steps."""
 
 import argparse
+import json
+import math
+import os
 import subprocess
 import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from functools import partial
 from pathlib import Path
+from typing import Dict, List, Optional
 from loguru import logger
+from src.core.download_osm import DEFAULT_OSM_FILENAME
+from src.utils.budget import affinity_cpus, available_cpus, cgroup_cpu_limit, format_cpuset
+from src.utils.container_stats import ContainerSampler, docker_stats
+from src.utils.metrics import record_stage
+from src.utils.osrm_log import OsrmLogParser, clean_line
+from src.utils.s3_utils import load_env_once
+from src.utils.staging import detach, link_or_copy, missing_artifacts, promote
+
+
+# Container output lines kept in memory for the result (the rest is only logged)
+TAIL_LINES = 50
+
+PIPELINE_STEPS = ["extract", "partition", "customize"]
+
+# Stage cache keys of the steps behind the current data/intermediate files
+STAGE_KEYS_FILE = ".stage_keys.json"
+
+# Suffixes after ".osrm" of the data/intermediate files each step (re)writes.
+# Whatever a step leaves behind that no later step rewrites is final.
+STEP_REWRITES = {
+    "partition": {
+        ".ebg", ".ebg_nodes", ".nbg_nodes", ".geometry", ".cnbg_to_ebg",
+        ".maneuver_overrides", ".fileIndex", ".ramIndex", ".partition", ".cells",
+    },
+    "customize": {".mldgr", ".cell_metrics"},
+}
+
+# Files osrm-customize also rewrites when it applies segment speed or turn penalty files
+TRAFFIC_REWRITES = {".geometry", ".datasource_names", ".turn_weight_penalties", ".turn_duration_penalties"}
+
+# Suffixes after ".osrm" each step must leave in data/intermediate
+REQUIRED_OUTPUTS = {
+    "extract": {".ebg", ".geometry", ".names", ".properties", ".fileIndex", ".ramIndex", ".timestamp"},
+    "partition": {".partition", ".cells"},
+    "customize": {".mldgr", ".cell_metrics"},
+}
+
+
+def stable_outputs(step: str, directory: str = "data/intermediate") -> List[Path]:
+    """
+    List the OSRM files in directory that no step after `step` rewrites.
+    
+    These already hold their final content once `step` has finished, so they
+    can be uploaded while the remaining steps run.
+    """
+    later = PIPELINE_STEPS[PIPELINE_STEPS.index(step) + 1:]
+    rewritten = set().union(*(STEP_REWRITES.get(name, set()) for name in later))
+    return sorted(
+        path for path in Path(directory).glob("*.osrm*")
+        if path.is_file() and path.name[path.name.index(".osrm") + len(".osrm"):] not in rewritten
+    )
 
 
 def get_compose_file_for_step(step: str) -> str:
@@ -13,20 +73,361 @@ def get_compose_file_for_step(step: str) -> str:
     step_files = {
         "extract": "docker-compose.extract.yml",
         "partition": "docker-compose.partition.yml", 
-        "customize": "docker-compose.customize.yml"
+        "customize": "docker-compose.customize.yml",
+        "update": "docker-compose.update.yml"
     }
     return step_files.get(step, f"docker-compose.{step}.yml")
 
 
-def run_docker_compose_step(step: str, timeout: int = 1800) -> bool:
-    """Run a specific OSRM processing step."""
+@dataclass
+class StepResult:
+    """
+    Outcome of one docker-compose service run.
+    
+    Truthy when the service succeeded, so callers can keep treating it as a bool.
+    """
+    service: str
+    success: bool = False
+    returncode: Optional[int] = None
+    duration: float = 0.0
+    phases: Dict[str, float] = field(default_factory=dict)
+    reported: Dict[str, float] = field(default_factory=dict)
+    progress: List[dict] = field(default_factory=list)
+    tail: List[str] = field(default_factory=list)
+    peak_memory_bytes: Optional[int] = None
+    cpu_seconds: Optional[float] = None
+    cached: bool = False
+    
+    def __bool__(self) -> bool:
+        return self.success
+
+
+@dataclass
+class CpuLimits:
+    """
+    Thread count and CPU confinement of one OSRM tool run.
+    
+    The compose files pass OSRM_THREADS to --threads (default: every CPU the
+    container sees) and OSRM_CPUSET / OSRM_CPUS to the container's cpuset and
+    CPU quota (default: unrestricted).
+    """
+    threads: Optional[int] = None
+    cpuset: Optional[str] = None
+    cpus: Optional[float] = None
+    
+    def apply(self, env: Dict[str, str]) -> Dict[str, str]:
+        """Return a copy of env carrying these limits for docker-compose."""
+        env = dict(env)
+        for name, value in [("OSRM_THREADS", self.threads), ("OSRM_CPUSET", self.cpuset), ("OSRM_CPUS", self.cpus)]:
+            if value is None:
+                env.pop(name, None)
+            else:
+                env[name] = f"{value:g}" if isinstance(value, float) else str(value)
+        return env
+    
+    def describe(self) -> str:
+        parts = [f"{self.threads} threads" if self.threads else "all threads"]
+        if self.cpuset:
+            parts.append(f"cpuset {self.cpuset}")
+        if self.cpus:
+            parts.append(f"{self.cpus:g} CPUs quota")
+        return ", ".join(parts)
+
+
+def auto_cpu_limits() -> CpuLimits:
+    """
+    Size a step to the CPUs this process is allowed to use.
+    
+    The thread count follows the cgroup quota and cpuset (a 2.5 CPU k8s limit
+    gives 2 threads), and the container inherits the same quota and, when
+    restricted, the same cpuset.
+    """
+    allowed = affinity_cpus()
+    restricted = len(allowed) < (os.cpu_count() or len(allowed))
+    return CpuLimits(
+        threads=max(1, math.floor(available_cpus())),
+        cpuset=format_cpuset(allowed) if restricted else None,
+        cpus=cgroup_cpu_limit(),
+    )
+
+
+def resolve_cpu_limits(step: str, env: Optional[Dict[str, str]] = None) -> CpuLimits:
+    """
+    Read a step's CPU limits from the environment.
+    
+    OSRM_<STEP>_THREADS overrides OSRM_THREADS for one step; either may be
+    "auto" to size the step from the cgroup CPU limit. OSRM_CPUSET and
+    OSRM_CPUS set an explicit cpuset and CPU quota, which take precedence
+    over the automatic ones. An invalid thread count is logged and sized
+    automatically, and an invalid OSRM_CPUS is logged and ignored.
+    """
+    variables = env or os.environ
+    name = f"OSRM_{step.upper()}_THREADS" if variables.get(f"OSRM_{step.upper()}_THREADS") else "OSRM_THREADS"
+    threads = variables.get(name) or None
+    cpuset = variables.get("OSRM_CPUSET") or None
+    cpus = None
+    if threads is not None:
+        try:
+            parse_threads(threads)
+        except argparse.ArgumentTypeError as e:
+            logger.error(f"Invalid {name}={threads!r}: {e}; sizing {step} from the CPU limit instead")
+            threads = "auto"
+    if variables.get("OSRM_CPUS"):
+        try:
+            cpus = float(variables["OSRM_CPUS"])
+        except ValueError:
+            logger.error(f"Invalid OSRM_CPUS={variables['OSRM_CPUS']!r}: expected a CPU count, ignoring it")
+    
+    if threads == "auto":
+        auto = auto_cpu_limits()
+        return CpuLimits(threads=auto.threads, cpuset=cpuset or auto.cpuset, cpus=cpus or auto.cpus)
+    return CpuLimits(threads=int(threads) if threads else None, cpuset=cpuset, cpus=cpus)
+
+
+def parse_threads(value: str) -> str:
+    """Parse a --threads value for argparse: a positive count or "auto"."""
+    if value == "auto" or (value.isdigit() and int(value) > 0):
+        return value
+    raise argparse.ArgumentTypeError("threads must be a positive integer or 'auto'")
+
+
+def add_cpu_arguments(parser: argparse.ArgumentParser):
+    """Add the --threads/--cpuset/--cpus options shared by the CLIs."""
+    parser.add_argument(
+        "--threads",
+        type=parse_threads,
+        help="Threads for osrm-extract/partition/customize, or 'auto' to size from the cgroup CPU limit (default: all CPUs)"
+    )
+    parser.add_argument(
+        "--cpuset",
+        help="Pin the OSRM containers to these CPUs, e.g. 0-3 or 0,2,4"
+    )
+    parser.add_argument(
+        "--cpus",
+        type=float,
+        help="CPU quota of the OSRM containers, e.g. 2.5"
+    )
+
+
+def apply_cpu_arguments(args: argparse.Namespace):
+    """Export --threads/--cpuset/--cpus as OSRM_THREADS/OSRM_CPUSET/OSRM_CPUS."""
+    for name, value in [("OSRM_THREADS", args.threads), ("OSRM_CPUSET", args.cpuset), ("OSRM_CPUS", args.cpus)]:
+        if value is not None:
+            os.environ[name] = f"{value:g}" if isinstance(value, float) else str(value)
+
+
+@dataclass
+class StepPaths:
+    """Where a step's inputs and outputs live for one data directory."""
+    data_dir: Path
+    osm_filename: str
+    region: str
+    customize_args: str = ""
+    
+    @classmethod
+    def from_env(cls, env: Dict[str, str]) -> "StepPaths":
+        osm_filename = env.get("OSM_FILENAME", DEFAULT_OSM_FILENAME)
+        return cls(
+            data_dir=Path(env.get("OSRM_DATA_DIR", "data")),
+            osm_filename=osm_filename,
+            region=env.get("OSRM_REGION") or osm_filename.removesuffix(".osm.pbf"),
+            customize_args=env.get("OSRM_CUSTOMIZE_ARGS", ""),
+        )
+    
+    def customize_inputs(self) -> List[Path]:
+        """Local paths of the /data files named in OSRM_CUSTOMIZE_ARGS (speed and penalty CSVs)."""
+        return [
+            self.data_dir / token[len("/data/"):]
+            for token in self.customize_args.split()
+            if token.startswith("/data/")
+        ]
+    
+    @property
+    def intermediate(self) -> Path:
+        return self.data_dir / "intermediate"
+    
+    @property
+    def processed(self) -> Path:
+        return self.data_dir / "processed"
+    
+    @property
+    def stage_keys(self) -> Path:
+        return self.intermediate / STAGE_KEYS_FILE
+    
+    @property
+    def staged_input(self) -> Path:
+        return self.intermediate / self.osm_filename
+    
+    def suffix(self, path: Path) -> str:
+        """Suffix after ".osrm" of one of the region's dataset files."""
+        return path.name[len(f"{self.region}.osrm"):]
+    
+    def outputs(self) -> List[Path]:
+        return sorted(path for path in self.intermediate.glob(f"{self.region}.osrm*") if path.is_file())
+
+
+def forget_stage_keys(step: str, paths: StepPaths):
+    """
+    Drop the stage cache keys of a step and every later one.
+    
+    Called before the step touches data/intermediate, so a run outside the
+    stage cache never leaves a key describing outputs it replaced; later
+    steps then miss the cache instead of chaining off a stale parent.
+    """
+    if not paths.stage_keys.exists():
+        return
+    stale = set(PIPELINE_STEPS[PIPELINE_STEPS.index(step):])
+    keys = json.loads(paths.stage_keys.read_text())
+    paths.stage_keys.write_text(json.dumps({name: key for name, key in keys.items() if name not in stale}, indent=2))
+
+
+def stage_inputs(step: str, paths: StepPaths) -> bool:
+    """
+    Prepare data/intermediate for a step without copying data.
+    
+    Extract gets the raw PBF hard-linked in as its input. Files the step will
+    rewrite lose their links to promoted copies first, so data/processed is
+    never modified behind its back.
+    
+    Returns:
+        True if the step's inputs are in place
+    """
+    paths.intermediate.mkdir(parents=True, exist_ok=True)
+    if step == "extract":
+        raw = paths.data_dir / "raw" / paths.osm_filename
+        if not raw.exists():
+            logger.error(f"Input not found: {raw}")
+            return False
+        # Extract writes every output afresh, so linked names are simply dropped
+        for path in paths.outputs():
+            if path.stat().st_nlink > 1:
+                path.unlink()
+        logger.info(f"Staging {raw} as {paths.staged_input} ({link_or_copy(raw, paths.staged_input)})")
+    else:
+        rewrites = STEP_REWRITES.get(step, set())
+        if step == "customize" and paths.customize_args:
+            rewrites = rewrites | TRAFFIC_REWRITES
+        rewritten = [path for path in paths.outputs() if paths.suffix(path) in rewrites]
+        detached = [path.name for path in rewritten if detach(path)]
+        if detached:
+            logger.info(f"Detached {len(detached)} linked files before {step} rewrites them")
+    return True
+
+
+def finish_outputs(step: str, paths: StepPaths) -> bool:
+    """
+    Check a step's outputs and, after customize, promote them to data/processed.
+    
+    Promotion hard-links every dataset file instead of copying it (copying only
+    across filesystems) and verifies that all of them arrived.
+    
+    Returns:
+        True if every expected artifact is present
+    """
+    expected = [f"{paths.region}.osrm{suffix}" for suffix in sorted(REQUIRED_OUTPUTS.get(step, set()))]
+    missing = missing_artifacts(paths.intermediate, expected)
+    if missing:
+        logger.error(f"{step} did not produce {', '.join(missing)}")
+        return False
+    
+    if step == "customize":
+        return promote(paths.outputs(), paths.processed)
+    return True
+
+
+def run_docker_compose_step(
+    step: str,
+    timeout: int = 1800,
+    env: Optional[Dict[str, str]] = None,
+    limits: Optional[CpuLimits] = None
+) -> StepResult:
+    """
+    Run a specific OSRM processing step.
+    
+    Inputs are staged and outputs checked (and, after customize, promoted to
+    data/processed) by stage_inputs/finish_outputs; a missing artifact fails
+    the step.
+    
+    Args:
+        step: Pipeline step name
+        timeout: Timeout in seconds
+        env: Environment for docker-compose (default: this process's environment),
+            e.g. to run a step for another profile or data directory
+        limits: Thread count, cpuset and CPU quota (default: resolve_cpu_limits)
+    """
+    load_env_once()
     compose_file = get_compose_file_for_step(step)
     service = f"osrm-{step}"
-    return run_docker_compose(compose_file, service, timeout)
+    variables = env or os.environ
+    limits = limits or resolve_cpu_limits(step, variables)
+    paths = StepPaths.from_env(variables)
+    staged = step in PIPELINE_STEPS
+    
+    if staged:
+        forget_stage_keys(step, paths)
+        if not stage_inputs(step, paths):
+            return StepResult(service=service)
+    logger.info(f"{service}: {limits.describe()}")
+    try:
+        result = run_docker_compose(compose_file, service, timeout, env=limits.apply(variables))
+    finally:
+        if step == "extract":
+            paths.staged_input.unlink(missing_ok=True)
+    if result and staged and not finish_outputs(step, paths):
+        result.success = False
+    record_stage(step, result, profile=variables.get("OSRM_PROFILE", "car"), region=variables.get("OSRM_REGION", ""))
+    return result
+
 
+def log_container_line(line: str):
+    """Log one container output line at the level OSRM tagged it with."""
+    level, message = clean_line(line)
+    if not message:
+        return
+    if level in ("error", "fatal"):
+        logger.error(f"  {message}")
+    elif level in ("warn", "warning"):
+        logger.warning(f"  {message}")
+    else:
+        logger.info(f"  {message}")
 
-def run_docker_compose(compose_file: str, service: str, timeout: int = 1800) -> bool:
-    """Run a specific service from docker-compose file."""
+
+def log_phase_summary(result: StepResult):
+    """Log where the time of a finished service went."""
+    if result.phases:
+        logger.info(f"Phase timings for '{result.service}' ({result.duration:.1f}s total):")
+        for phase, seconds in result.phases.items():
+            logger.info(f"  {phase:<20} {seconds:8.1f}s")
+    if result.peak_memory_bytes is not None:
+        logger.info(
+            f"Container resources: peak memory {result.peak_memory_bytes / 1024 ** 3:.2f} GiB, "
+            f"CPU {result.cpu_seconds or 0.0:.1f}s"
+        )
+    if result.reported:
+        logger.info("Durations reported by OSRM:")
+        for phase, seconds in result.reported.items():
+            logger.info(f"  {phase:<40} {seconds:8.1f}s")
+
+
+def run_docker_compose(
+    compose_file: str,
+    service: str,
+    timeout: int = 1800,
+    env: Optional[Dict[str, str]] = None
+) -> StepResult:
+    """
+    Run a specific service from docker-compose file, streaming its output.
+    
+    Output is logged line by line as the container produces it and parsed for
+    OSRM phase markers, reported durations and progress percentages; only the
+    last TAIL_LINES lines are kept in memory.
+    
+    Returns:
+        StepResult (truthy on success) with per-phase timings
+    """
+    result = StepResult(service=service)
+    parser = OsrmLogParser()
+    tail = deque(maxlen=TAIL_LINES)
     try:
         cmd = [
             "docker-compose",
@@ -37,52 +438,82 @@ def run_docker_compose(compose_file: str, service: str, timeout: int = 1800) ->
         logger.info(f"Running: {' '.join(cmd)}")
         logger.info(f"Timeout: {timeout} seconds")
         
-        # Run the command with timeout
-        result = subprocess.run(
+        process = subprocess.Popen(
             cmd,
-            timeout=timeout,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
-            cwd=Path.cwd()
+            bufsize=1,
+            cwd=Path.cwd(),
+            env=env
         )
         
-        # Log output
-        if result.stdout:
-            logger.info("Docker output:")
-            for line in result.stdout.splitlines()[-20:]:  # Last 20 lines
-                logger.info(f"  {line}")
+        interval = float(os.getenv("CONTAINER_SAMPLE_INTERVAL", "2"))
+        sampler = None
+        if interval > 0:
+            sampler = ContainerSampler(compose_file, service, interval, stats=partial(docker_stats, env=env)).start()
+        
+        # Kill the run from a timer so reading the pipe never blocks past the deadline
+        timed_out = threading.Event()
+        
+        def expire():
+            timed_out.set()
+            process.kill()
+        
+        timer = threading.Timer(timeout, expire)
+        timer.daemon = True
+        timer.start()
+        try:
+            for line in process.stdout:
+                tail.append(line.rstrip("\n"))
+                log_container_line(line)
+                for event in parser.feed(line):
+                    if event["type"] == "phase":
+                        logger.info(f"[{service}] phase: {event['phase']} (at {event['elapsed']:.1f}s)")
+            result.returncode = process.wait()
+        finally:
+            timer.cancel()
+            process.stdout.close()
+            if sampler is not None:
+                sampler.stop()
+                result.peak_memory_bytes = sampler.peak_memory_bytes
+                result.cpu_seconds = sampler.cpu_seconds
+        
+        result.duration = time.monotonic() - parser.started
+        result.phases = parser.finish()
+        result.reported = parser.reported
+        result.progress = parser.progress
+        result.tail = list(tail)
+        
+        if timed_out.is_set():
+            logger.error(f"Docker operation timed out after {timeout} seconds")
+            return result
         
-        if result.stderr:
-            logger.warning("Docker errors:")
-            for line in result.stderr.splitlines()[-10:]:  # Last 10 error lines
-                logger.warning(f"  {line}")
+        log_phase_summary(result)
         
         # Check result
         if result.returncode == 0:
-            logger.success(f"Docker service '{service}' completed successfully")
-            return True
+            result.success = True
+            logger.success(f"Docker service '{service}' completed successfully in {result.duration:.1f}s")
         else:
             logger.error(f"Docker service '{service}' failed with exit code {result.returncode}")
-            return False
+        return result
             
-    except subprocess.TimeoutExpired:
-        logger.error(f"Docker operation timed out after {timeout} seconds")
-        return False
     except FileNotFoundError:
         logger.error("docker-compose command not found. Please install Docker Compose.")
-        return False
+        return result
     except Exception as e:
         logger.error(f"Docker operation failed: {e}")
-        return False
+        return result
 
 
-def cleanup_docker(compose_file: str) -> bool:
+def cleanup_docker(compose_file: str, env: Optional[Dict[str, str]] = None) -> bool:
     """Clean up docker-compose containers and networks."""
     try:
         cmd = ["docker-compose", "-f", compose_file, "down"]
         logger.info(f"Cleaning up: {' '.join(cmd)}")
         
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        result = subprocess.run(cmd, capture_output=True, text=True, env=env)
         
         if result.returncode == 0:
             logger.info("Docker cleanup completed")
@@ -123,8 +554,10 @@ def main():
         action="store_true",
         help="Skip Docker cleanup after processing"
     )
+    add_cpu_arguments(parser)
     
     args = parser.parse_args()
+    apply_cpu_arguments(args)
     
     logger.info("OSRM Processing Step")
     logger.info(f"Step: {args.step}")
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""Hot-swap a new dataset into a shared-memory osrm-routed without downtime."""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+from urllib.error import HTTPError, URLError
+from urllib.request import urlopen
+from loguru import logger
+from src.core.process import (
+    REQUIRED_OUTPUTS, StepPaths, cleanup_docker, get_compose_file_for_step, log_container_line, run_docker_compose_step
+)
+from src.core.transfer import download_from_s3
+from src.utils.metrics import record_stage_duration
+from src.utils.s3_utils import load_env_once
+from src.utils.staging import link_or_copy, missing_artifacts
+
+
+DEFAULT_SERVER_URL = "http://localhost:5000"
+# San Francisco to Oakland, a route every California build can answer
+DEFAULT_HEALTH_COORDINATES = "-122.4194,37.7749;-122.2712,37.8044"
+CURRENT = "current"
+
+
+def releases_dir() -> Path:
+    return Path(os.getenv("OSRM_RELEASES_DIR", "data/releases"))
+
+
+def health_check(server_url: str, coordinates: str, timeout: float = 10) -> bool:
+    """
+    Ask osrm-routed for a route and check that it answers with one.
+
+    Returns:
+        True if the server returned HTTP 200 with code "Ok"
+    """
+    url = f"{server_url.rstrip('/')}/route/v1/driving/{coordinates}?overview=false"
+    try:
+        with urlopen(url, timeout=timeout) as response:
+            body = json.loads(response.read())
+    except (HTTPError, URLError, OSError, ValueError) as e:
+        logger.warning(f"Health check {url} failed: {e}")
+        return False
+    if body.get("code") != "Ok":
+        logger.warning(f"Health check {url} returned {body.get('code')}: {body.get('message')}")
+        return False
+    return True
+
+
+def wait_healthy(server_url: str, coordinates: str, attempts: int = 1, delay: float = 3) -> bool:
+    """Run health checks until one passes or attempts run out."""
+    for attempt in range(attempts):
+        if attempt:
+            time.sleep(delay)
+        if health_check(server_url, coordinates):
+            return True
+    return False
+
+
+def list_releases() -> List[str]:
+    """Release versions on disk, oldest first."""
+    root = releases_dir()
+    if not root.exists():
+        return []
+    return sorted(path.name for path in root.iterdir() if path.is_dir() and not path.is_symlink() and path.name != CURRENT)
+
+
+def current_release() -> Optional[str]:
+    link = releases_dir() / CURRENT
+    return os.readlink(link) if link.is_symlink() else None
+
+
+def set_current(version: str):
+    """Point releases/current at a version (atomically, via rename)."""
+    link = releases_dir() / CURRENT
+    temp = link.with_name(f".{CURRENT}.{os.getpid()}")
+    temp.unlink(missing_ok=True)
+    temp.symlink_to(version)
+    os.replace(temp, link)
+
+
+def stage_release(source_dir: Path, region: str) -> Optional[str]:
+    """
+    Hard-link a dataset into a new versioned release directory.
+
+    The serving dataset is never touched, so a failed swap can fall back to it.
+
+    Returns:
+        Release version, or None if the dataset is incomplete
+    """
+    files = sorted(path for path in source_dir.glob(f"{region}.osrm*") if path.is_file())
+    expected = [f"{region}.osrm{suffix}" for step in REQUIRED_OUTPUTS.values() for suffix in sorted(step)]
+    missing = missing_artifacts(source_dir, expected)
+    if missing:
+        logger.error(f"Dataset in {source_dir} is incomplete, missing {', '.join(missing)}")
+        return None
+
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    while (releases_dir() / version).exists():
+        version += "-1"
+    target = releases_dir() / version
+    for path in files:
+        link_or_copy(path, target / path.name)
+    logger.info(f"Staged release {version} ({len(files)} files) from {source_dir}")
+    return version
+
+
+def prune_releases(keep: int):
+    """Delete old releases, always keeping the current one and the one before it."""
+    releases = list_releases()
+    current = current_release()
+    protected = set(releases[-max(keep, 2):]) | {current}
+    for version in releases:
+        if version not in protected:
+            for path in (releases_dir() / version).iterdir():
+                path.unlink()
+            (releases_dir() / version).rmdir()
+            logger.info(f"Removed old release {version}")
+
+
+def load_datastore(version: str, region: str, timeout: int = 1800) -> bool:
+    """
+    Load a release into shared memory with osrm-datastore.
+
+    osrm-routed in --shared-memory mode switches to the new region as soon as
+    the load completes; osrm-datastore then frees the old region once its
+    in-flight requests finish (OSRM_DATASTORE_MAX_WAIT seconds at most).
+
+    By default the loader runs from docker-compose.datastore.yml on this host.
+    With PUBLISH_K8S_TARGET (e.g. deploy/osrm-server) it runs inside the
+    serving pod through kubectl exec, where the releases directory is mounted
+    at /data.
+    """
+    dataset_name = os.getenv("OSRM_DATASET_NAME", "")
+    max_wait = os.getenv("OSRM_DATASTORE_MAX_WAIT", "60")
+    target = os.getenv("PUBLISH_K8S_TARGET")
+
+    if not target:
+        env = dict(os.environ, OSRM_RELEASES_DIR=f"./{releases_dir().as_posix()}", OSRM_RELEASE=version, OSRM_REGION=region)
+        success = run_docker_compose_step("datastore", timeout=timeout, env=env)
+        cleanup_docker(get_compose_file_for_step("datastore"), env=env)
+        return bool(success)
+
+    cmd = [
+        "kubectl", "exec",
+        "-n", os.getenv("PUBLISH_K8S_NAMESPACE", "experiments"),
+        target,
+        "-c", os.getenv("PUBLISH_K8S_CONTAINER", "osrm-server"),
+        "--",
+        "osrm-datastore", f"--dataset-name={dataset_name}", "--max-wait", max_wait,
+        f"/data/{version}/{region}.osrm",
+    ]
+    logger.info(f"Running: {' '.join(cmd)}")
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.error(f"osrm-datastore failed: {e}")
+        return False
+    for line in (result.stdout + result.stderr).splitlines():
+        log_container_line(line)
+    if result.returncode != 0:
+        logger.error(f"osrm-datastore exited with {result.returncode}")
+        return False
+    return True
+
+
+def publish(
+    source_dir: str = "data/processed",
+    storage_mode: str = "local",
+    s3_path: str = "osrm/processed",
+    sync: bool = False,
+    bundle: bool = False,
+    force: bool = False,
+    timeout: int = 1800
+) -> bool:
+    """
+    Swap a new dataset into the running shared-memory server.
+
+    Checks that the server answers a route, stages the dataset as a new
+    release, loads it with osrm-datastore, and checks the server again. If
+    the server fails after the swap, the previous release is loaded back.
+
+    Args:
+        source_dir: Directory holding the new dataset
+        storage_mode: "s3" to download the dataset from s3_path first
+        s3_path: S3 prefix of the dataset (osrm/live for traffic updates)
+        sync: Only download files whose content changed since the last run
+        bundle: Restore the dataset from its compressed bundle
+        force: Publish even if the server fails its health check beforehand
+            (e.g. the first load)
+        timeout: Timeout in seconds for osrm-datastore
+
+    Returns:
+        True if the new dataset is serving and healthy, False otherwise
+    """
+    load_env_once()
+    start = time.monotonic()
+    server_url = os.getenv("OSRM_SERVER_URL", DEFAULT_SERVER_URL)
+    coordinates = os.getenv("OSRM_HEALTH_COORDINATES", DEFAULT_HEALTH_COORDINATES)
+    attempts = int(os.getenv("PUBLISH_HEALTH_ATTEMPTS", "10"))
+    region = StepPaths.from_env(os.environ).region
+
+    if storage_mode == "s3" and not download_from_s3(s3_path, source_dir, sync=sync, bundle=bundle):
+        logger.error(f"Failed to download the dataset from {s3_path}")
+        return False
+
+    if not wait_healthy(server_url, coordinates):
+        if not force:
+            logger.error(f"{server_url} is not healthy before the swap; not publishing (use --force for a first load)")
+            return False
+        logger.warning(f"{server_url} is not healthy before the swap, publishing anyway (--force)")
+
+    version = stage_release(Path(source_dir), region)
+    if version is None:
+        return False
+    previous = current_release()
+    if previous is None:
+        # First release: the serving pod's init container loads releases/current on start
+        set_current(version)
+
+    load_start = time.monotonic()
+    if not load_datastore(version, region, timeout):
+        logger.error(f"Loading release {version} failed; the server keeps serving {previous or 'its current data'}")
+        return False
+    record_stage_duration("datastore_load", time.monotonic() - load_start)
+
+    if not wait_healthy(server_url, coordinates, attempts):
+        logger.error(f"{server_url} is unhealthy after swapping to {version}")
+        if previous and load_datastore(previous, region, timeout):
+            logger.warning(f"Rolled back to release {previous}")
+        return False
+
+    set_current(version)
+    prune_releases(int(os.getenv("PUBLISH_KEEP_RELEASES", "2")))
+    record_stage_duration("publish", time.monotonic() - start)
+    logger.success(f"Release {version} is serving (previous: {previous or 'none'})")
+    return True
+
+
+def main():
+    """Main entry point with CLI argument parsing."""
+    parser = argparse.ArgumentParser(description="Hot-swap an OSRM dataset into shared memory")
+    parser.add_argument(
+        "--source-dir",
+        default="data/processed",
+        help="Directory holding the dataset to publish (default: data/processed)"
+    )
+    parser.add_argument(
+        "--storage",
+        choices=["local", "s3"],
+        default="local",
+        help="Storage mode: local, or s3 to download the dataset first (default: local)"
+    )
+    parser.add_argument(
+        "--dataset-prefix",
+        default="osrm/processed",
+        help="S3 prefix of the dataset (default: osrm/processed)"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Publish even if the server fails its health check before the swap"
+    )
+
+    args = parser.parse_args()
+
+    if not publish(args.source_dir, storage_mode=args.storage, s3_path=args.dataset_prefix, force=args.force):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""Build many regions concurrently from a declarative region list."""
+
+import argparse
+import json
+import os
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+from loguru import logger
+from src.core.download_osm import download_osm
+from src.core.process import PIPELINE_STEPS, cleanup_docker, get_compose_file_for_step, run_docker_compose_step
+from src.core.transfer import upload_to_s3
+from src.utils.budget import GB, ResourceBudget
+from src.utils.scheduler import DagScheduler, Task
+
+
+REGIONS_DIR = Path("data/regions")
+# Outside osrm/processed, so recursive restores of the default dataset skip it
+REGIONS_PREFIX = "osrm/regions"
+DEFAULT_REGIONS_FILE = "regions.json"
+
+# Rough peak memory of each OSRM step per GiB of input PBF (car profile, MLD)
+STAGE_MEMORY_FACTORS = {"extract": 8.0, "partition": 5.0, "customize": 3.0}
+MIN_STAGE_MEMORY_GB = 1.0
+# Transfers run in this process and only buffer a few parts
+TRANSFER_MEMORY_GB = 0.5
+# Headroom applied to a stage's measured peak from an earlier run
+MEASURED_PEAK_MARGIN = 1.2
+
+
+@dataclass
+class Region:
+    """
+    One entry of the region list.
+
+    memory_gb optionally pins the peak memory estimate of individual stages,
+    e.g. {"extract": 20}.
+    """
+    name: str
+    url: str
+    profile: str = "car"
+    memory_gb: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def filename(self) -> str:
+        return self.url.rsplit("/", 1)[-1]
+
+    @property
+    def osrm_name(self) -> str:
+        """Base name of the OSRM dataset (the compose files' OSRM_REGION)."""
+        return self.filename.removesuffix(".osm.pbf")
+
+    @property
+    def workdir(self) -> Path:
+        return REGIONS_DIR / self.name
+
+    @property
+    def osm_file(self) -> Path:
+        return self.workdir / "raw" / self.filename
+
+    def env(self) -> Dict[str, str]:
+        """Environment running the compose steps against this region's directory."""
+        return dict(
+            os.environ,
+            OSM_FILENAME=self.filename,
+            OSRM_REGION=self.osrm_name,
+            OSRM_PROFILE=self.profile,
+            OSRM_DATA_DIR=f"./{self.workdir.as_posix()}",
+            COMPOSE_PROJECT_NAME=f"osrm-{self.name}",
+        )
+
+
+def load_regions(path: Optional[str] = None, only: Optional[List[str]] = None) -> List[Region]:
+    """
+    Read the region list.
+
+    The file holds {"regions": [{"name": ..., "url": ..., "profile": ...,
+    "memory_gb": {...}}, ...]}.
+
+    Args:
+        path: Region list (default: REGIONS_FILE or regions.json)
+        only: Names of the regions to keep (default: all)
+    """
+    path = path or os.getenv("REGIONS_FILE", DEFAULT_REGIONS_FILE)
+    entries = json.loads(Path(path).read_text())["regions"]
+    regions = [Region(**entry) for entry in entries]
+    names = [region.name for region in regions]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate region names in {path}")
+    if only:
+        unknown = set(only) - set(names)
+        if unknown:
+            raise ValueError(f"Unknown regions: {', '.join(sorted(unknown))}")
+        regions = [region for region in regions if region.name in only]
+    return regions
+
+
+def measured_peaks_path(region: Region) -> Path:
+    return region.workdir / ".stage_memory.json"
+
+
+def read_measured_peaks(region: Region) -> Dict[str, float]:
+    """Peak memory (GiB) each stage reached the last time it ran for this region."""
+    path = measured_peaks_path(region)
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def record_measured_peak(region: Region, step: str, peak_bytes: Optional[int]):
+    if not peak_bytes:
+        return
+    peaks = read_measured_peaks(region)
+    peaks[step] = round(peak_bytes / GB, 3)
+    path = measured_peaks_path(region)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(peaks, indent=2))
+
+
+def estimate_memory_gb(region: Region, step: str) -> float:
+    """
+    Estimated peak memory of an OSRM step for a region.
+
+    A pinned value from the region list wins, then the peak measured the last
+    time the step ran (with headroom), then a multiple of the PBF size.
+    """
+    if step in region.memory_gb:
+        return float(region.memory_gb[step])
+    measured = read_measured_peaks(region).get(step)
+    if measured:
+        return max(measured * MEASURED_PEAK_MARGIN, MIN_STAGE_MEMORY_GB)
+    pbf_gb = region.osm_file.stat().st_size / GB
+    return max(pbf_gb * STAGE_MEMORY_FACTORS[step], MIN_STAGE_MEMORY_GB)
+
+
+def run_region_step(region: Region, step: str, timeout: int) -> bool:
+    """Run one OSRM step for a region and remember its measured peak memory."""
+    env = region.env()
+    result = run_docker_compose_step(step, timeout=timeout, env=env)
+    cleanup_docker(get_compose_file_for_step(step), env=env)
+    if result:
+        record_measured_peak(region, step, result.peak_memory_bytes)
+    return bool(result)
+
+
+def region_tasks(
+    region: Region,
+    storage_mode: str = "local",
+    sync: bool = False,
+    conditional: bool = False,
+    timeout: int = 1800
+) -> List[Task]:
+    """
+    Tasks for one region: download, extract, partition, customize and, in S3
+    mode, an upload of the processed dataset to osrm/regions/<region>.
+    """
+    def download() -> bool:
+        return download_osm(
+            storage_type="local",
+            conditional=conditional,
+            source=(region.url, region.filename),
+            raw_dir=str(region.osm_file.parent),
+        )
+
+    def step_task(step: str, previous: str) -> Task:
+        return Task(
+            name=f"{region.name}/{step}",
+            run=lambda: run_region_step(region, step, timeout),
+            deps=[f"{region.name}/{previous}"],
+            memory_gb=lambda: estimate_memory_gb(region, step),
+        )
+
+    tasks = [Task(name=f"{region.name}/download", run=download, memory_gb=TRANSFER_MEMORY_GB)]
+    previous = "download"
+    for step in PIPELINE_STEPS:
+        tasks.append(step_task(step, previous))
+        previous = step
+
+    if storage_mode == "s3":
+        s3_path = f"{REGIONS_PREFIX}/{region.name}"
+        tasks.append(Task(
+            name=f"{region.name}/upload",
+            run=lambda: upload_to_s3(str(region.workdir / "processed"), s3_path, sync=sync),
+            deps=[f"{region.name}/{previous}"],
+            memory_gb=TRANSFER_MEMORY_GB,
+        ))
+    return tasks
+
+
+def build_regions(
+    regions: List[Region],
+    storage_mode: str = "local",
+    sync: bool = False,
+    conditional: bool = False,
+    timeout: int = 1800,
+    budget: Optional[ResourceBudget] = None
+) -> bool:
+    """
+    Build every region through one DAG scheduler.
+
+    Stages of different regions run concurrently; each is admitted only when
+    its estimated peak memory fits the budget (BUILD_MEMORY_BUDGET_GB, by
+    default the container's memory limit). At most REGION_WORKERS (default 4)
+    stages run at once.
+
+    Returns:
+        True if every region was built (and published), False otherwise
+    """
+    budget = budget or ResourceBudget()
+    workers = int(os.getenv("REGION_WORKERS", "4"))
+    logger.info(
+        f"Building {len(regions)} regions ({', '.join(region.name for region in regions)}) "
+        f"within {budget.memory_gb:.0f} GiB, {workers} stages at a time"
+    )
+
+    tasks = [task for region in regions for task in region_tasks(region, storage_mode, sync, conditional, timeout)]
+    results = DagScheduler(budget, max_workers=workers).run(tasks)
+
+    success = True
+    for region in regions:
+        failed = [task for task, ok in results.items() if task.startswith(f"{region.name}/") and not ok]
+        if not failed:
+            logger.success(f"Region {region.name}: built")
+        else:
+            logger.error(f"Region {region.name}: FAILED ({', '.join(failed)})")
+            success = False
+    return success
+
+
+def main():
+    """Main entry point with CLI argument parsing."""
+    parser = argparse.ArgumentParser(description="Build OSRM datasets for many regions concurrently")
+    parser.add_argument(
+        "--regions-file",
+        help="Region list (default: REGIONS_FILE or regions.json)"
+    )
+    parser.add_argument(
+        "--only",
+        help="Comma-separated region names to build (default: all)"
+    )
+    parser.add_argument(
+        "--storage",
+        choices=["local", "s3"],
+        default="local",
+        help="Storage mode: local or s3 (publish to osrm/regions/<region>) (default: local)"
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="Only upload files whose content changed since the last S3 transfer"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=1800,
+        help="Timeout in seconds per Docker step (default: 1800)"
+    )
+
+    args = parser.parse_args()
+
+    only = args.only.split(",") if args.only else None
+    regions = load_regions(args.regions_file, only)
+    if not build_regions(regions, storage_mode=args.storage, sync=args.sync, timeout=args.timeout):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
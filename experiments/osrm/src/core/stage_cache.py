@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""Content-addressed S3 cache of OSRM pipeline step outputs."""
+
+import hashlib
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from loguru import logger
+from src.core.download_osm import get_osm_source
+from src.core.process import (
+    PIPELINE_STEPS, StepPaths, StepResult, get_compose_file_for_step, run_docker_compose_step
+)
+from src.utils.metrics import get_metrics, record_stage_duration
+from src.utils.s3_utils import get_storage, load_env_once
+from src.utils.staging import link_or_copy
+from src.utils.sync_index import file_md5
+
+
+# Compose variables that do not influence step outputs
+IGNORED_VARS = {"DOCKER_USER", "OSRM_THREADS", "OSRM_CPUSET", "OSRM_CPUS"}
+COMPOSE_VAR = re.compile(r"\$\{(\w+)")
+COMPOSE_IMAGE = re.compile(r"^\s*image:\s*[\"']?([^\s\"']+)", re.M)
+
+
+def image_id(image: str) -> Optional[str]:
+    """
+    Return the content-addressed ID of a Docker image, pulling it if missing.
+
+    A moving tag like :latest therefore yields a new cache key once it points
+    at a different image.
+    """
+    def inspect() -> Optional[str]:
+        result = subprocess.run(
+            ["docker", "image", "inspect", "--format", "{{.Id}}", image],
+            capture_output=True, text=True, timeout=60
+        )
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip() or None
+
+    try:
+        digest = inspect()
+        if digest is None:
+            logger.info(f"Pulling {image} to resolve its digest")
+            subprocess.run(["docker", "pull", image], capture_output=True, text=True, timeout=1800)
+            digest = inspect()
+        return digest
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Could not resolve image digest for {image}: {e}")
+        return None
+
+
+# MD5s by file identity, so hard-linked copies of step outputs are hashed once per run
+_md5_cache: Dict[Tuple[int, int, int, int], str] = {}
+_md5_lock = threading.Lock()
+
+
+def step_paths() -> StepPaths:
+    """Paths of the data directory the steps run against (OSRM_DATA_DIR, default: data)."""
+    return StepPaths.from_env(os.environ)
+
+
+def keys_file() -> Path:
+    return step_paths().stage_keys
+
+
+def file_identity(path: Path) -> Tuple[int, int, int, int]:
+    stat = path.stat()
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def cached_md5(path: Path) -> str:
+    """MD5 of a file, reusing the hash of any hard link to the same unchanged inode."""
+    identity = file_identity(path)
+    with _md5_lock:
+        md5 = _md5_cache.get(identity)
+    if md5 is None:
+        md5 = file_md5(path)
+        with _md5_lock:
+            _md5_cache[identity] = md5
+    return md5
+
+
+def read_keys() -> Dict[str, Optional[str]]:
+    """Return the cache keys of the steps behind the current intermediate files."""
+    path = keys_file()
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def write_key(step: str, key: Optional[str]):
+    """Record a finished step's key, forgetting the keys of every later step."""
+    keys = {} if step == PIPELINE_STEPS[0] else read_keys()
+    for later in PIPELINE_STEPS[PIPELINE_STEPS.index(step):]:
+        keys.pop(later, None)
+    keys[step] = key
+    path = keys_file()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(keys, indent=2))
+
+
+def step_key(step: str) -> Optional[str]:
+    """
+    Compute the cache key of a step from everything its outputs depend on.
+
+    Extract hashes the input PBF; later steps chain off the key of the step
+    before them instead of hashing multi-gigabyte intermediate files. The
+    image ID covers the osrm-backend binaries and the profile Lua scripts
+    bundled in /opt, and the compose file text plus the variables it
+    references cover the step arguments, along with the content of any
+    files named in OSRM_CUSTOMIZE_ARGS.
+
+    Returns:
+        Hex key, or None if the step cannot be cached
+    """
+    load_env_once()
+    compose_file = Path(get_compose_file_for_step(step))
+    if not compose_file.exists():
+        return None
+    compose_text = compose_file.read_text()
+
+    match = COMPOSE_IMAGE.search(compose_text)
+    digest = image_id(match.group(1)) if match else None
+    if digest is None:
+        logger.warning(f"No image digest for {step}, stage cache disabled for this step")
+        return None
+
+    if step == PIPELINE_STEPS[0]:
+        _, osm_filename = get_osm_source()
+        osm_file = step_paths().data_dir / "raw" / osm_filename
+        if not osm_file.exists():
+            return None
+        parent = file_md5(osm_file)
+    else:
+        parent = read_keys().get(PIPELINE_STEPS[PIPELINE_STEPS.index(step) - 1])
+        if parent is None:
+            return None
+
+    variables = sorted(set(COMPOSE_VAR.findall(compose_text)) - IGNORED_VARS)
+    # Speed and penalty files passed to customize count by content, not name
+    inputs = StepPaths.from_env(os.environ).customize_inputs() if step == "customize" else []
+    payload = {
+        "step": step,
+        "parent": parent,
+        "image": digest,
+        "compose": compose_text,
+        "env": {name: os.getenv(name, "") for name in variables},
+        "inputs": {str(path): file_md5(path) if path.exists() else None for path in inputs},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def snapshot() -> Dict[str, Tuple[int, int]]:
+    """Record (size, mtime) of every visible file in the cached directories."""
+    paths = step_paths()
+    state = {}
+    for directory in (paths.intermediate, paths.processed):
+        if directory.exists():
+            for path in directory.rglob("*"):
+                if path.is_file() and not path.name.startswith("."):
+                    stat = path.stat()
+                    state[str(path)] = (stat.st_size, stat.st_mtime_ns)
+    return state
+
+
+def changed_files(before: Dict[str, Tuple[int, int]]) -> List[Path]:
+    """Return the files created or modified since a snapshot."""
+    return sorted(Path(path) for path, state in snapshot().items() if before.get(path) != state)
+
+
+class StageCache:
+    """
+    Step outputs stored as content-addressed blobs plus one manifest per key.
+
+    Layout under the prefix:
+        blobs/<md5>                  file contents, shared across steps and runs
+        manifests/<step>/<key>.json  files the step wrote, written last
+    """
+
+    def __init__(self, storage=None, prefix: Optional[str] = None):
+        self.storage = storage or get_storage()
+        self.prefix = (prefix or os.getenv("STAGE_CACHE_PREFIX", "osrm/cache")).rstrip("/")
+
+    def manifest_key(self, step: str, key: str) -> str:
+        return f"{self.prefix}/manifests/{step}/{key}.json"
+
+    def blob_key(self, md5: str) -> str:
+        return f"{self.prefix}/blobs/{md5}"
+
+    def lookup(self, step: str, key: str) -> Optional[dict]:
+        """Return the manifest stored for a step key, if any."""
+        body = self.storage.read_object(self.manifest_key(step, key))
+        return json.loads(body) if body else None
+
+    def store(self, step: str, key: str, files: List[Path]) -> bool:
+        """
+        Upload the files a step produced and publish its manifest.
+
+        Files are hashed in the upload pool, and hard links to a file hashed
+        before (processed artifacts linked from intermediate ones) reuse its
+        hash. Blobs already in the cache are not uploaded again.
+
+        Returns:
+            True if the manifest was written
+        """
+        def upload(entry: dict) -> bool:
+            blob_key = self.blob_key(entry["md5"])
+            if self.storage.file_exists(blob_key):
+                return True
+            return self.storage.upload_file(entry["path"], blob_key)
+
+        distinct = list({file_identity(path): path for path in files}.values())
+        with ThreadPoolExecutor(max_workers=self.storage.upload_workers) as executor:
+            list(executor.map(cached_md5, distinct))
+            entries = [{"path": str(path), "size": path.stat().st_size, "md5": cached_md5(path)} for path in files]
+            unique = list({entry["md5"]: entry for entry in entries}.values())
+            if not all(executor.map(upload, unique)):
+                logger.warning(f"Stage cache upload for {step} incomplete, not publishing manifest")
+                return False
+
+        manifest = {"step": step, "key": key, "files": entries}
+        if not self.storage.write_object(self.manifest_key(step, key), json.dumps(manifest, indent=2).encode()):
+            return False
+        logger.success(f"Cached {len(entries)} {step} outputs under {key[:12]}")
+        return True
+
+    def restore(self, manifest: dict) -> bool:
+        """
+        Materialize a manifest's files locally.
+
+        Files whose local copy already has the same content are kept, and each
+        blob is downloaded once even if several paths share it.
+
+        Returns:
+            True if every file is in place
+        """
+        by_md5: Dict[str, List[dict]] = {}
+        for entry in manifest["files"]:
+            by_md5.setdefault(entry["md5"], []).append(entry)
+
+        def present(entry: dict) -> bool:
+            path = Path(entry["path"])
+            return path.exists() and path.stat().st_size == entry["size"] and cached_md5(path) == entry["md5"]
+
+        def restore_blob(md5: str) -> bool:
+            entries = by_md5[md5]
+            source = next((entry for entry in entries if present(entry)), None)
+            if source is None:
+                source = entries[0]
+                part = Path(source["path"] + ".part")
+                if not self.storage.download_file(self.blob_key(md5), str(part)):
+                    return False
+                os.replace(part, source["path"])
+            for entry in entries:
+                if entry is not source and not present(entry):
+                    link_or_copy(Path(source["path"]), Path(entry["path"]))
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.storage.download_workers) as executor:
+            return all(executor.map(restore_blob, list(by_md5)))
+
+
+def run_cached_step(step: str, timeout: int = 1800, cache: Optional[StageCache] = None) -> StepResult:
+    """
+    Run a pipeline step, or restore its outputs from the stage cache.
+
+    On a miss the step runs normally and the files it created or changed are
+    cached under its key for later runs.
+
+    Returns:
+        StepResult (truthy on success); cached is True when restored
+    """
+    key = step_key(step)
+    metrics = get_metrics()
+    if key is not None:
+        cache = cache or StageCache()
+        manifest = cache.lookup(step, key)
+        if manifest is not None:
+            logger.info(f"Stage cache hit for {step} ({key[:12]}), restoring {len(manifest['files'])} files")
+            start = time.monotonic()
+            if cache.restore(manifest):
+                write_key(step, key)
+                metrics.set("stage_cache_hit", 1, stage=step)
+                record_stage_duration(
+                    step, time.monotonic() - start,
+                    profile=os.getenv("OSRM_PROFILE", "car"), region=os.getenv("OSRM_REGION", "")
+                )
+                return StepResult(service=f"osrm-{step}", success=True, returncode=0, cached=True)
+            logger.warning(f"Restoring cached {step} outputs failed, running the step")
+        else:
+            logger.info(f"Stage cache miss for {step} ({key[:12]})")
+    metrics.set("stage_cache_hit", 0, stage=step)
+
+    before = snapshot()
+    result = run_docker_compose_step(step, timeout=timeout)
+    if result:
+        if key is not None:
+            cache.store(step, key, changed_files(before))
+        write_key(step, key)
+    return result
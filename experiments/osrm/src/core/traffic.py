@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""Customize-only traffic updates from segment speed and turn penalty files."""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+from loguru import logger
+from src.core.process import StepPaths, cleanup_docker, get_compose_file_for_step, run_docker_compose_step
+from src.core.transfer import download_from_s3, upload_to_s3
+from src.utils.metrics import record_stage_duration
+from src.utils.s3_utils import get_storage, load_env_once
+from src.utils.staging import link_or_copy
+from src.utils.sync_index import file_md5
+
+
+BASE_PREFIX = "osrm/processed"
+DEFAULT_PUBLISH_PREFIX = "osrm/live"
+DEFAULT_TRAFFIC_DIR = "data/live"
+
+# Written next to the updated dataset, describing the files it was customized with
+TRAFFIC_STAMP = "traffic.json"
+
+CUSTOMIZE_FLAGS = {"speeds": "--segment-speed-file", "turn_penalties": "--turn-penalty-file"}
+
+
+def traffic_env(data_dir: Path, args: str) -> Dict[str, str]:
+    """Environment running customize against the traffic working directory."""
+    return dict(os.environ, OSRM_DATA_DIR=f"./{data_dir.as_posix()}", OSRM_CUSTOMIZE_ARGS=args)
+
+
+def fetch_update_file(source: str, target_dir: Path) -> Optional[Path]:
+    """
+    Place one speed or penalty file in target_dir.
+
+    Args:
+        source: Local path, or s3://<bucket>/<key> in the configured bucket
+
+    Returns:
+        Local path of the file, or None if it could not be fetched
+    """
+    if source.startswith("s3://"):
+        bucket, _, key = source[len("s3://"):].partition("/")
+        storage = get_storage()
+        if bucket != storage.bucket:
+            logger.error(f"{source} is not in the configured bucket {storage.bucket}")
+            return None
+        target = target_dir / Path(key).name
+        return target if storage.download_file(key, str(target)) else None
+
+    path = Path(source)
+    if not path.is_file():
+        logger.error(f"Update file not found: {source}")
+        return None
+    target = target_dir / path.name
+    link_or_copy(path, target)
+    return target
+
+
+def restore_base(paths: StepPaths, storage_mode: str, sync: bool, bundle: bool) -> bool:
+    """
+    Put the partitioned base dataset into the working intermediate directory.
+
+    Locally the files of data/processed are hard-linked (customize only
+    detaches the ones it rewrites); in S3 mode they come from osrm/processed.
+    Either way the base itself is never modified, so every update starts from
+    the speeds of the last full build rather than the previous update.
+    """
+    if storage_mode == "s3":
+        if not download_from_s3(BASE_PREFIX, str(paths.intermediate), sync=sync, bundle=bundle):
+            logger.error(f"Failed to restore the base dataset from {BASE_PREFIX}")
+            return False
+    else:
+        base = Path("data/processed")
+        files = sorted(path for path in base.glob(f"{paths.region}.osrm*") if path.is_file())
+        if not files:
+            logger.error(f"No base dataset in {base}; run the complete pipeline first")
+            return False
+        for path in files:
+            link_or_copy(path, paths.intermediate / path.name)
+        logger.info(f"Linked {len(files)} base files from {base}")
+
+    partition = paths.intermediate / f"{paths.region}.osrm.partition"
+    if not partition.exists():
+        logger.error(f"{partition} missing: the base dataset is not an MLD build")
+        return False
+    return True
+
+
+def write_traffic_stamp(paths: StepPaths, updates: Dict[str, List[Path]]):
+    """Record which files the dataset in processed was customized with."""
+    stamp = {
+        "updated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "region": paths.region,
+        "files": [
+            {"kind": kind, "name": path.name, "md5": file_md5(path)}
+            for kind, files in updates.items() for path in files
+        ],
+    }
+    (paths.processed / TRAFFIC_STAMP).write_text(json.dumps(stamp, indent=2))
+
+
+def update_speeds(
+    speeds: List[str],
+    turn_penalties: Optional[List[str]] = None,
+    storage_mode: str = "local",
+    sync: bool = False,
+    bundle: bool = False,
+    timeout: int = 1800
+) -> bool:
+    """
+    Re-customize the existing MLD dataset with new traffic data.
+
+    Restores the partitioned base dataset into TRAFFIC_DATA_DIR (default:
+    data/live), runs only osrm-customize with the given segment speed and
+    turn penalty CSVs, and publishes the result: to <TRAFFIC_DATA_DIR>/processed
+    locally, and to TRAFFIC_PUBLISH_PREFIX (default: osrm/live) in S3 mode.
+
+    Args:
+        speeds: Segment speed CSVs (local paths or s3:// URLs)
+        turn_penalties: Turn penalty CSVs (local paths or s3:// URLs)
+        storage_mode: "local" or "s3"
+        sync: Only transfer files whose content changed since the last run
+        bundle: Restore the base dataset from its compressed bundle (S3 mode)
+        timeout: Timeout in seconds for osrm-customize
+
+    Returns:
+        True if successful, False otherwise
+    """
+    load_env_once()
+    turn_penalties = turn_penalties or []
+    if not speeds and not turn_penalties:
+        logger.error("update-speeds needs at least one --speeds or --turn-penalties file")
+        return False
+
+    data_dir = Path(os.getenv("TRAFFIC_DATA_DIR", DEFAULT_TRAFFIC_DIR))
+    publish_prefix = os.getenv("TRAFFIC_PUBLISH_PREFIX", DEFAULT_PUBLISH_PREFIX)
+    start = time.monotonic()
+
+    traffic_dir = data_dir / "traffic"
+    traffic_dir.mkdir(parents=True, exist_ok=True)
+    updates: Dict[str, List[Path]] = {"speeds": [], "turn_penalties": []}
+    for kind, sources in [("speeds", speeds), ("turn_penalties", turn_penalties)]:
+        for source in sources:
+            path = fetch_update_file(source, traffic_dir)
+            if path is None:
+                return False
+            updates[kind].append(path)
+
+    args = " ".join(
+        f"{CUSTOMIZE_FLAGS[kind]} /data/{path.relative_to(data_dir).as_posix()}"
+        for kind, files in updates.items() for path in files
+    )
+    env = traffic_env(data_dir, args)
+    paths = StepPaths.from_env(env)
+
+    restore_start = time.monotonic()
+    if not restore_base(paths, storage_mode, sync, bundle):
+        return False
+    record_stage_duration("restore", time.monotonic() - restore_start)
+
+    logger.info(f"Customizing {paths.region} with {args}")
+    success = run_docker_compose_step("customize", timeout=timeout, env=env)
+    cleanup_docker(get_compose_file_for_step("customize"), env=env)
+    if not success:
+        logger.error("Traffic customize failed")
+        return False
+    write_traffic_stamp(paths, updates)
+
+    if storage_mode == "s3":
+        upload_start = time.monotonic()
+        if not upload_to_s3(str(paths.processed), publish_prefix, sync=sync):
+            logger.error(f"Failed to publish the updated dataset to {publish_prefix}")
+            return False
+        record_stage_duration("upload", time.monotonic() - upload_start)
+        logger.success(f"Updated dataset published to {publish_prefix}")
+
+    logger.success(f"Traffic update finished in {time.monotonic() - start:.1f}s ({paths.processed})")
+    return True
+
+
+def main():
+    """Main entry point with CLI argument parsing."""
+    parser = argparse.ArgumentParser(description="Re-customize the OSRM dataset with traffic data")
+    parser.add_argument(
+        "--speeds",
+        action="append",
+        default=[],
+        help="Segment speed CSV (local path or s3://bucket/key); repeatable"
+    )
+    parser.add_argument(
+        "--turn-penalties",
+        action="append",
+        default=[],
+        help="Turn penalty CSV (local path or s3://bucket/key); repeatable"
+    )
+    parser.add_argument(
+        "--storage",
+        choices=["local", "s3"],
+        default="local",
+        help="Storage mode: local or s3 (restore from osrm/processed, publish to osrm/live) (default: local)"
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="Only transfer files whose content changed since the last run"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=1800,
+        help="Timeout in seconds for osrm-customize (default: 1800)"
+    )
+
+    args = parser.parse_args()
+
+    if not update_speeds(args.speeds, args.turn_penalties, storage_mode=args.storage, sync=args.sync, timeout=args.timeout):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,67 +3,164 @@
 
 import argparse
 import sys
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict
 from loguru import logger
-from src.utils.s3_utils import S3Storage
+from src.utils.bundle import download_bundle, upload_bundle
+from src.utils.s3_utils import get_storage
+from src.utils.sync_index import SyncIndex
 
 
-def download_from_s3(s3_path: str, local_path: str, filename: str = None):
-    """Download from S3 to local filesystem."""
-    storage = S3Storage()
+def download_from_s3(
+    s3_path: str,
+    local_path: str,
+    filename: str = None,
+    workers: int = None,
+    sync: bool = False,
+    bundle: bool = False,
+    members: list = None
+):
+    """
+    Download from S3 to local filesystem, directories with a pool of workers.
+    
+    With sync enabled, only objects whose content differs from the local copy
+    (per the local sync index) are transferred. With bundle enabled, the
+    directory is restored from the single <s3_path>.tar.zst object instead,
+    optionally extracting only the named members.
+    """
+    storage = get_storage()
     local_dir = Path(local_path)
     local_dir.mkdir(parents=True, exist_ok=True)
     
-    if filename:
-        # Download specific file
-        s3_key = f"{s3_path}/{filename}"
-        local_file = local_dir / filename
-        logger.info(f"Downloading {s3_key} to {local_file}")
-        return storage.download_file(s3_key, str(local_file))
-    else:
-        # Download entire directory
-        logger.info(f"Downloading directory from s3://{storage.bucket}/{s3_path}/ to {local_dir}/")
-        files = storage.list_files(s3_path)
-        success_count = 0
-        
-        for s3_key in files:
-            if s3_key.startswith(s3_path + "/"):
-                relative_path = s3_key[len(s3_path) + 1:]
-                local_file = local_dir / relative_path
-                local_file.parent.mkdir(parents=True, exist_ok=True)
-                
-                if storage.download_file(s3_key, str(local_file)):
-                    success_count += 1
-                else:
-                    logger.error(f"Failed to download {s3_key}")
-        
-        logger.info(f"Downloaded {success_count} files")
-        return success_count > 0
+    if bundle and not filename:
+        logger.info(f"Restoring bundle s3://{storage.bucket}/{s3_path}.tar.zst to {local_dir}/")
+        return download_bundle(storage, s3_path, str(local_dir), members) > 0
+    
+    index = SyncIndex() if sync else None
+    
+    try:
+        if filename:
+            # Download specific file
+            s3_key = f"{s3_path}/{filename}"
+            local_file = local_dir / filename
+            logger.info(f"Downloading {s3_key} to {local_file}")
+            if index is not None:
+                return storage.sync_download_file(s3_key, str(local_file), index)
+            return storage.download_file(s3_key, str(local_file))
+        else:
+            # Download entire directory
+            logger.info(f"Downloading directory from s3://{storage.bucket}/{s3_path}/ to {local_dir}/")
+            success_count = storage.download_directory(
+                s3_path, str(local_dir), max_workers=workers, index=index
+            )
+            return success_count > 0
+    finally:
+        if index is not None:
+            index.close()
 
 
-def upload_to_s3(local_path: str, s3_path: str, filename: str = None):
-    """Upload from local filesystem to S3."""
-    storage = S3Storage()
+def upload_to_s3(
+    local_path: str,
+    s3_path: str,
+    filename: str = None,
+    workers: int = None,
+    sync: bool = False,
+    bundle: bool = False,
+    files: list = None
+):
+    """
+    Upload from local filesystem to S3, directories with a pool of workers.
+    
+    With sync enabled, only files whose content differs from the S3 object
+    (per the local sync index) are transferred. With bundle enabled, the
+    directory is streamed into a single compressed <s3_path>.tar.zst object.
+    Passing files restricts a directory upload to those paths inside it.
+    """
+    storage = get_storage()
     local_dir = Path(local_path)
     
     if not local_dir.exists():
         logger.error(f"Local path does not exist: {local_path}")
         return False
     
-    if filename:
-        # Upload specific file
-        local_file = local_dir / filename
-        if not local_file.exists():
-            logger.error(f"File not found: {local_file}")
+    if bundle and not filename:
+        logger.info(f"Bundling directory {local_dir}/ to s3://{storage.bucket}/{s3_path}.tar.zst")
+        return upload_bundle(storage, str(local_dir), s3_path)
+    
+    index = SyncIndex() if sync else None
+    try:
+        if filename:
+            # Upload specific file
+            local_file = local_dir / filename
+            if not local_file.exists():
+                logger.error(f"File not found: {local_file}")
+                return False
+            
+            s3_key = f"{s3_path}/{filename}"
+            logger.info(f"Uploading {local_file} to {s3_key}")
+            if index is not None:
+                return storage.sync_upload_file(str(local_file), s3_key, index)
+            return storage.upload_file(str(local_file), s3_key)
+        else:
+            # Upload entire directory
+            logger.info(f"Uploading directory from {local_dir}/ to s3://{storage.bucket}/{s3_path}/")
+            return storage.upload_directory(
+                str(local_dir), s3_path, max_workers=workers, index=index, files=files
+            ) > 0
+    finally:
+        if index is not None:
+            index.close()
+
+
+class TransferWorker:
+    """
+    Run S3 transfers on a background thread while the pipeline moves on.
+    
+    Transfers execute one after another in submission order (each is already
+    parallel across files), so a later transfer never races an earlier one
+    for the same keys. Callers block only where they depend on a result.
+    """
+    
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="s3-transfer")
+        self._pending: Dict[str, Future] = {}
+    
+    def submit(self, name: str, func, *args, **kwargs) -> Future:
+        """Queue a transfer function returning True/False under a name."""
+        logger.info(f"Queued background transfer: {name}")
+        future = self._executor.submit(func, *args, **kwargs)
+        self._pending[name] = future
+        return future
+    
+    def wait(self, name: str) -> bool:
+        """Block until the named transfer finishes and return whether it succeeded."""
+        future = self._pending.pop(name, None)
+        if future is None:
+            return True
+        try:
+            success = bool(future.result())
+        except Exception as e:
+            logger.error(f"Background transfer {name} failed: {e}")
             return False
-        
-        s3_key = f"{s3_path}/{filename}"
-        logger.info(f"Uploading {local_file} to {s3_key}")
-        return storage.upload_file(str(local_file), s3_key)
-    else:
-        # Upload entire directory
-        logger.info(f"Uploading directory from {local_dir}/ to s3://{storage.bucket}/{s3_path}/")
-        return storage.upload_directory(str(local_dir), s3_path) > 0
+        if not success:
+            logger.error(f"Background transfer {name} failed")
+        return success
+    
+    def wait_all(self) -> bool:
+        """Block until every queued transfer finishes; True if all succeeded."""
+        results = [self.wait(name) for name in list(self._pending)]
+        return all(results)
+    
+    def close(self):
+        """Drop queued transfers that have not started and wait for the running one."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
 
 
 def main():
@@ -91,6 +188,26 @@ def main():
         "--filename",
         help="Specific filename (optional, otherwise transfers entire directory)"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of files transferred in parallel (default: S3_UPLOAD_WORKERS / S3_DOWNLOAD_WORKERS)"
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="Only transfer files whose content changed (uses local sync index)"
+    )
+    parser.add_argument(
+        "--bundle",
+        action="store_true",
+        help="Transfer the directory as one zstd-compressed tar object (<s3-path>.tar.zst)"
+    )
+    parser.add_argument(
+        "--member",
+        action="append",
+        help="With --bundle download, extract only this member (repeatable)"
+    )
     parser.add_argument(
         "--create-dirs",
         action="store_true",
@@ -108,14 +225,18 @@ def main():
     
     try:
         if args.operation == "download":
-            success = download_from_s3(args.s3_path, args.local_path, args.filename)
+            success = download_from_s3(
+                args.s3_path, args.local_path, args.filename, args.workers, args.sync, args.bundle, args.member
+            )
         else:  # upload
             # Create S3 directory structure if requested
             if args.create_dirs and not args.filename:
-                storage = S3Storage()
+                storage = get_storage()
                 storage.create_folder(args.s3_path)
             
-            success = upload_to_s3(args.local_path, args.s3_path, args.filename)
+            success = upload_to_s3(
+                args.local_path, args.s3_path, args.filename, args.workers, args.sync, args.bundle
+            )
         
         if success:
             logger.success(f"{args.operation.title()} operation completed successfully")
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""Incremental OSM extract updates from replication change files."""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.request import urlopen
+from loguru import logger
+from src.core.download_osm import (
+    get_osm_source,
+    read_source_state,
+    source_metadata,
+    source_state_path,
+)
+from src.core.process import cleanup_docker, get_compose_file_for_step, run_docker_compose_step
+from src.core.transfer import download_from_s3
+from src.utils.s3_utils import get_storage
+from src.utils.sync_index import file_md5
+
+
+UPDATES_DIR = Path("data/updates")
+DIFF_DOWNLOAD_WORKERS = 4
+
+# HeaderBlock field numbers from the OSM PBF format (osmformat.proto)
+HEADER_REPLICATION_TIMESTAMP = 32
+HEADER_REPLICATION_SEQUENCE = 33
+HEADER_REPLICATION_BASE_URL = 34
+
+
+def _read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    """Decode a protobuf varint at pos, returning (value, next position)."""
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _iter_fields(buf: bytes) -> Iterator[Tuple[int, object]]:
+    """Yield (field number, value) pairs from a protobuf message."""
+    pos = 0
+    while pos < len(buf):
+        key, pos = _read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 0x07
+        if wire_type == 0:
+            value, pos = _read_varint(buf, pos)
+        elif wire_type == 1:
+            value, pos = buf[pos:pos + 8], pos + 8
+        elif wire_type == 2:
+            length, pos = _read_varint(buf, pos)
+            value, pos = buf[pos:pos + length], pos + length
+        elif wire_type == 5:
+            value, pos = buf[pos:pos + 4], pos + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        yield field, value
+
+
+def read_pbf_replication_header(pbf_path: str) -> dict:
+    """
+    Read the osmosis replication fields from an OSM PBF file header.
+
+    Only the first (OSMHeader) block is read, so this is cheap for any file size.
+
+    Args:
+        pbf_path: Path to the .osm.pbf file
+
+    Returns:
+        Dict with "sequence", "timestamp" and "base_url" (values None if absent)
+    """
+    with open(pbf_path, "rb") as f:
+        (header_length,) = struct.unpack(">I", f.read(4))
+        blob_header = dict(_iter_fields(f.read(header_length)))
+        if blob_header.get(1) != b"OSMHeader":
+            raise ValueError(f"{pbf_path} does not start with an OSMHeader block")
+        blob = dict(_iter_fields(f.read(blob_header[3])))
+
+    if 1 in blob:
+        header_block = blob[1]
+    elif 3 in blob:
+        header_block = zlib.decompress(blob[3])
+    else:
+        raise ValueError("Unsupported PBF header blob compression")
+
+    fields = dict(_iter_fields(header_block))
+    base_url = fields.get(HEADER_REPLICATION_BASE_URL)
+    return {
+        "sequence": fields.get(HEADER_REPLICATION_SEQUENCE),
+        "timestamp": fields.get(HEADER_REPLICATION_TIMESTAMP),
+        "base_url": base_url.decode() if base_url else None,
+    }
+
+
+def replication_state_path(osm_file: Path) -> Path:
+    """Local sidecar recording the replication sequence of an extract."""
+    return osm_file.with_name(osm_file.name + ".state.json")
+
+
+def sequence_path(sequence: int) -> str:
+    """Return the replication directory path for a sequence, e.g. 4123 -> 000/004/123."""
+    digits = f"{sequence:09d}"
+    return f"{digits[0:3]}/{digits[3:6]}/{digits[6:9]}"
+
+
+def parse_state_txt(text: str) -> dict:
+    """Parse an osmosis state.txt file into a dict."""
+    state = {}
+    for line in text.splitlines():
+        if "=" in line and not line.startswith("#"):
+            key, value = line.split("=", 1)
+            state[key.strip()] = value.strip().replace("\\:", ":")
+    return state
+
+
+def fetch_replication_state(base_url: str, sequence: Optional[int] = None) -> dict:
+    """
+    Fetch the latest (or a specific) replication state from the server.
+
+    Returns:
+        Dict with integer "sequenceNumber" and string "timestamp"
+    """
+    url = f"{base_url}/state.txt" if sequence is None else f"{base_url}/{sequence_path(sequence)}.state.txt"
+    with urlopen(url) as response:
+        state = parse_state_txt(response.read().decode())
+    state["sequenceNumber"] = int(state["sequenceNumber"])
+    return state
+
+
+def default_replication_url(osm_url: str) -> str:
+    """Derive the Geofabrik updates URL from an extract URL."""
+    return osm_url.replace("-latest.osm.pbf", "-updates")
+
+
+def current_replication_state(osm_file: Path, osm_url: str) -> Optional[dict]:
+    """
+    Determine the replication sequence and base URL of a local extract.
+
+    Prefers the PBF header, falling back to the state sidecar written by
+    previous updates.
+    """
+    state = {}
+    try:
+        header = read_pbf_replication_header(str(osm_file))
+        if header["sequence"] is not None:
+            state = header
+    except (OSError, ValueError, struct.error, zlib.error) as e:
+        logger.warning(f"Could not read PBF header of {osm_file}: {e}")
+
+    state_file = replication_state_path(osm_file)
+    if not state and state_file.exists():
+        state = json.loads(state_file.read_text())
+
+    if state.get("sequence") is None:
+        return None
+
+    state["base_url"] = (
+        os.getenv("OSM_REPLICATION_URL") or state.get("base_url") or default_replication_url(osm_url)
+    ).rstrip("/")
+    return state
+
+
+def download_changes(base_url: str, first: int, last: int, target_dir: Path) -> List[Path]:
+    """
+    Download the .osc.gz change files for sequences first..last concurrently.
+
+    Returns:
+        Paths of the downloaded files in sequence order
+    """
+    target_dir.mkdir(parents=True, exist_ok=True)
+
+    def fetch(sequence: int) -> Path:
+        target = target_dir / f"{sequence:09d}.osc.gz"
+        with urlopen(f"{base_url}/{sequence_path(sequence)}.osc.gz") as response:
+            target.write_bytes(response.read())
+        return target
+
+    sequences = range(first, last + 1)
+    with ThreadPoolExecutor(max_workers=DIFF_DOWNLOAD_WORKERS) as executor:
+        paths = list(executor.map(fetch, sequences))
+    logger.info(f"Downloaded {len(paths)} change files ({first}..{last})")
+    return paths
+
+
+def update_osm(storage_type="local", s3_prefix="osrm/raw", timeout=3600):
+    """
+    Bring the stored OSM extract up to date by applying replication diffs.
+
+    The current sequence is read from the PBF header (or the state sidecar),
+    only the change files published since then are fetched, and osmium merges
+    them into a new PBF in a container. In S3 mode the extract is restored
+    from and published back to S3 together with its state file.
+
+    Args:
+        storage_type: "local" or "s3"
+        s3_prefix: S3 prefix of the raw extract
+        timeout: Timeout in seconds for the merge container
+
+    Returns:
+        True if successful (including when already up to date), False otherwise
+    """
+    osm_url, osm_filename = get_osm_source()
+    raw_dir = Path("data/raw")
+    osm_file = raw_dir / osm_filename
+
+    if storage_type == "s3":
+        logger.info("S3 mode: Restoring current extract and state from S3")
+        if not download_from_s3(s3_prefix, str(raw_dir), osm_filename, sync=True):
+            logger.error("Failed to download OSM extract from S3")
+            return False
+        state_name = replication_state_path(osm_file).name
+        if get_storage().file_exists(f"{s3_prefix}/{state_name}"):
+            download_from_s3(s3_prefix, str(raw_dir), state_name)
+
+    if not osm_file.exists():
+        logger.error(f"OSM extract not found: {osm_file}. Run the download operation first")
+        return False
+
+    current = current_replication_state(osm_file, osm_url)
+    if current is None:
+        logger.error("Extract has no replication sequence; a full download is required")
+        return False
+
+    try:
+        latest = fetch_replication_state(current["base_url"])
+    except (HTTPError, URLError, KeyError, ValueError) as e:
+        logger.error(f"Failed to read replication state from {current['base_url']}: {e}")
+        return False
+
+    first, last = current["sequence"] + 1, latest["sequenceNumber"]
+    logger.info(f"Extract at sequence {current['sequence']}, upstream at {last}")
+    if first > last:
+        logger.success("Extract is already up to date")
+        return True
+
+    for stale in UPDATES_DIR.glob("*.osc.gz"):
+        stale.unlink()
+    try:
+        download_changes(current["base_url"], first, last, UPDATES_DIR)
+    except (HTTPError, URLError) as e:
+        logger.error(f"Failed to download change files: {e}")
+        return False
+
+    # Merge in a container like the other stages; header values come from the env
+    os.environ["OSM_REPLICATION_SEQUENCE"] = str(last)
+    os.environ["OSM_REPLICATION_TIMESTAMP"] = latest.get("timestamp", "")
+    os.environ["OSM_REPLICATION_URL"] = current["base_url"]
+    success = run_docker_compose_step("update", timeout=timeout)
+    cleanup_docker(get_compose_file_for_step("update"))
+
+    updated_file = osm_file.with_name(osm_file.name + ".updated")
+    if not success or not updated_file.exists():
+        logger.error("Applying change files failed")
+        return False
+
+    os.replace(updated_file, osm_file)
+    for applied in UPDATES_DIR.glob("*.osc.gz"):
+        applied.unlink()
+
+    state = {"sequence": last, "timestamp": latest.get("timestamp"), "base_url": current["base_url"]}
+    replication_state_path(osm_file).write_text(json.dumps(state, indent=2))
+
+    # Keep the upstream validators (a conditional download still compares against
+    # the full extract) but record the new content hash
+    source_state = read_source_state(storage_type, s3_prefix) or {"url": osm_url}
+    source_state["md5"] = file_md5(osm_file)
+    source_state_path(osm_file).write_text(json.dumps(source_state, indent=2))
+
+    if storage_type == "s3":
+        storage = get_storage()
+        s3_key = f"{s3_prefix}/{osm_filename}"
+        if not storage.upload_file(str(osm_file), s3_key, metadata=source_metadata(source_state)):
+            logger.error("Failed to upload updated extract to S3")
+            return False
+        storage.upload_file(str(replication_state_path(osm_file)), f"{s3_prefix}/{replication_state_path(osm_file).name}")
+
+    logger.success(f"Extract updated to sequence {last} ({last - first + 1} change files applied)")
+    return True
+
+
+def main():
+    """Main entry point with CLI argument parsing."""
+    parser = argparse.ArgumentParser(description="Apply OSM replication diffs to the stored extract")
+    parser.add_argument(
+        "--storage",
+        choices=["local", "s3"],
+        default="local",
+        help="Where the extract lives: local filesystem or S3 (default: local)"
+    )
+    parser.add_argument(
+        "--s3-prefix",
+        default="osrm/raw",
+        help="S3 prefix of the raw extract (default: osrm/raw)"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=3600,
+        help="Timeout in seconds for the merge container (default: 3600)"
+    )
+
+    args = parser.parse_args()
+
+    logger.info("=== OSM Incremental Update ===")
+    logger.info(f"Storage type: {args.storage}")
+
+    if not update_osm(storage_type=args.storage, s3_prefix=args.s3_prefix, timeout=args.timeout):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
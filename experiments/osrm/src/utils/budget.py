@@ -0,0 +1,150 @@
+"""Shared CPU and memory budget for concurrently running builds."""
+
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Optional
+from loguru import logger
+
+
+GB = 1024 ** 3
+
+# cgroup v2 and v1 memory limit files; the v1 file reads a huge number when unlimited
+CGROUP_MEMORY_LIMITS = [
+    Path("/sys/fs/cgroup/memory.max"),
+    Path("/sys/fs/cgroup/memory/memory.limit_in_bytes"),
+]
+
+
+def cgroup_memory_limit() -> Optional[int]:
+    """Memory limit of this container's cgroup in bytes, or None if unlimited."""
+    for path in CGROUP_MEMORY_LIMITS:
+        try:
+            value = path.read_text().strip()
+        except OSError:
+            continue
+        if value.isdigit():
+            return int(value)
+    return None
+
+
+# cgroup v2 "quota period" file, and the v1 quota/period pair (quota -1 when unlimited)
+CGROUP_CPU_MAX = Path("/sys/fs/cgroup/cpu.max")
+CGROUP_CPU_V1 = (Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us"), Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us"))
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """CPU quota of this container's cgroup in CPUs (e.g. a k8s limit), or None if unlimited."""
+    try:
+        quota, period = CGROUP_CPU_MAX.read_text().split()[:2]
+    except (OSError, ValueError):
+        try:
+            quota, period = (path.read_text().strip() for path in CGROUP_CPU_V1)
+        except OSError:
+            return None
+    if not quota.lstrip("-").isdigit() or int(quota) <= 0 or int(period) <= 0:
+        return None
+    return int(quota) / int(period)
+
+
+def affinity_cpus() -> set:
+    """CPUs this process may run on (its cpuset)."""
+    try:
+        return os.sched_getaffinity(0)
+    except AttributeError:
+        return set(range(os.cpu_count() or 1))
+
+
+def format_cpuset(cpus: Iterable[int]) -> str:
+    """Render CPU numbers as a cpuset list, e.g. {0, 1, 2, 5} -> "0-2,5"."""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(f"{start}-{end}" if end > start else str(start) for start, end in ranges)
+
+
+def available_cpus() -> float:
+    """CPUs available to this process: its cpuset capped by the cgroup quota."""
+    cpus = float(len(affinity_cpus()))
+    limit = cgroup_cpu_limit()
+    return min(cpus, limit) if limit else cpus
+
+
+def total_memory_gb() -> float:
+    """Memory available to this process in GiB: physical memory capped by the cgroup limit (e.g. a k8s limit)."""
+    physical = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    limit = cgroup_memory_limit()
+    return min(physical, limit or physical) / GB
+
+
+class ResourceBudget:
+    """
+    Counting reservations of CPUs and memory (GiB) against fixed totals.
+
+    reserve() blocks until the request fits next to the reservations already
+    held. A request larger than the whole budget is clamped to it, so it still
+    runs, alone.
+    """
+
+    def __init__(self, cpus: Optional[float] = None, memory_gb: Optional[float] = None):
+        self.cpus = cpus or float(os.getenv("BUILD_CPU_BUDGET") or available_cpus())
+        self.memory_gb = memory_gb or float(os.getenv("BUILD_MEMORY_BUDGET_GB") or total_memory_gb())
+        self.used_cpus = 0.0
+        self.used_memory_gb = 0.0
+        self._condition = threading.Condition()
+
+    def fits(self, cpus: float, memory_gb: float) -> bool:
+        """True if a request could be admitted right now."""
+        return (
+            self.used_cpus + cpus <= self.cpus + 1e-9
+            and self.used_memory_gb + memory_gb <= self.memory_gb + 1e-9
+        )
+
+    def clamp(self, cpus: float, memory_gb: float):
+        """Cap a request at the budget totals."""
+        return min(cpus, self.cpus), min(memory_gb, self.memory_gb)
+
+    def acquire(self, cpus: float, memory_gb: float, blocking: bool = True, name: str = "") -> bool:
+        """
+        Take cpus and memory_gb out of the budget.
+
+        Args:
+            cpus: CPUs to reserve (clamped to the budget)
+            memory_gb: Memory to reserve in GiB (clamped to the budget)
+            blocking: Wait until the request fits; otherwise return at once
+            name: Label for the waiting log message
+
+        Returns:
+            True if reserved (always when blocking), False if it did not fit
+        """
+        cpus, memory_gb = self.clamp(cpus, memory_gb)
+        with self._condition:
+            if not self.fits(cpus, memory_gb):
+                if not blocking:
+                    return False
+                logger.info(f"Waiting for {cpus:g} CPUs / {memory_gb:g} GiB{f' for {name}' if name else ''}")
+                self._condition.wait_for(lambda: self.fits(cpus, memory_gb))
+            self.used_cpus += cpus
+            self.used_memory_gb += memory_gb
+            return True
+
+    def release(self, cpus: float, memory_gb: float):
+        """Return a reservation made with acquire()."""
+        cpus, memory_gb = self.clamp(cpus, memory_gb)
+        with self._condition:
+            self.used_cpus -= cpus
+            self.used_memory_gb -= memory_gb
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, cpus: float, memory_gb: float, name: str = ""):
+        """Hold cpus and memory_gb of the budget for the duration of the block."""
+        self.acquire(cpus, memory_gb, name=name)
+        try:
+            yield
+        finally:
+            self.release(cpus, memory_gb)
@@ -0,0 +1,310 @@
+"""Streaming zstd-compressed tar bundles with a member offset index."""
+
+import json
+import os
+import tarfile
+import threading
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, List, Optional
+import zstandard
+from loguru import logger
+
+
+BUNDLE_SUFFIX = ".tar.zst"
+INDEX_SUFFIX = ".index.json"
+COPY_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class CountingWriter:
+    """Write-through wrapper that tracks how many bytes reached the sink."""
+
+    def __init__(self, sink: BinaryIO):
+        self.sink = sink
+        self.count = 0
+
+    def write(self, data) -> int:
+        self.sink.write(data)
+        self.count += len(data)
+        return len(data)
+
+    def flush(self):
+        self.sink.flush()
+
+
+class ProducerReader:
+    """
+    Read end of a producer pipe that raises once the producer has failed.
+
+    A failed producer still closes its end of the pipe, which would otherwise
+    look like the end of a complete stream to the consumer.
+    """
+
+    def __init__(self, source: BinaryIO, result: dict):
+        self.source = source
+        self.result = result
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.source.read(size)
+        if not data and "error" in self.result:
+            raise IOError(f"Producer failed: {self.result['error']}")
+        return data
+
+
+def _pad(size: int) -> bytes:
+    """Zero padding that aligns a tar member to the next 512-byte block."""
+    return b"\0" * (-size % tarfile.BLOCKSIZE)
+
+
+def write_bundle(files: Iterable[Path], base_dir: Path, sink: BinaryIO, level: int = 3, threads: int = -1) -> dict:
+    """
+    Write files as a tar archive where every member is its own zstd frame.
+
+    Concatenated zstd frames form a valid stream, so the result is a regular
+    .tar.zst that `zstd -d | tar x` understands. Because frames are
+    independent, a single member can also be decompressed from its byte range
+    alone. Members are read and compressed in chunks, so nothing is staged.
+
+    Args:
+        files: Files to include
+        base_dir: Directory member names are relative to
+        sink: Writable binary stream receiving the compressed bundle
+        level: zstd compression level
+        threads: zstd worker threads per frame (-1: one per CPU, 0: single-threaded)
+
+    Returns:
+        Index dict: {"members": {name: {"offset", "length", "size"}}, "total": bytes}
+    """
+    compressor = zstandard.ZstdCompressor(level=level, threads=threads)
+    out = CountingWriter(sink)
+    members = {}
+
+    for file_path in files:
+        name = str(Path(file_path).relative_to(base_dir)).replace("\\", "/")
+        info = tarfile.TarInfo(name)
+        stat = Path(file_path).stat()
+        info.size = stat.st_size
+        info.mtime = int(stat.st_mtime)
+        info.mode = stat.st_mode & 0o777
+
+        offset = out.count
+        with compressor.stream_writer(out, closefd=False) as writer:
+            writer.write(info.tobuf(format=tarfile.PAX_FORMAT))
+            with open(file_path, "rb") as f:
+                while chunk := f.read(COPY_CHUNK_SIZE):
+                    writer.write(chunk)
+            writer.write(_pad(info.size))
+        members[name] = {"offset": offset, "length": out.count - offset, "size": info.size}
+
+    # End-of-archive marker in a frame of its own
+    with compressor.stream_writer(out, closefd=False) as writer:
+        writer.write(b"\0" * tarfile.BLOCKSIZE * 2)
+    out.flush()
+
+    return {"members": members, "total": out.count}
+
+
+def read_bundle(source: BinaryIO, target_dir: Path, members: Optional[List[str]] = None) -> List[str]:
+    """
+    Decompress and unpack a bundle stream (or a single member's frame) into a directory.
+
+    Args:
+        source: Readable binary stream of concatenated zstd frames
+        target_dir: Directory to extract into
+        members: Only extract these member names (default: all)
+
+    Returns:
+        Names of the extracted members
+    """
+    target_dir.mkdir(parents=True, exist_ok=True)
+    reader = zstandard.ZstdDecompressor().stream_reader(source, read_across_frames=True)
+    extracted = []
+    with tarfile.open(fileobj=reader, mode="r|") as archive:
+        for member in archive:
+            if not member.isfile() or (members is not None and member.name not in members):
+                continue
+            target = (target_dir / member.name).resolve()
+            if not target.is_relative_to(target_dir.resolve()):
+                raise ValueError(f"Refusing to extract outside target directory: {member.name}")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with archive.extractfile(member) as data, open(target, "wb") as f:
+                while chunk := data.read(COPY_CHUNK_SIZE):
+                    f.write(chunk)
+            os.utime(target, (member.mtime, member.mtime))
+            extracted.append(member.name)
+    return extracted
+
+
+def bundle_keys(s3_path: str) -> tuple:
+    """Return the (bundle, index) object keys for a bundled S3 path."""
+    bundle_key = s3_path.rstrip("/") + BUNDLE_SUFFIX
+    return bundle_key, bundle_key + INDEX_SUFFIX
+
+
+def upload_bundle(storage, local_dir: str, s3_path: str, level: int = 3, threads: int = -1) -> bool:
+    """
+    Bundle a directory straight into a single S3 object plus its index.
+
+    Compression runs in a producer thread writing into an OS pipe, and the
+    read end feeds a streaming multipart upload, so compression and upload
+    overlap without a full-size temporary file.
+
+    Args:
+        storage: S3Storage instance
+        local_dir: Directory to bundle
+        s3_path: Logical S3 path; objects go to <s3_path>.tar.zst and .tar.zst.index.json
+        level: zstd compression level
+        threads: zstd worker threads per frame
+
+    Returns:
+        True if successful, False otherwise
+    """
+    base_dir = Path(local_dir)
+    files = sorted(path for path in base_dir.rglob("*") if path.is_file())
+    bundle_key, index_key = bundle_keys(s3_path)
+    read_fd, write_fd = os.pipe()
+    result: Dict[str, object] = {}
+
+    def produce():
+        sink = os.fdopen(write_fd, "wb")
+        try:
+            result["index"] = write_bundle(files, base_dir, sink, level=level, threads=threads)
+            sink.flush()
+        except Exception as e:
+            # Recorded before the pipe closes, so the reader fails instead of seeing a clean EOF
+            result["error"] = e
+        finally:
+            try:
+                sink.close()
+            except OSError:
+                pass
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    with os.fdopen(read_fd, "rb") as source:
+        uploaded = storage.upload_stream(ProducerReader(source, result), bundle_key)
+    producer.join()
+
+    if "error" in result:
+        logger.error(f"Bundling {local_dir} failed: {result['error']}")
+        return False
+    if not uploaded:
+        return False
+
+    # The index names the bundle it describes, so readers can tell it from a stale one
+    info = storage.get_file_info(bundle_key)
+    if info is None:
+        logger.error(f"Uploaded bundle {bundle_key} not found")
+        return False
+    index = {**result["index"], "etag": info["etag"]}
+    raw_size = sum(member["size"] for member in index["members"].values())
+    if not storage.write_object(index_key, json.dumps(index).encode()):
+        logger.error(f"Failed to write bundle index {index_key}")
+        return False
+    logger.success(
+        f"Bundled {len(files)} files into s3://{storage.bucket}/{bundle_key} "
+        f"({raw_size / 1024 / 1024:.2f} MB -> {index['total'] / 1024 / 1024:.2f} MB)"
+    )
+    return True
+
+
+def read_index(storage, s3_path: str) -> Optional[dict]:
+    """
+    Load a bundle's index after checking it describes the bundle now in S3.
+
+    A bundle is replaced before its new index is written, so an index whose
+    size or ETag does not match the object would point ranged reads at the
+    wrong bytes.
+
+    Returns:
+        Index dict, or None if it is missing or stale
+    """
+    bundle_key, index_key = bundle_keys(s3_path)
+    raw_index = storage.read_object(index_key)
+    if raw_index is None:
+        return None
+    index = json.loads(raw_index)
+    info = storage.get_file_info(bundle_key)
+    if info is None or info["size"] != index["total"] or index.get("etag", info["etag"]) != info["etag"]:
+        logger.error(f"Bundle index {index_key} does not match {bundle_key}")
+        return None
+    return index
+
+
+def read_bundle_member(storage, s3_path: str, name: str) -> Optional[bytes]:
+    """
+    Read one small member of a bundle into memory through its indexed byte range.
+
+    Args:
+        storage: S3Storage instance
+        s3_path: Logical S3 path the bundle was uploaded under
+        name: Member name
+
+    Returns:
+        Member content, or None if there is no bundle (or valid index) or no such member
+    """
+    bundle_key, _ = bundle_keys(s3_path)
+    index = read_index(storage, s3_path)
+    if index is None:
+        return None
+    entry = index["members"].get(name)
+    if entry is None:
+        return None
+    body = storage.get_stream(bundle_key, entry["offset"], entry["offset"] + entry["length"] - 1)
+    if body is None:
+        return None
+    with body:
+        reader = zstandard.ZstdDecompressor().stream_reader(body)
+        with tarfile.open(fileobj=reader, mode="r|") as archive:
+            for member in archive:
+                if member.name == name and member.isfile():
+                    return archive.extractfile(member).read()
+    return None
+
+
+def download_bundle(storage, s3_path: str, local_dir: str, members: Optional[List[str]] = None) -> int:
+    """
+    Restore a bundle from S3 by streaming it through the decompressor.
+
+    With members given, only those frames are fetched using ranged GETs
+    located through the index, instead of the whole object.
+
+    Args:
+        storage: S3Storage instance
+        s3_path: Logical S3 path the bundle was uploaded under
+        local_dir: Directory to extract into
+        members: Optional member names to extract selectively
+
+    Returns:
+        Number of files extracted
+    """
+    bundle_key, index_key = bundle_keys(s3_path)
+    target_dir = Path(local_dir)
+
+    if members is None:
+        body = storage.get_stream(bundle_key)
+        if body is None:
+            return 0
+        with body:
+            extracted = read_bundle(body, target_dir)
+        logger.info(f"Extracted {len(extracted)} files from s3://{storage.bucket}/{bundle_key}")
+        return len(extracted)
+
+    index = read_index(storage, s3_path)
+    if index is None:
+        logger.error(f"No valid bundle index at {index_key}")
+        return 0
+    index = index["members"]
+
+    extracted = 0
+    for name in members:
+        entry = index.get(name)
+        if entry is None:
+            logger.error(f"Member not in bundle: {name}")
+            continue
+        body = storage.get_stream(bundle_key, entry["offset"], entry["offset"] + entry["length"] - 1)
+        if body is None:
+            continue
+        with body:
+            extracted += len(read_bundle(body, target_dir, [name]))
+    logger.info(f"Extracted {extracted} of {len(members)} requested members from {bundle_key}")
+    return extracted
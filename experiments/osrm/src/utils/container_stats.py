@@ -0,0 +1,111 @@
+"""Periodic sampling of docker-compose container memory and CPU usage."""
+
+import re
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from loguru import logger
+
+
+UNITS = {
+    "b": 1, "kb": 1000, "mb": 1000 ** 2, "gb": 1000 ** 3, "tb": 1000 ** 4,
+    "kib": 1024, "mib": 1024 ** 2, "gib": 1024 ** 3, "tib": 1024 ** 4,
+}
+SIZE = re.compile(r"^\s*([\d.]+)\s*([a-zA-Z]+)")
+
+
+def parse_size(text: str) -> Optional[int]:
+    """Parse a docker stats size such as "1.5GiB" into bytes."""
+    match = SIZE.match(text)
+    if not match or match.group(2).lower() not in UNITS:
+        return None
+    return int(float(match.group(1)) * UNITS[match.group(2).lower()])
+
+
+def parse_stats_line(line: str) -> Tuple[Optional[int], Optional[float]]:
+    """Parse a "<MemUsage>|<CPUPerc>" line into (memory bytes, CPU fraction of one core)."""
+    memory, _, cpu = line.partition("|")
+    memory_bytes = parse_size(memory.split("/")[0])
+    try:
+        cpu_fraction = float(cpu.strip().rstrip("%")) / 100
+    except ValueError:
+        cpu_fraction = None
+    return memory_bytes, cpu_fraction
+
+
+def docker_stats(compose_file: str, service: str, env: Optional[Dict[str, str]] = None) -> List[str]:
+    """Return one "<MemUsage>|<CPUPerc>" line per running container of a service."""
+    ids = subprocess.run(
+        ["docker-compose", "-f", compose_file, "ps", "-q", service],
+        capture_output=True, text=True, timeout=30, env=env
+    ).stdout.split()
+    if not ids:
+        return []
+    return subprocess.run(
+        ["docker", "stats", "--no-stream", "--format", "{{.MemUsage}}|{{.CPUPerc}}", *ids],
+        capture_output=True, text=True, timeout=30
+    ).stdout.splitlines()
+
+
+class ContainerSampler:
+    """
+    Sample a service's containers on a background thread while it runs.
+
+    Memory is tracked as the highest sampled usage; CPU seconds integrate the
+    sampled CPU percentage over the time between samples.
+    """
+
+    def __init__(
+        self,
+        compose_file: str,
+        service: str,
+        interval: float = 2.0,
+        stats: Callable[[str, str], List[str]] = docker_stats,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.compose_file = compose_file
+        self.service = service
+        self.interval = interval
+        self.stats = stats
+        self.clock = clock
+        self.peak_memory_bytes: Optional[int] = None
+        self.cpu_seconds: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"sample-{service}", daemon=True)
+        self._last_sample: Optional[float] = None
+
+    def start(self) -> "ContainerSampler":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling and wait for the sampler thread."""
+        self._stop.set()
+        self._thread.join()
+
+    def sample(self):
+        """Take one sample of every running container of the service."""
+        try:
+            lines = self.stats(self.compose_file, self.service)
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.debug(f"Container stats unavailable for {self.service}: {e}")
+            return
+        now = self.clock()
+        memory_total = 0
+        cpu_total = 0.0
+        for line in lines:
+            memory_bytes, cpu_fraction = parse_stats_line(line)
+            memory_total += memory_bytes or 0
+            cpu_total += cpu_fraction or 0.0
+        if not lines:
+            self._last_sample = None  # Not running (yet); don't integrate across the gap
+            return
+        self.peak_memory_bytes = max(self.peak_memory_bytes or 0, memory_total)
+        elapsed = now - self._last_sample if self._last_sample is not None else 0.0
+        self.cpu_seconds = (self.cpu_seconds or 0.0) + cpu_total * elapsed
+        self._last_sample = now
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
@@ -0,0 +1,286 @@
+"""Segmented, resumable HTTP downloads with MD5 verification."""
+
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+from loguru import logger
+from src.utils.sync_index import file_md5
+
+
+CHUNK_SIZE = 1024 * 1024
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+SEGMENT_RETRIES = 3
+STATE_FLUSH_INTERVAL = 2.0
+
+
+def probe_url(url: str, headers: Optional[dict] = None) -> dict:
+    """
+    Issue a HEAD request and report size, range support and validators.
+
+    Args:
+        url: Resource URL
+        headers: Extra request headers
+
+    Returns:
+        Dict with "size" (int or None), "ranges" (bool), "etag" and "last_modified"
+    """
+    with urlopen(Request(url, headers=headers or {}, method="HEAD")) as response:
+        length = response.headers.get("Content-Length")
+        return {
+            "size": int(length) if length else None,
+            "ranges": response.headers.get("Accept-Ranges", "").lower() == "bytes",
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+
+
+def conditional_probe(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Optional[dict]:
+    """
+    Probe a URL with If-None-Match / If-Modified-Since validators.
+
+    Args:
+        url: Resource URL
+        etag: ETag from the previous download
+        last_modified: Last-Modified from the previous download
+
+    Returns:
+        None if the server answers 304 Not Modified, otherwise the probe_url result
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        return probe_url(url, headers)
+    except HTTPError as e:
+        if e.code == 304:
+            return None
+        raise
+
+
+def fetch_published_md5(url: str) -> Optional[str]:
+    """Fetch the checksum published next to a file as <url>.md5, if any."""
+    try:
+        with urlopen(f"{url}.md5") as response:
+            content = response.read().decode("ascii", errors="replace").split()
+    except (HTTPError, URLError) as e:
+        logger.warning(f"No published checksum at {url}.md5: {e}")
+        return None
+    return content[0].lower() if content else None
+
+
+@dataclass
+class DownloadResult:
+    """
+    Outcome of a segmented download.
+
+    Truthy when the file is in place, so callers can keep treating it as a bool.
+    """
+    success: bool = False
+    md5: Optional[str] = None  # set when the file was verified against a published .md5
+
+    def __bool__(self) -> bool:
+        return self.success
+
+
+class SegmentState:
+    """
+    Per-segment progress persisted in a JSON sidecar next to the partial file.
+
+    Each segment is [start, end, done] with an inclusive end offset and the
+    number of bytes already written from start.
+    """
+
+    def __init__(self, path: Path, url: str, size: int, validator: Optional[str], segments: list):
+        self.path = path
+        self.url = url
+        self.size = size
+        self.validator = validator
+        self.segments = segments
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    @classmethod
+    def load_or_create(cls, path: Path, url: str, size: int, validator: Optional[str], count: int) -> "SegmentState":
+        """Resume matching saved progress, or split the file into fresh segments."""
+        if path.exists():
+            try:
+                saved = json.loads(path.read_text())
+                if saved["url"] == url and saved["size"] == size and saved["validator"] == validator:
+                    done = sum(segment[2] for segment in saved["segments"])
+                    logger.info(f"Resuming download: {done / CHUNK_SIZE:.1f} of {size / CHUNK_SIZE:.1f} MB present")
+                    return cls(path, url, size, validator, saved["segments"])
+                logger.info("Upstream file changed since the interrupted download, starting over")
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable download state {path}: {e}")
+
+        count = max(1, min(count, size // MIN_SEGMENT_SIZE or 1))
+        step = -(-size // count)
+        segments = [[start, min(start + step, size) - 1, 0] for start in range(0, size, step)]
+        return cls(path, url, size, validator, segments)
+
+    def advance(self, index: int, nbytes: int):
+        """Record bytes written for a segment and periodically persist progress."""
+        with self._lock:
+            self.segments[index][2] += nbytes
+            if time.monotonic() - self._last_flush >= STATE_FLUSH_INTERVAL:
+                self._flush()
+
+    def save(self):
+        """Persist progress immediately."""
+        with self._lock:
+            self._flush()
+
+    def complete(self) -> bool:
+        """True once every segment has been fully written."""
+        return all(start + done > end for start, end, done in self.segments)
+
+    def _flush(self):
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps({
+            "url": self.url,
+            "size": self.size,
+            "validator": self.validator,
+            "segments": self.segments,
+        }))
+        os.replace(tmp_path, self.path)
+        self._last_flush = time.monotonic()
+
+
+def _download_segment(url: str, fd: int, state: SegmentState, index: int):
+    """Fetch the remaining bytes of one segment with a Range request, retrying on errors."""
+    for attempt in range(1, SEGMENT_RETRIES + 1):
+        start, end, done = state.segments[index]
+        if start + done > end:
+            return
+        request = Request(url, headers={"Range": f"bytes={start + done}-{end}"})
+        try:
+            with urlopen(request) as response:
+                if response.status != 206:
+                    raise RuntimeError(f"Server ignored range request (HTTP {response.status})")
+                offset = start + done
+                while chunk := response.read(CHUNK_SIZE):
+                    os.pwrite(fd, chunk, offset)
+                    offset += len(chunk)
+                    state.advance(index, len(chunk))
+            if state.segments[index][0] + state.segments[index][2] > end:
+                return
+            raise RuntimeError("Connection closed before segment completed")
+        except (HTTPError, URLError, OSError, RuntimeError) as e:
+            if attempt == SEGMENT_RETRIES:
+                raise
+            logger.warning(f"Segment {index} attempt {attempt} failed, retrying: {e}")
+            time.sleep(attempt)
+
+
+def _single_stream_download(url: str, part_file: Path):
+    """Download the whole resource over one connection."""
+    with urlopen(url) as response, open(part_file, "wb") as f:
+        shutil.copyfileobj(response, f, CHUNK_SIZE)
+
+
+def segmented_download(
+    url: str,
+    output_file: str,
+    segments: int = 4,
+    verify_md5: bool = True,
+    info: Optional[dict] = None
+) -> DownloadResult:
+    """
+    Download a URL using concurrent HTTP Range requests into a preallocated file.
+
+    Progress is tracked per segment in "<output>.part.json"; an interrupted run
+    resumes from it as long as the upstream size and ETag/Last-Modified are
+    unchanged. Servers without range support fall back to a single stream.
+    The finished file is checked against the "<url>.md5" checksum when published.
+
+    Args:
+        url: Source URL
+        output_file: Final path of the downloaded file
+        segments: Number of concurrent range requests (1 disables segmentation)
+        verify_md5: Verify against the published .md5 file if available
+        info: probe_url result the caller already has (default: probe the URL)
+
+    Returns:
+        DownloadResult (truthy on success), carrying the MD5 when it was verified
+    """
+    output_path = Path(output_file)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    part_file = output_path.with_name(output_path.name + ".part")
+    state_file = output_path.with_name(output_path.name + ".part.json")
+    start_time = time.monotonic()
+
+    if info is None:
+        try:
+            info = probe_url(url)
+        except (HTTPError, URLError) as e:
+            logger.error(f"Download failed: {e}")
+            return DownloadResult()
+
+    try:
+        if segments > 1 and info["ranges"] and info["size"]:
+            size = info["size"]
+            # Saved progress only describes bytes that are still in the partial file
+            if state_file.exists() and (not part_file.exists() or part_file.stat().st_size != size):
+                logger.info("Partial file missing or resized, discarding saved progress")
+                state_file.unlink()
+                part_file.unlink(missing_ok=True)
+            state = SegmentState.load_or_create(
+                state_file, url, size, info["etag"] or info["last_modified"], segments
+            )
+            logger.info(f"Downloading {size / CHUNK_SIZE:.1f} MB in {len(state.segments)} segments")
+
+            # Preallocate so every segment can write at its own offset
+            with open(part_file, "ab") as f:
+                f.truncate(size)
+            state.save()
+
+            fd = os.open(part_file, os.O_WRONLY)
+            try:
+                with ThreadPoolExecutor(max_workers=len(state.segments)) as executor:
+                    futures = [
+                        executor.submit(_download_segment, url, fd, state, index)
+                        for index in range(len(state.segments))
+                    ]
+                    for future in futures:
+                        future.result()
+            finally:
+                os.close(fd)
+                state.save()
+        else:
+            if segments > 1:
+                logger.info("Server does not support range requests, using a single stream")
+            _single_stream_download(url, part_file)
+    except Exception as e:
+        logger.error(f"Download failed: {e}")
+        return DownloadResult()
+
+    md5 = None
+    if verify_md5:
+        expected = fetch_published_md5(url)
+        if expected:
+            md5 = file_md5(part_file)
+            if md5 != expected:
+                logger.error(f"Checksum mismatch: expected {expected}, got {md5}")
+                part_file.unlink(missing_ok=True)
+                state_file.unlink(missing_ok=True)
+                return DownloadResult()
+            logger.info("Checksum verified against published .md5")
+
+    os.replace(part_file, output_path)
+    state_file.unlink(missing_ok=True)
+
+    elapsed = time.monotonic() - start_time
+    size_mb = output_path.stat().st_size / CHUNK_SIZE
+    rate = size_mb / elapsed if elapsed > 0 else 0.0
+    logger.info(f"Downloaded {size_mb:.2f} MB in {elapsed:.1f}s ({rate:.2f} MB/s)")
+    return DownloadResult(success=True, md5=md5)
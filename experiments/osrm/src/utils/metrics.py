@@ -0,0 +1,200 @@
+"""Prometheus exposition-format metrics for pipeline runs."""
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+from loguru import logger
+
+
+PREFIX = "osrm_pipeline_"
+PUSH_JOB = "osrm_pipeline"
+
+HELP = {
+    "operation_success": "Whether the last run of the operation succeeded (1) or failed (0)",
+    "operation_duration_seconds": "Wall time of the last run of the operation",
+    "operation_last_run_timestamp_seconds": "Unix time the last run of the operation finished",
+    "stage_duration_seconds": "Wall time of a pipeline stage in the last run",
+    "phase_duration_seconds": "Wall time of an OSRM phase within a stage, split at log markers",
+    "stage_cache_hit": "Whether a stage was restored from the stage cache (1) or computed (0)",
+    "container_memory_peak_bytes": "Peak container memory sampled during a docker-compose stage",
+    "container_cpu_seconds": "Container CPU time sampled during a docker-compose stage",
+    "s3_transfer_bytes": "Bytes transferred to or from S3 in the last run",
+    "s3_transfer_files": "Files transferred to or from S3 in the last run",
+    "s3_transfer_duration_seconds": "Wall time spent transferring to or from S3 in the last run",
+    "s3_transfer_throughput_bytes_per_second": "Average S3 throughput in the last run",
+    "input_pbf_bytes": "Size of the input OSM PBF extract",
+    "output_dataset_bytes": "Total size of the processed OSRM dataset",
+    "output_dataset_files": "Number of files in the processed OSRM dataset",
+}
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class MetricsRegistry:
+    """
+    Thread-safe set of gauges describing one pipeline run.
+
+    Every metric is a gauge for the last run, which suits both the node-exporter
+    textfile collector and a push gateway (each run replaces the previous).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Dict[LabelSet, float]] = {}
+
+    def set(self, name: str, value: float, **labels):
+        """Set a gauge sample."""
+        with self._lock:
+            self._samples.setdefault(name, {})[self._key(labels)] = float(value)
+
+    def add(self, name: str, value: float, **labels):
+        """Add to a gauge sample, starting from zero."""
+        key = self._key(labels)
+        with self._lock:
+            samples = self._samples.setdefault(name, {})
+            samples[key] = samples.get(key, 0.0) + float(value)
+
+    def get(self, name: str, **labels) -> Optional[float]:
+        """Return a sample value, if set."""
+        with self._lock:
+            return self._samples.get(name, {}).get(self._key(labels))
+
+    def clear(self):
+        """Drop all samples."""
+        with self._lock:
+            self._samples.clear()
+
+    def render(self) -> str:
+        """Render all samples in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name in sorted(self._samples):
+                full_name = PREFIX + name
+                lines.append(f"# HELP {full_name} {HELP.get(name, name.replace('_', ' '))}")
+                lines.append(f"# TYPE {full_name} gauge")
+                for labels, value in sorted(self._samples[name].items()):
+                    label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels)
+                    sample = f"{full_name}{{{label_text}}}" if label_text else full_name
+                    lines.append(f"{sample} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> bool:
+        """Atomically write the metrics for the node-exporter textfile collector."""
+        target = Path(path)
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(self.render())
+            os.replace(tmp_path, target)
+        except OSError as e:
+            logger.error(f"Failed to write metrics to {target}: {e}")
+            return False
+        logger.info(f"Metrics written to {target}")
+        return True
+
+    def push(self, gateway_url: str, **grouping) -> bool:
+        """Replace this run's metric group on a Prometheus push gateway."""
+        path = f"/metrics/job/{PUSH_JOB}" + "".join(f"/{key}/{value}" for key, value in grouping.items())
+        request = Request(
+            gateway_url.rstrip("/") + path,
+            data=self.render().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4"},
+            method="PUT",
+        )
+        try:
+            with urlopen(request, timeout=10):
+                pass
+        except (HTTPError, URLError, OSError) as e:
+            logger.error(f"Failed to push metrics to {gateway_url}: {e}")
+            return False
+        logger.info(f"Metrics pushed to {gateway_url}{path}")
+        return True
+
+    @staticmethod
+    def _key(labels: dict) -> LabelSet:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+_metrics = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Return the process-wide metrics registry."""
+    return _metrics
+
+
+def record_transfer(direction: str, file_count: int, total_bytes: int, elapsed: float):
+    """Accumulate one S3 transfer batch and refresh the direction's average throughput."""
+    _metrics.add("s3_transfer_files", file_count, direction=direction)
+    _metrics.add("s3_transfer_bytes", total_bytes, direction=direction)
+    _metrics.add("s3_transfer_duration_seconds", elapsed, direction=direction)
+    seconds = _metrics.get("s3_transfer_duration_seconds", direction=direction)
+    if seconds:
+        _metrics.set(
+            "s3_transfer_throughput_bytes_per_second",
+            _metrics.get("s3_transfer_bytes", direction=direction) / seconds,
+            direction=direction,
+        )
+
+
+def record_stage_duration(stage: str, seconds: float, **labels):
+    """Record the wall time of a pipeline stage that is not a docker-compose step."""
+    _metrics.set("stage_duration_seconds", seconds, stage=stage, **labels)
+
+
+def record_stage(stage: str, result, **labels):
+    """Record the timings and resource samples of a docker-compose StepResult."""
+    _metrics.set("stage_duration_seconds", result.duration, stage=stage, **labels)
+    for phase, seconds in result.phases.items():
+        _metrics.set("phase_duration_seconds", seconds, stage=stage, phase=phase, **labels)
+    if result.peak_memory_bytes is not None:
+        _metrics.set("container_memory_peak_bytes", result.peak_memory_bytes, stage=stage, **labels)
+    if result.cpu_seconds is not None:
+        _metrics.set("container_cpu_seconds", result.cpu_seconds, stage=stage, **labels)
+
+
+def record_dataset_sizes(osm_file: Path, processed_dir: Path = Path("data/processed")):
+    """Record the input extract size and the processed dataset size, where present."""
+    if osm_file.exists():
+        _metrics.set("input_pbf_bytes", osm_file.stat().st_size)
+    files = [path for path in processed_dir.glob("*.osrm*") if path.is_file()] if processed_dir.exists() else []
+    if files:
+        _metrics.set("output_dataset_bytes", sum(path.stat().st_size for path in files))
+        _metrics.set("output_dataset_files", len(files))
+
+
+def export_metrics(operation: str, success: bool, duration: float) -> bool:
+    """
+    Record the operation outcome and export metrics where configured.
+
+    METRICS_TEXTFILE names a .prom file for the node-exporter textfile
+    collector; METRICS_PUSHGATEWAY_URL a push gateway to PUT the run to.
+    Nothing is exported when neither is set.
+
+    Returns:
+        False if a configured export failed, True otherwise
+    """
+    _metrics.set("operation_success", 1 if success else 0, operation=operation)
+    _metrics.set("operation_duration_seconds", duration, operation=operation)
+    _metrics.set("operation_last_run_timestamp_seconds", time.time(), operation=operation)
+
+    exported = True
+    textfile = os.getenv("METRICS_TEXTFILE")
+    if textfile:
+        exported = _metrics.write_textfile(textfile) and exported
+    gateway = os.getenv("METRICS_PUSHGATEWAY_URL")
+    if gateway:
+        exported = _metrics.push(gateway, operation=operation) and exported
+    return exported
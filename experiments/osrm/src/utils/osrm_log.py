@@ -0,0 +1,114 @@
+"""Incremental parsing of OSRM tool output into phase timings and progress."""
+
+import re
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+# docker-compose prefixes every container line with "<container>  | "
+COMPOSE_PREFIX = re.compile(r"^[\w.-]+\s+\|\s?")
+# Recent images stamp each line before the level: "[2024-05-08T20:01:02.123456789] [info] ..."
+TIMESTAMP_PREFIX = re.compile(r"^\[\d{4}-\d{2}-\d{2}[T ][\d:.]+\]\s*")
+LEVEL_PREFIX = re.compile(r"^\[(?P<level>\w+)\]\s*")
+
+# Log lines that start a phase; phases end when the next one starts or the tool exits
+PHASE_MARKERS: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r"^Parsing in progress", re.I), "parsing"),
+    (re.compile(r"^Sorting ", re.I), "sorting"),
+    (re.compile(r"^Generating edge-expanded", re.I), "edge expansion"),
+    (re.compile(r"^(Identifying|Computing) (small|strongly connected) components", re.I), "components"),
+    (re.compile(r"^(Constructing|Building) r-tree", re.I), "r-tree"),
+    (re.compile(r"^Load(ing|ed) ", re.I), "loading"),
+    (re.compile(r"^(Running|Computing) (recursive )?bisection", re.I), "bisection"),
+    (re.compile(r"^Renumber", re.I), "renumbering"),
+    (re.compile(r"^(Computing|Customizing) level|^Customizing cells|^Level \d+", re.I), "level computation"),
+    (re.compile(r"^(Writing|Saving) ", re.I), "writing"),
+]
+
+# Durations OSRM prints itself, e.g. "Parsing finished after 12.3 seconds",
+# "Sorting used nodes ... ok, after 0.12s", "Bisection took 31.2 seconds"
+REPORTED_DURATION = re.compile(
+    r"^(?P<name>.+?)[\s.]*(?:finished after|ok, after|took|(?<!\.)\s(?:in|after))\s+"
+    r"(?P<seconds>\d+(?:\.\d+)?)\s*(?:s|sec|seconds?)\b",
+    re.I,
+)
+PERCENT = re.compile(r"(\d{1,3})%")
+
+
+def clean_line(line: str) -> Tuple[str, str]:
+    """Strip the compose container prefix, timestamp and OSRM level tag, returning (level, message)."""
+    message = TIMESTAMP_PREFIX.sub("", COMPOSE_PREFIX.sub("", line.rstrip("\r\n")))
+    match = LEVEL_PREFIX.match(message)
+    if match:
+        return match.group("level").lower(), message[match.end():].strip()
+    return "info", message.strip()
+
+
+def phase_key(text: str) -> str:
+    """Normalize a phase description into a short lowercase key."""
+    return re.sub(r"\s+", " ", text.strip(" .:")).lower()
+
+
+class OsrmLogParser:
+    """
+    Consume OSRM output one line at a time, keeping only aggregated state.
+
+    Phases are timed on the wall clock between marker lines, durations the
+    tools report themselves are collected separately, and percentage
+    progress is recorded against the current phase.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.started = clock()
+        self.phases: Dict[str, float] = {}
+        self.reported: Dict[str, float] = {}
+        self.progress: List[dict] = []
+        self.current: Optional[str] = None
+        self._phase_started = self.started
+
+    def feed(self, line: str) -> List[dict]:
+        """
+        Parse one output line.
+
+        Returns:
+            Event dicts ("phase", "duration" or "progress") recognised in the line
+        """
+        _, message = clean_line(line)
+        now = self.clock()
+        events = []
+
+        for pattern, phase in PHASE_MARKERS:
+            if pattern.search(message):
+                if phase != self.current:
+                    self._close_phase(now)
+                    self.current = phase
+                    self._phase_started = now
+                    events.append({"type": "phase", "phase": phase, "elapsed": now - self.started})
+                break
+
+        match = REPORTED_DURATION.search(message)
+        if match:
+            name = phase_key(match.group("name"))
+            seconds = float(match.group("seconds"))
+            self.reported[name] = self.reported.get(name, 0.0) + seconds
+            events.append({"type": "duration", "phase": name, "seconds": seconds})
+            return events
+
+        percents = PERCENT.findall(message)
+        if percents:
+            percent = min(int(percents[-1]), 100)
+            event = {"type": "progress", "phase": self.current, "percent": percent, "elapsed": now - self.started}
+            self.progress.append(event)
+            events.append(event)
+        return events
+
+    def finish(self) -> Dict[str, float]:
+        """Close the running phase and return the wall-clock phase durations."""
+        self._close_phase(self.clock())
+        self.current = None
+        return self.phases
+
+    def _close_phase(self, now: float):
+        if self.current is not None:
+            self.phases[self.current] = self.phases.get(self.current, 0.0) + now - self._phase_started
@@ -1,12 +1,113 @@
 """S3/MinIO utility functions for file storage operations."""
 
 import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from pathlib import Path
-from typing import Optional, List
+from typing import BinaryIO, Iterator, Optional, List
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError, NoCredentialsError
 from dotenv import load_dotenv
 from loguru import logger
+from src.utils.metrics import record_transfer
+from src.utils.sync_index import SyncIndex
+
+
+MB = 1024 * 1024
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read a positive integer from the environment, falling back to default."""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        parsed = int(value)
+    except ValueError:
+        logger.warning(f"Ignoring invalid {name}={value!r}, using {default}")
+        return default
+    return parsed if parsed > 0 else default
+
+
+_env_lock = threading.Lock()
+_env_loaded = False
+
+_client_lock = threading.Lock()
+_clients = {}
+
+_storage_lock = threading.Lock()
+_storage = None
+
+
+def load_env_once():
+    """Load the .env file the first time it is needed in this process."""
+    global _env_loaded
+    with _env_lock:
+        if not _env_loaded:
+            load_dotenv()
+            _env_loaded = True
+
+
+def get_s3_client(
+    endpoint: str,
+    access_key: str,
+    secret_key: str,
+    region: str,
+    max_pool_connections: int,
+    tcp_keepalive: bool = True
+):
+    """
+    Return the process-wide boto3 S3 client for a connection configuration.
+    
+    Clients are created once per distinct configuration, each from its own
+    session (session construction is not thread-safe), and shared afterwards
+    so every caller reuses the same warm connection pool. boto3 clients are
+    safe to use from multiple threads.
+    
+    Args:
+        endpoint: Endpoint URL including protocol
+        access_key: Access key ID
+        secret_key: Secret access key
+        region: Region name
+        max_pool_connections: Size of the client's HTTP connection pool
+        tcp_keepalive: Enable TCP keep-alive on pooled connections
+    
+    Returns:
+        Shared boto3 S3 client
+    """
+    key = (endpoint, access_key, secret_key, region, max_pool_connections, tcp_keepalive)
+    with _client_lock:
+        client = _clients.get(key)
+        if client is None:
+            logger.debug(f"Creating S3 client for {endpoint} (pool size {max_pool_connections})")
+            session = boto3.session.Session()
+            client = session.client(
+                "s3",
+                endpoint_url=endpoint,
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                region_name=region,
+                use_ssl=False if endpoint.startswith("http://") else True,
+                verify=False,
+                config=Config(
+                    max_pool_connections=max_pool_connections,
+                    tcp_keepalive=tcp_keepalive
+                )
+            )
+            _clients[key] = client
+        return client
+
+
+def get_storage() -> "S3Storage":
+    """Return the process-wide S3Storage instance, creating it on first use."""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = S3Storage()
+        return _storage
 
 
 class S3Storage:
@@ -14,7 +115,7 @@ class S3Storage:
     
     def __init__(self):
         """Initialize S3 client with credentials from environment."""
-        load_dotenv()
+        load_env_once()
         
         self.endpoint = os.getenv("S3_ENDPOINT")
         self.access_key = os.getenv("S3_ACCESS_KEY")
@@ -22,6 +123,20 @@ class S3Storage:
         self.bucket = os.getenv("S3_BUCKET", "dev")
         self.region = os.getenv("S3_REGION", "us-east-1")
         
+        # Transfer tuning: files in flight, parts in flight per file, part size
+        self.upload_workers = _env_int("S3_UPLOAD_WORKERS", 4)
+        self.download_workers = _env_int("S3_DOWNLOAD_WORKERS", 8)
+        self.multipart_concurrency = _env_int("S3_MULTIPART_CONCURRENCY", 8)
+        self.multipart_chunksize = _env_int("S3_MULTIPART_CHUNKSIZE_MB", 64) * MB
+        self.multipart_threshold = _env_int("S3_MULTIPART_THRESHOLD_MB", 64) * MB
+        
+        # Connection pool: by default enough for every worker's part transfers
+        self.max_pool_connections = _env_int(
+            "S3_MAX_POOL_CONNECTIONS",
+            max(self.upload_workers, self.download_workers) * self.multipart_concurrency
+        )
+        self.tcp_keepalive = os.getenv("S3_TCP_KEEPALIVE", "true").lower() not in ("0", "false", "no")
+        
         if not all([self.endpoint, self.access_key, self.secret_key]):
             raise ValueError("Missing required S3 credentials in environment")
         
@@ -29,28 +144,43 @@ class S3Storage:
         if not self.endpoint.startswith(("http://", "https://")):
             self.endpoint = f"http://{self.endpoint}"
         
-        # Create S3 client
-        self.client = boto3.client(
-            "s3",
-            endpoint_url=self.endpoint,
-            aws_access_key_id=self.access_key,
-            aws_secret_access_key=self.secret_key,
-            region_name=self.region,
-            use_ssl=False if self.endpoint.startswith("http://") else True,
-            verify=False
+        self.transfer_config = TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.multipart_chunksize,
+            max_concurrency=self.multipart_concurrency,
+            use_threads=True
+        )
+        
+        # Shared client: instances with the same configuration reuse one pool
+        self.client = get_s3_client(
+            self.endpoint,
+            self.access_key,
+            self.secret_key,
+            self.region,
+            self.max_pool_connections,
+            self.tcp_keepalive
         )
     
-    def upload_file(self, local_path: str, s3_key: str) -> bool:
+    def upload_file(self, local_path: str, s3_key: str, metadata: Optional[dict] = None) -> bool:
         """
         Upload a file to S3.
         
         Args:
             local_path: Path to local file
             s3_key: S3 object key (path in bucket)
+            metadata: Optional user metadata stored with the object
         
         Returns:
             True if successful, False otherwise
         """
+        start = time.monotonic()
+        success = self._upload_file(local_path, s3_key, metadata)
+        if success:
+            log_throughput("upload", "Uploaded", 1, Path(local_path).stat().st_size, time.monotonic() - start)
+        return success
+    
+    def _upload_file(self, local_path: str, s3_key: str, metadata: Optional[dict] = None) -> bool:
+        """Upload a file without recording it as a transfer batch of its own."""
         try:
             local_file = Path(local_path)
             if not local_file.exists():
@@ -58,7 +188,13 @@ class S3Storage:
                 return False
             
             logger.info(f"Uploading {local_file} to s3://{self.bucket}/{s3_key}")
-            self.client.upload_file(str(local_file), self.bucket, s3_key)
+            self.client.upload_file(
+                str(local_file),
+                self.bucket,
+                s3_key,
+                ExtraArgs={"Metadata": metadata} if metadata else None,
+                Config=self.transfer_config
+            )
             logger.success("Upload successful")
             return True
             
@@ -69,32 +205,193 @@ class S3Storage:
             logger.error(f"Unexpected error during upload: {e}")
             return False
     
-    def upload_directory(self, local_dir: str, s3_prefix: str) -> int:
+    def upload_stream(
+        self,
+        stream: BinaryIO,
+        s3_key: str,
+        part_size: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        metadata: Optional[dict] = None
+    ) -> bool:
+        """
+        Upload a readable byte stream to S3 as a multipart upload.
+        
+        The stream is read one part at a time while earlier parts are still
+        uploading, so reading (e.g. from an HTTP response) and uploading overlap.
+        At most max_in_flight parts are buffered, which bounds memory to roughly
+        (max_in_flight + 1) * part_size regardless of the stream length.
+        
+        Args:
+            stream: Object with a read(size) method returning bytes
+            s3_key: S3 object key
+            part_size: Bytes per part (default: S3_MULTIPART_CHUNKSIZE_MB, minimum 5 MB on S3)
+            max_in_flight: Parts uploading concurrently (default: S3_MULTIPART_CONCURRENCY)
+            metadata: Optional user metadata stored with the object
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        part_size = part_size or self.multipart_chunksize
+        max_in_flight = max_in_flight or self.multipart_concurrency
+        slots = threading.BoundedSemaphore(max_in_flight)
+        
+        logger.info(f"Streaming upload to s3://{self.bucket}/{s3_key} ({part_size // MB} MB parts)")
+        try:
+            upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=s3_key, Metadata=metadata or {}
+            )["UploadId"]
+        except ClientError as e:
+            logger.error(f"Failed to start multipart upload: {e}")
+            return False
+        
+        def upload_part(part_number: int, body: bytes) -> dict:
+            try:
+                response = self.client.upload_part(
+                    Bucket=self.bucket,
+                    Key=s3_key,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=body
+                )
+                return {"PartNumber": part_number, "ETag": response["ETag"]}
+            finally:
+                slots.release()
+        
+        total_bytes = 0
+        start = time.monotonic()
+        try:
+            futures = []
+            with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+                part_number = 1
+                while True:
+                    slots.acquire()
+                    body = read_exact(stream, part_size)
+                    if not body and part_number > 1:
+                        slots.release()
+                        break
+                    futures.append(executor.submit(upload_part, part_number, body))
+                    total_bytes += len(body)
+                    part_number += 1
+                    if len(body) < part_size:
+                        break
+                    
+                    # Fail fast instead of draining the stream after an error
+                    failed = [future for future in futures if future.done() and future.exception()]
+                    if failed:
+                        raise failed[0].exception()
+            
+            parts = [future.result() for future in futures]
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=s3_key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts}
+            )
+        except Exception as e:
+            logger.error(f"Streaming upload failed, aborting: {e}")
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=s3_key, UploadId=upload_id)
+            except ClientError as abort_error:
+                logger.warning(f"Failed to abort multipart upload {upload_id}: {abort_error}")
+            return False
+        
+        log_throughput("upload", "Streamed", 1, total_bytes, time.monotonic() - start)
+        return True
+    
+    def upload_directory(
+        self,
+        local_dir: str,
+        s3_prefix: str,
+        max_workers: Optional[int] = None,
+        index: Optional[SyncIndex] = None,
+        files: Optional[List[str]] = None
+    ) -> int:
         """
-        Upload entire directory to S3.
+        Upload entire directory to S3 using a pool of concurrent workers.
+        
+        Each worker uploads one file at a time; large files are additionally
+        split into parts according to the storage transfer config. With a sync
+        index, files whose content already matches the remote object are skipped.
         
         Args:
             local_dir: Path to local directory
             s3_prefix: S3 prefix for uploaded files
+            max_workers: Number of files uploaded in parallel (default: S3_UPLOAD_WORKERS)
+            index: Optional sync index enabling delta uploads
+            files: Only upload these files inside local_dir (default: all files)
         
         Returns:
-            Number of files uploaded successfully
+            Number of files uploaded successfully or already in sync, or 0 if
+            the listing or any upload failed
         """
         local_path = Path(local_dir)
         if not local_path.exists() or not local_path.is_dir():
             logger.error(f"Directory not found: {local_dir}")
             return 0
         
-        uploaded = 0
-        for file_path in local_path.rglob("*"):
-            if file_path.is_file():
+        if files is None:
+            files = [file_path for file_path in local_path.rglob("*") if file_path.is_file()]
+        else:
+            files = [Path(file_path) for file_path in files]
+        workers = max_workers or self.upload_workers
+        logger.info(f"Uploading {len(files)} files with {workers} workers")
+        
+        # One paginated listing replaces a HEAD per file when syncing
+        remote = {}
+        if index is not None:
+            try:
+                remote = {obj["Key"]: obj for obj in self.iter_objects(f"{s3_prefix}/")}
+            except ClientError as e:
+                logger.error(f"Failed to list {s3_prefix}/: {e}")
+                return 0
+        
+        def upload_one(file_path: Path, s3_key: str) -> Optional[str]:
+            if index is not None and index.in_sync(self.bucket, s3_key, str(file_path), remote.get(s3_key)):
+                return "skipped"
+            return "uploaded" if self._upload_file(str(file_path), s3_key) else None
+        
+        uploaded = {}
+        uploaded_bytes = 0
+        skipped = 0
+        failed = 0
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for file_path in files:
                 relative_path = file_path.relative_to(local_path)
                 s3_key = f"{s3_prefix}/{relative_path}".replace("\\", "/")
-                if self.upload_file(str(file_path), s3_key):
-                    uploaded += 1
+                futures[executor.submit(upload_one, file_path, s3_key)] = (file_path, s3_key)
+            
+            for future in as_completed(futures):
+                file_path, s3_key = futures[future]
+                result = future.result()
+                if result == "uploaded":
+                    uploaded[s3_key] = file_path
+                    uploaded_bytes += file_path.stat().st_size
+                elif result == "skipped":
+                    skipped += 1
+                else:
+                    failed += 1
+                    logger.error(f"Failed to upload {file_path}")
+        
+        log_throughput("upload", "Uploaded", len(uploaded), uploaded_bytes, time.monotonic() - start)
         
-        logger.info(f"Uploaded {uploaded} files from {local_dir}")
-        return uploaded
+        if index is not None:
+            logger.info(f"Skipped {skipped} unchanged files")
+            if uploaded:
+                # Record the ETags S3 assigned, again from a single listing
+                try:
+                    for obj in self.iter_objects(f"{s3_prefix}/"):
+                        if obj["Key"] in uploaded:
+                            index.record(self.bucket, obj["Key"], str(uploaded[obj["Key"]]), obj["ETag"])
+                except ClientError as e:
+                    # Unrecorded files are only uploaded again on the next sync
+                    logger.warning(f"Failed to record uploaded ETags: {e}")
+        
+        if failed:
+            logger.error(f"{failed} files failed to upload to {s3_prefix}, upload incomplete")
+            return 0
+        return len(uploaded) + skipped
     
     def download_file(self, s3_key: str, local_path: str) -> bool:
         """
@@ -107,12 +404,22 @@ class S3Storage:
         Returns:
             True if successful, False otherwise
         """
+        start = time.monotonic()
+        success = self._download_file(s3_key, local_path)
+        if success:
+            log_throughput("download", "Downloaded", 1, Path(local_path).stat().st_size, time.monotonic() - start)
+        return success
+    
+    def _download_file(self, s3_key: str, local_path: str) -> bool:
+        """Download a file without recording it as a transfer batch of its own."""
         try:
             local_file = Path(local_path)
             local_file.parent.mkdir(parents=True, exist_ok=True)
             
             logger.info(f"Downloading s3://{self.bucket}/{s3_key} to {local_file}")
-            self.client.download_file(self.bucket, s3_key, str(local_file))
+            self.client.download_file(
+                self.bucket, s3_key, str(local_file), Config=self.transfer_config
+            )
             logger.success("Download successful")
             return True
             
@@ -126,6 +433,166 @@ class S3Storage:
             logger.error(f"Unexpected error during download: {e}")
             return False
     
+    def download_directory(
+        self,
+        s3_prefix: str,
+        local_dir: str,
+        max_workers: Optional[int] = None,
+        index: Optional[SyncIndex] = None
+    ) -> int:
+        """
+        Download every object under a prefix using a bounded pool of workers.
+        
+        Keys are streamed from the paginated listing straight into the pool, so
+        downloads start before the listing finishes and at most twice the worker
+        count of downloads are queued at any time. With a sync index, objects
+        whose local copy already matches are skipped.
+        
+        Args:
+            s3_prefix: S3 prefix to download (without trailing slash)
+            local_dir: Local directory mirroring the prefix
+            max_workers: Number of files downloaded in parallel (default: S3_DOWNLOAD_WORKERS)
+            index: Optional sync index enabling delta downloads
+        
+        Returns:
+            Number of files downloaded successfully or already in sync, or 0 if
+            the listing or any download failed (a partial copy is not a restore)
+        """
+        local_path = Path(local_dir)
+        workers = max_workers or self.download_workers
+        prefix = s3_prefix.rstrip("/") + "/"
+        
+        def download_one(obj: dict, local_file: Path) -> Optional[str]:
+            if index is not None and index.in_sync(self.bucket, obj["Key"], str(local_file), obj):
+                return "skipped"
+            if not self._download_file(obj["Key"], str(local_file)):
+                return None
+            if index is not None:
+                index.record(self.bucket, obj["Key"], str(local_file), obj["ETag"])
+            return "downloaded"
+        
+        downloaded = 0
+        downloaded_bytes = 0
+        skipped = 0
+        failed = 0
+        pending = {}
+        start = time.monotonic()
+        
+        def collect(done):
+            nonlocal downloaded, downloaded_bytes, skipped, failed
+            for future in done:
+                obj = pending.pop(future)
+                result = future.result()
+                if result == "downloaded":
+                    downloaded += 1
+                    downloaded_bytes += obj.get("Size", 0)
+                elif result == "skipped":
+                    skipped += 1
+                else:
+                    failed += 1
+                    logger.error(f"Failed to download {obj['Key']}")
+        
+        listing_error = None
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                for obj in self.iter_objects(prefix):
+                    key = obj["Key"]
+                    relative_path = key[len(prefix):]
+                    if not relative_path or key.endswith("/"):
+                        continue  # Folder marker
+                    
+                    if len(pending) >= workers * 2:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    
+                    local_file = local_path / relative_path
+                    pending[executor.submit(download_one, obj, local_file)] = obj
+            except ClientError as e:
+                listing_error = e
+            
+            collect(list(as_completed(pending)))
+        
+        log_throughput("download", "Downloaded", downloaded, downloaded_bytes, time.monotonic() - start)
+        if index is not None:
+            logger.info(f"Skipped {skipped} unchanged files")
+        if listing_error is not None:
+            logger.error(f"Failed to list {prefix}, download incomplete: {listing_error}")
+            return 0
+        if failed:
+            logger.error(f"{failed} files failed to download from {s3_prefix}, download incomplete")
+            return 0
+        return downloaded + skipped
+    
+    def sync_upload_file(self, local_path: str, s3_key: str, index: SyncIndex) -> bool:
+        """
+        Upload a single file only if its content differs from the S3 object.
+        
+        Args:
+            local_path: Path to local file
+            s3_key: S3 object key
+            index: Sync index recording transferred state
+        
+        Returns:
+            True if the object is in sync afterwards, False otherwise
+        """
+        info = self.get_file_info(s3_key)
+        remote = {"Size": info["size"], "ETag": info["etag"]} if info else None
+        if index.in_sync(self.bucket, s3_key, local_path, remote):
+            logger.info(f"Unchanged, skipping upload: s3://{self.bucket}/{s3_key}")
+            return True
+        
+        if not self.upload_file(local_path, s3_key):
+            return False
+        
+        info = self.get_file_info(s3_key)
+        index.record(self.bucket, s3_key, local_path, info["etag"] if info else None)
+        return True
+    
+    def sync_download_file(self, s3_key: str, local_path: str, index: SyncIndex) -> bool:
+        """
+        Download a single object only if the local copy differs from it.
+        
+        Args:
+            s3_key: S3 object key
+            local_path: Path to save file locally
+            index: Sync index recording transferred state
+        
+        Returns:
+            True if the local file is in sync afterwards, False otherwise
+        """
+        info = self.get_file_info(s3_key)
+        if info is None:
+            logger.error(f"Object not found: {s3_key}")
+            return False
+        
+        remote = {"Size": info["size"], "ETag": info["etag"]}
+        if index.in_sync(self.bucket, s3_key, local_path, remote):
+            logger.info(f"Unchanged, skipping download: {local_path}")
+            return True
+        
+        if not self.download_file(s3_key, local_path):
+            return False
+        
+        index.record(self.bucket, s3_key, local_path, info["etag"])
+        return True
+    
+    def iter_objects(self, prefix: str = "") -> Iterator[dict]:
+        """
+        Yield object summaries under a prefix, following continuation tokens.
+        
+        Args:
+            prefix: S3 prefix to filter objects
+        
+        Yields:
+            Object dicts as returned by list_objects_v2 (Key, Size, ETag, ...)
+        
+        Raises:
+            ClientError: If any page fails, so a listing is never silently truncated
+        """
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            yield from page.get("Contents", [])
+    
     def list_files(self, prefix: str = "") -> List[str]:
         """
         List files in S3 bucket with optional prefix.
@@ -134,23 +601,68 @@ class S3Storage:
             prefix: S3 prefix to filter objects
         
         Returns:
-            List of S3 object keys
+            List of S3 object keys (all pages), or an empty list if listing failed
         """
         try:
-            response = self.client.list_objects_v2(
-                Bucket=self.bucket,
-                Prefix=prefix
-            )
-            
-            if "Contents" not in response:
-                return []
-            
-            return [obj["Key"] for obj in response["Contents"]]
-            
+            return [obj["Key"] for obj in self.iter_objects(prefix)]
         except ClientError as e:
             logger.error(f"Failed to list files: {e}")
             return []
     
+    def read_object(self, s3_key: str) -> Optional[bytes]:
+        """
+        Read a small object fully into memory.
+        
+        Args:
+            s3_key: S3 object key
+        
+        Returns:
+            Object body, or None if not found
+        """
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=s3_key)["Body"].read()
+        except ClientError:
+            return None
+    
+    def write_object(self, s3_key: str, body: bytes) -> bool:
+        """
+        Write a small object from memory.
+        
+        Args:
+            s3_key: S3 object key
+            body: Object content
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            self.client.put_object(Bucket=self.bucket, Key=s3_key, Body=body)
+            return True
+        except ClientError as e:
+            logger.error(f"Failed to write object: {e}")
+            return False
+    
+    def get_stream(self, s3_key: str, start: Optional[int] = None, end: Optional[int] = None):
+        """
+        Open an object (or an inclusive byte range of it) as a readable stream.
+        
+        Args:
+            s3_key: S3 object key
+            start: First byte offset of a ranged read
+            end: Last byte offset of a ranged read (inclusive)
+        
+        Returns:
+            botocore StreamingBody, or None if not found
+        """
+        kwargs = {"Bucket": self.bucket, "Key": s3_key}
+        if start is not None:
+            kwargs["Range"] = f"bytes={start}-{'' if end is None else end}"
+        try:
+            return self.client.get_object(**kwargs)["Body"]
+        except ClientError as e:
+            logger.error(f"Failed to open s3://{self.bucket}/{s3_key}: {e}")
+            return None
+    
     def file_exists(self, s3_key: str) -> bool:
         """
         Check if file exists in S3.
@@ -222,26 +734,50 @@ class S3Storage:
                 "size": response["ContentLength"],
                 "last_modified": response["LastModified"],
                 "etag": response["ETag"],
-                "content_type": response.get("ContentType", "unknown")
+                "content_type": response.get("ContentType", "unknown"),
+                "metadata": response.get("Metadata", {})
             }
         except ClientError:
             return None
 
 
+def read_exact(stream: BinaryIO, size: int) -> bytes:
+    """Read up to size bytes, looping over short reads until EOF."""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def log_throughput(direction: str, action: str, file_count: int, total_bytes: int, elapsed: float):
+    """Log aggregate file count, volume and throughput for a batch transfer and record it as direction's metrics."""
+    record_transfer(direction, file_count, total_bytes, elapsed)
+    size_mb = total_bytes / MB
+    rate = size_mb / elapsed if elapsed > 0 else 0.0
+    logger.info(
+        f"{action} {file_count} files ({size_mb:.2f} MB) in {elapsed:.1f}s ({rate:.2f} MB/s)"
+    )
+
+
 # Convenience functions for direct use
 def upload_to_s3(local_path: str, s3_key: str) -> bool:
     """Upload a file to S3."""
-    storage = S3Storage()
+    storage = get_storage()
     return storage.upload_file(local_path, s3_key)
 
 
 def download_from_s3(s3_key: str, local_path: str) -> bool:
     """Download a file from S3."""
-    storage = S3Storage()
+    storage = get_storage()
     return storage.download_file(s3_key, local_path)
 
 
 def list_s3_files(prefix: str = "") -> List[str]:
     """List files in S3 bucket."""
-    storage = S3Storage()
+    storage = get_storage()
     return storage.list_files(prefix)
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""Dependency-ordered task execution under a shared memory budget."""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Union
+from loguru import logger
+from src.utils.budget import ResourceBudget
+
+
+@dataclass
+class Task:
+    """
+    One node of a task DAG.
+
+    memory_gb may be a callable so the estimate can use what earlier tasks
+    produced (e.g. the size of a downloaded extract); it is evaluated once,
+    when the task's dependencies have succeeded.
+    """
+    name: str
+    run: Callable[[], bool]
+    deps: List[str] = field(default_factory=list)
+    memory_gb: Union[float, Callable[[], float]] = 0.0
+    cpus: float = 0.0
+
+    def estimate_memory_gb(self) -> float:
+        return float(self.memory_gb() if callable(self.memory_gb) else self.memory_gb)
+
+
+class DagScheduler:
+    """
+    Run a DAG of tasks concurrently, admitting a task only when its estimated
+    memory fits next to the tasks already running.
+
+    Ready tasks are considered largest first, so a big task starts as soon as
+    the budget frees up, and smaller ones fill the remaining room. A task that
+    fails (or raises) fails every task depending on it; independent branches
+    carry on.
+    """
+
+    def __init__(self, budget: ResourceBudget, max_workers: int = 4):
+        self.budget = budget
+        self.max_workers = max_workers
+
+    def run(self, tasks: List[Task]) -> Dict[str, bool]:
+        """
+        Run all tasks.
+
+        Returns:
+            Task name -> True if it succeeded, False if it failed or was skipped
+        """
+        by_name = {task.name: task for task in tasks}
+        if len(by_name) != len(tasks):
+            raise ValueError("Task names must be unique")
+        for task in tasks:
+            missing = [dep for dep in task.deps if dep not in by_name]
+            if missing:
+                raise ValueError(f"Task {task.name} depends on unknown tasks: {', '.join(missing)}")
+
+        pending = dict(by_name)
+        estimates: Dict[str, float] = {}
+        results: Dict[str, bool] = {}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dag") as executor:
+            while pending or running:
+                for name, task in list(pending.items()):
+                    if any(results.get(dep) is False for dep in task.deps):
+                        logger.warning(f"Skipping {name}: a dependency failed")
+                        results[name] = False
+                        del pending[name]
+
+                ready = [task for task in pending.values() if all(results.get(dep) for dep in task.deps)]
+                for task in ready:
+                    if task.name not in estimates:
+                        estimates[task.name] = self._estimate(task)
+                ready.sort(key=lambda task: estimates[task.name], reverse=True)
+
+                for task in ready:
+                    if len(running) >= self.max_workers:
+                        break
+                    if self.budget.acquire(task.cpus, estimates[task.name], blocking=False):
+                        del pending[task.name]
+                        running[executor.submit(self._run_task, task, estimates[task.name])] = task
+
+                if not running:
+                    # Requests are clamped to the budget, so an idle budget admits any ready task
+                    for name in pending:
+                        logger.error(f"Task {name} never became ready (dependency cycle)")
+                        results[name] = False
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    self.budget.release(task.cpus, estimates[task.name])
+                    results[task.name] = future.result()
+
+        return results
+
+    def _estimate(self, task: Task) -> float:
+        try:
+            return task.estimate_memory_gb()
+        except Exception as e:
+            logger.warning(f"Memory estimate for {task.name} failed ({e}), reserving the whole budget")
+            return self.budget.memory_gb
+
+    def _run_task(self, task: Task, memory_gb: float) -> bool:
+        logger.info(
+            f"Starting {task.name} (~{memory_gb:.1f} GiB, "
+            f"{self.budget.used_memory_gb:.1f}/{self.budget.memory_gb:.0f} GiB reserved)"
+        )
+        start = time.monotonic()
+        try:
+            success = bool(task.run())
+        except Exception as e:
+            logger.error(f"{task.name} raised: {e}")
+            success = False
+        elapsed = time.monotonic() - start
+        if success:
+            logger.success(f"Finished {task.name} in {elapsed:.1f}s")
+        else:
+            logger.error(f"{task.name} failed after {elapsed:.1f}s")
+        return success
@@ -0,0 +1,91 @@
+"""Zero-copy staging of pipeline artifacts between data directories."""
+
+import errno
+import os
+import shutil
+from pathlib import Path
+from typing import Iterable, List
+from loguru import logger
+
+
+def _temp_name(target: Path) -> Path:
+    return target.with_name(f".{target.name}.{os.getpid()}.staging")
+
+
+def link_or_copy(source: Path, target: Path) -> str:
+    """
+    Make target a hard link to source, copying only across filesystems.
+
+    The new entry appears atomically under a temporary name first, so target
+    is never seen half-written and a previous target is replaced in one step.
+
+    Returns:
+        "link" or "copy"
+    """
+    source, target = Path(source), Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if target.exists() and os.path.samefile(source, target):
+        return "link"
+    temp = _temp_name(target)
+    temp.unlink(missing_ok=True)
+    try:
+        os.link(source, temp)
+        method = "link"
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+        shutil.copy2(source, temp)
+        method = "copy"
+    os.replace(temp, target)
+    return method
+
+
+def detach(path: Path) -> bool:
+    """
+    Give a hard-linked file its own inode before it is rewritten in place.
+
+    Tools that truncate and rewrite a file would otherwise change every other
+    name of it too (e.g. the promoted copy in data/processed).
+
+    Returns:
+        True if the file had other links and was copied
+    """
+    path = Path(path)
+    if not path.exists() or path.stat().st_nlink < 2:
+        return False
+    temp = _temp_name(path)
+    shutil.copy2(path, temp)
+    os.replace(temp, path)
+    return True
+
+
+def promote(files: Iterable[Path], target_dir: Path) -> bool:
+    """
+    Link files into target_dir and check every one of them arrived intact.
+
+    Returns:
+        True if every file is present in target_dir with its source size
+    """
+    files = [Path(path) for path in files]
+    target_dir = Path(target_dir)
+    methods = {"link": 0, "copy": 0}
+    for path in files:
+        methods[link_or_copy(path, target_dir / path.name)] += 1
+    if methods["copy"]:
+        logger.warning(f"{methods['copy']} files copied to {target_dir} (different filesystem)")
+    logger.info(f"Promoted {len(files)} files to {target_dir} ({methods['link']} hard links)")
+
+    missing = missing_artifacts(target_dir, [path.name for path in files])
+    mismatched = [
+        path.name for path in files
+        if path.name not in missing and (target_dir / path.name).stat().st_size != path.stat().st_size
+    ]
+    if missing or mismatched:
+        logger.error(f"Promotion to {target_dir} incomplete: missing {missing}, size mismatch {mismatched}")
+        return False
+    return True
+
+
+def missing_artifacts(directory: Path, names: Iterable[str]) -> List[str]:
+    """Return the expected file names not present in directory."""
+    return sorted(name for name in names if not (Path(directory) / name).is_file())
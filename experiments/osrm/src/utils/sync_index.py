@@ -0,0 +1,160 @@
+"""Local SQLite index of synced S3 objects for delta transfers."""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+from loguru import logger
+
+
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def file_md5(path: Path) -> str:
+    """Return the hex MD5 of a file, read in fixed-size chunks."""
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def normalize_etag(etag: Optional[str]) -> Optional[str]:
+    """Strip the quotes S3 puts around ETag values."""
+    return etag.strip('"') if etag else etag
+
+
+class SyncIndex:
+    """
+    Record of the last known state of each synced (key, local file) pair.
+
+    A row stores the object size and ETag seen in S3 together with the local
+    file's size, mtime and MD5 at the time of the last successful transfer.
+    A file only needs transferring again when either side has moved away from
+    that recorded state and the content actually differs.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        """Open (or create) the index database."""
+        self.db_path = Path(db_path or os.getenv("S3_SYNC_INDEX", "data/.s3_sync_index.sqlite"))
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._hash_cache = {}
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS objects (
+                bucket TEXT NOT NULL,
+                s3_key TEXT NOT NULL,
+                local_path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                mtime_ns INTEGER NOT NULL,
+                md5 TEXT NOT NULL,
+                PRIMARY KEY (bucket, s3_key, local_path)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def close(self):
+        """Close the database connection."""
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, bucket: str, s3_key: str, local_path: str) -> Optional[dict]:
+        """Return the recorded state for a key/file pair, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, etag, mtime_ns, md5 FROM objects "
+                "WHERE bucket = ? AND s3_key = ? AND local_path = ?",
+                (bucket, s3_key, str(local_path))
+            ).fetchone()
+        if row is None:
+            return None
+        return {"size": row[0], "etag": row[1], "mtime_ns": row[2], "md5": row[3]}
+
+    def record(self, bucket: str, s3_key: str, local_path: str, etag: Optional[str], md5: Optional[str] = None):
+        """Store the current state of a key/file pair after a transfer."""
+        local_file = Path(local_path)
+        stat = local_file.stat()
+        etag = normalize_etag(etag)
+        if md5 is None and etag and "-" not in etag:
+            md5 = etag  # Single-part ETag is the content MD5
+        md5 = md5 or self.local_md5(bucket, s3_key, local_path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO objects (bucket, s3_key, local_path, size, etag, mtime_ns, md5) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (bucket, s3_key, str(local_path), stat.st_size, etag, stat.st_mtime_ns, md5)
+            )
+            self._conn.commit()
+
+    def local_md5(self, bucket: str, s3_key: str, local_path: str) -> str:
+        """
+        Return the local file's MD5, reusing the recorded hash when the file's
+        size and mtime are unchanged since it was last recorded.
+        """
+        local_file = Path(local_path)
+        stat = local_file.stat()
+        cache_key = (str(local_path), stat.st_size, stat.st_mtime_ns)
+        if cache_key in self._hash_cache:
+            return self._hash_cache[cache_key]
+
+        entry = self.get(bucket, s3_key, local_path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            md5 = entry["md5"]
+        else:
+            md5 = file_md5(local_file)
+        self._hash_cache[cache_key] = md5
+        return md5
+
+    def in_sync(self, bucket: str, s3_key: str, local_path: str, remote: Optional[dict]) -> bool:
+        """
+        Decide whether a local file and its S3 object hold the same content.
+
+        Args:
+            bucket: Bucket name
+            s3_key: S3 object key
+            local_path: Local file path
+            remote: Remote object summary with "Size" and "ETag", or None if missing
+
+        Returns:
+            True if no transfer is needed in either direction
+        """
+        local_file = Path(local_path)
+        if remote is None or not local_file.exists():
+            return False
+
+        if local_file.stat().st_size != remote["Size"]:
+            return False
+
+        remote_etag = normalize_etag(remote["ETag"])
+        md5 = self.local_md5(bucket, s3_key, local_path)
+        entry = self.get(bucket, s3_key, local_path)
+
+        # Same content as recorded, and the object has not been replaced since
+        in_sync = bool(entry and entry["md5"] == md5 and entry["etag"] == remote_etag)
+
+        # Single-part ETags are the content MD5, so an unindexed match is still a match
+        in_sync = in_sync or remote_etag == md5
+
+        if in_sync:
+            self._refresh(bucket, s3_key, local_path, remote_etag, md5)
+        return in_sync
+
+    def _refresh(self, bucket: str, s3_key: str, local_path: str, etag: str, md5: str):
+        """Re-record an unchanged pair so later runs can skip hashing it."""
+        entry = self.get(bucket, s3_key, local_path)
+        stat = Path(local_path).stat()
+        if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["etag"] == etag:
+            return
+        logger.debug(f"Sync index refreshed for {s3_key}")
+        self.record(bucket, s3_key, local_path, etag, md5)
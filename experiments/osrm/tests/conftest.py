@@ -0,0 +1,140 @@
+"""Fixtures shared by the test modules: local HTTP servers and a fake docker-compose."""
+
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import pytest
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """Static file handler that keeps request logging out of test output."""
+    
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_directory(handler_class):
+    """Serve a temporary directory over HTTP and yield (directory, base_url, server)."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        handler = partial(handler_class, directory=temp_dir)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.bytes_served = 0
+        server.head_requests = 0
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield Path(temp_dir), f"http://127.0.0.1:{server.server_address[1]}", server
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+ROUTE = {
+    "code": "Ok",
+    "routes": [{
+        "distance": 1500.5, "duration": 120.0, "weight": 130.0,
+        "geometry": {"type": "LineString", "coordinates": [[-122.42, 37.77], [-122.3, 37.8], [-122.27, 37.8]]},
+        "legs": [
+            {"distance": 1000.0, "duration": 80.0, "annotation": {"duration": [30, 50], "nodes": [1, 2, 3]}},
+            {"distance": 500.5, "duration": 40.0, "annotation": {"duration": [40], "nodes": [3, 4]}},
+        ],
+    }],
+    "waypoints": [
+        {"location": [-122.42, 37.77], "distance": 1.5, "name": "Market"},
+        {"location": [-122.3, 37.8], "distance": 0.5, "name": ""},
+        {"location": [-122.27, 37.8], "distance": 2.0, "name": "Broadway"},
+    ],
+}
+
+TABLE = {
+    "code": "Ok",
+    "durations": [[0, 10.5], [None, 0]],
+    "sources": [{"location": [0, 0]}, {"location": [1, 1]}],
+    "destinations": [{"location": [0, 0]}, {"location": [1, 1]}],
+}
+
+MATCH = {
+    "code": "Ok",
+    "matchings": [{"distance": 10, "duration": 2, "weight": 2, "confidence": 0.9, "legs": [{"distance": 10, "duration": 2}]}],
+    "tracepoints": [
+        {"location": [0, 0], "matchings_index": 0, "waypoint_index": 0},
+        None,
+        {"location": [1, 1], "matchings_index": 0, "waypoint_index": 1},
+    ],
+}
+
+TRIP = {
+    "code": "Ok",
+    "trips": [{"distance": 30, "duration": 6, "weight": 6, "legs": [{"distance": 30, "duration": 6}]}],
+    "waypoints": [
+        {"location": [0, 0], "trips_index": 0, "waypoint_index": 0},
+        {"location": [1, 1], "trips_index": 0, "waypoint_index": 1},
+    ],
+}
+
+BROKEN = {"code": "Ok", "trips": [{"legs": "oops"}]}
+
+
+class FakeOSRMHandler(QuietHandler):
+    """Answers every service with canned JSON over keep-alive HTTP/1.1, tracking concurrency."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.clients.add(self.client_address)
+            server.in_flight += 1
+            server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+        time.sleep(server.delay)
+        service = self.path.split("/")[1]
+        if service == "tile":
+            status, body, content_type = 200, b"\x1a\x00mvt", "application/x-protobuf"
+        elif "NoRoute" in self.path:
+            status, body, content_type = 400, json.dumps({"code": "NoRoute", "message": "Impossible route"}).encode(), "application/json"
+        else:
+            payload = {"route": ROUTE, "table": TABLE, "match": MATCH, "trip": BROKEN if "broken" in self.path else TRIP}.get(service, {"code": "Ok", "waypoints": [ROUTE["waypoints"][0]]})
+            status, body, content_type = 200, json.dumps(payload).encode(), "application/json"
+        with server.lock:
+            server.in_flight -= 1
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def osrm_server():
+    with serve_directory(FakeOSRMHandler) as (_, base_url, server):
+        server.lock = threading.Lock()
+        server.requests = []
+        server.clients = set()
+        server.in_flight = server.peak_in_flight = 0
+        server.delay = 0
+        yield base_url, server
+
+
+@pytest.fixture
+def fake_compose(tmp_path, monkeypatch):
+    """Put a docker-compose script on PATH that replays a log, then exits with a code."""
+    monkeypatch.chdir(tmp_path)
+
+    def install(body, exit_code=0):
+        script = tmp_path / "docker-compose"
+        script.write_text(f"#!/bin/sh\n{body}\nexit {exit_code}\n")
+        script.chmod(script.stat().st_mode | stat.S_IEXEC)
+        monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+        monkeypatch.setenv("CONTAINER_SAMPLE_INTERVAL", "0")
+        return script
+
+    return install
@@ -0,0 +1,103 @@
+"""Test the osrm-routed benchmark harness against the fake server."""
+
+import asyncio
+import json
+import sys
+import numpy as np
+import pytest
+from src.client import benchmark
+from src.client.benchmark import (
+    Sample, closed_loop, load_coordinates, open_loop, parse_mix, parse_query_log, summarize, synthetic_requests
+)
+from src.client.osrm import OSRMClient, Request
+
+
+def test_summarize_percentiles_and_errors():
+    """Test QPS, error rates and percentiles over successful requests only."""
+    samples = [Sample("route", (i + 1) / 1000, None) for i in range(1000)]
+    samples += [Sample("table", 5.0, "NoTable")] * 10
+
+    report = summarize(samples, elapsed=2.0, dropped=3)
+
+    assert report["requests"] == 1010 and report["dropped"] == 3
+    assert report["qps"] == 500.0
+    assert report["errors"] == {"NoTable": 10}
+    assert report["error_rate"] == pytest.approx(10 / 1010, abs=1e-5)
+    assert report["latency_ms"]["p50"] == pytest.approx(500.5)
+    assert report["latency_ms"]["p99.9"] == pytest.approx(999.0, abs=0.01)
+    assert report["latency_ms"]["max"] == 1000.0
+    assert report["services"]["table"]["latency_ms"]["p50"] is None
+
+
+def test_workloads_from_coordinates_and_logs(tmp_path):
+    """Test coordinate files, the synthetic service mix and query log parsing."""
+    (tmp_path / "points.csv").write_text("lon,lat\n" + "\n".join(f"{i},{i + 0.5}" for i in range(20)))
+    coordinates = load_coordinates(tmp_path / "points.csv")
+    assert coordinates.shape == (20, 2)
+
+    mix = parse_mix("route=3,table=1,match")
+    assert mix == {"route": 0.6, "table": 0.2, "match": 0.2}
+    requests = synthetic_requests(coordinates, mix, np.random.default_rng(1), table_size=5, trace_length=4)
+    drawn = [next(requests) for _ in range(200)]
+    assert {request.service for request in drawn} == {"route", "table", "match"}
+    trace = next(request for request in drawn if request.service == "match")
+    assert np.all(np.diff(trace.coordinates[:, 0]) == 1) and trace.options["timestamps"] == [0, 1, 2, 3]
+    assert all(len(request.coordinates) == 5 for request in drawn if request.service == "table")
+
+    (tmp_path / "access.log").write_text(
+        '10.0.0.1 - - [01/Jan/2025] "GET /route/v1/driving/-122.4,37.7;-122.3,37.8?overview=false&geometries=polyline HTTP/1.1" 200\n'
+        "healthz\n"
+        "http://osrm:5000/table/v1/driving/0,0;1,1;2,2?sources=0\n"
+    )
+    route, table = parse_query_log(tmp_path / "access.log")
+    assert route.service == "route" and route.options == {"overview": "false"}
+    assert route.coordinates == [[-122.4, 37.7], [-122.3, 37.8]]
+    assert table.service == "table" and len(table.coordinates) == 3 and table.options == {"sources": "0"}
+
+
+def test_closed_and_open_loop_against_stub(osrm_server):
+    """Test that closed loop bounds concurrency and open loop keeps its arrival rate."""
+    base_url, server = osrm_server
+    server.delay = 0.01
+    requests = iter(lambda: Request("route", [[0, 0], [1, 1]]), None)
+
+    async def run():
+        async with OSRMClient(base_url, concurrency=64) as client:
+            closed = await closed_loop(client, requests, concurrency=4, total=40)
+            assert server.peak_in_flight <= 4
+            opened = await open_loop(client, requests, rate=200, duration=0.5)
+            return closed, opened
+
+    (closed_samples, _), (open_samples, open_elapsed, dropped) = asyncio.run(run())
+
+    assert len(closed_samples) == 40 and not any(sample.error for sample in closed_samples)
+    assert dropped == 0
+    assert 90 <= len(open_samples) <= 110
+    assert open_elapsed < 1.5
+
+
+def test_cli_writes_json_report(osrm_server, tmp_path, monkeypatch):
+    """Test the CLI end to end with a mixed workload and an error-producing log."""
+    base_url, _ = osrm_server
+    output = tmp_path / "report.json"
+    monkeypatch.setattr(sys, "argv", [
+        "benchmark", "--url", base_url, "--mix", "route=1,table=1,nearest=1,trip=1,match=1",
+        "--requests", "50", "--concurrency", "5", "--seed", "7", "--label", "threads=2", "--output", str(output),
+    ])
+    benchmark.main()
+
+    report = json.loads(output.read_text())
+    assert report["label"] == "threads=2" and report["mode"] == "closed"
+    assert report["requests"] == 50 and report["error_rate"] == 0
+    assert set(report["services"]) == {"route", "table", "nearest", "trip", "match"}
+    assert set(report["latency_ms"]) == {"p50", "p95", "p99", "p99.9", "mean", "max"}
+
+    (tmp_path / "queries.log").write_text("/route/v1/driving/0,0;1,1?exclude=NoRoute\n")
+    monkeypatch.setattr(sys, "argv", [
+        "benchmark", "--url", base_url, "--log", str(tmp_path / "queries.log"), "--mode", "open",
+        "--rate", "100", "--requests", "10", "--output", str(output),
+    ])
+    with pytest.raises(SystemExit):
+        benchmark.main()
+    report = json.loads(output.read_text())
+    assert report["errors"] == {"NoRoute": 10} and report["target_rate"] == 100
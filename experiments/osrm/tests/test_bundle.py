@@ -0,0 +1,153 @@
+"""Test zstd tar bundles."""
+
+import io
+import json
+import os
+import tarfile
+import tempfile
+from pathlib import Path
+import zstandard
+from src.utils import bundle as bundle_module
+from src.utils.bundle import (
+    bundle_keys, download_bundle, read_bundle, read_bundle_member, upload_bundle, write_bundle
+)
+from src.utils.s3_utils import S3Storage
+
+
+def make_dataset(base_dir: Path) -> dict:
+    """Create a small nested dataset and return its contents by member name."""
+    contents = {
+        "region.osrm.hsgr": os.urandom(300_000),
+        "region.osrm.names": b"street names\n" * 1000,
+        "nested/region.osrm.properties": b"{}",
+        "empty.osrm.timestamp": b"",
+    }
+    for name, data in contents.items():
+        path = base_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return contents
+
+
+def test_bundle_round_trip_local():
+    """Test that a bundle unpacks with tarfile and zstd, and with read_bundle."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = Path(temp_dir) / "source"
+        contents = make_dataset(source)
+        files = sorted(path for path in source.rglob("*") if path.is_file())
+
+        sink = io.BytesIO()
+        index = write_bundle(files, source, sink, level=1, threads=0)
+        assert index["total"] == len(sink.getvalue())
+        assert set(index["members"]) == set(contents)
+
+        # Plain zstd + tar understand the concatenated frames
+        plain = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(sink.getvalue()), read_across_frames=True)
+        with tarfile.open(fileobj=plain, mode="r|") as archive:
+            assert sorted(member.name for member in archive) == sorted(contents)
+
+        target = Path(temp_dir) / "target"
+        extracted = read_bundle(io.BytesIO(sink.getvalue()), target)
+        assert sorted(extracted) == sorted(contents)
+        for name, data in contents.items():
+            assert (target / name).read_bytes() == data
+
+
+def test_bundle_member_frame_standalone():
+    """Test that a single member decompresses from its indexed byte range alone."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = Path(temp_dir) / "source"
+        contents = make_dataset(source)
+        files = sorted(path for path in source.rglob("*") if path.is_file())
+
+        sink = io.BytesIO()
+        index = write_bundle(files, source, sink, level=1, threads=0)
+        entry = index["members"]["region.osrm.names"]
+        frame = sink.getvalue()[entry["offset"]:entry["offset"] + entry["length"]]
+
+        target = Path(temp_dir) / "target"
+        assert read_bundle(io.BytesIO(frame), target, ["region.osrm.names"]) == ["region.osrm.names"]
+        assert (target / "region.osrm.names").read_bytes() == contents["region.osrm.names"]
+
+
+def test_bundle_s3_round_trip():
+    """Test uploading a directory as a bundle and restoring all or some members."""
+    storage = S3Storage()
+    s3_path = "osrm/test/bundle"
+    bundle_key, index_key = bundle_keys(s3_path)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = Path(temp_dir) / "source"
+        contents = make_dataset(source)
+
+        try:
+            assert upload_bundle(storage, str(source), s3_path, level=1)
+            assert storage.file_exists(bundle_key)
+            index = json.loads(storage.read_object(index_key))
+            info = storage.get_file_info(bundle_key)
+            assert info["size"] == index["total"] and info["etag"] == index["etag"]
+
+            full = Path(temp_dir) / "full"
+            assert download_bundle(storage, s3_path, str(full)) == len(contents)
+            for name, data in contents.items():
+                assert (full / name).read_bytes() == data
+
+            partial = Path(temp_dir) / "partial"
+            wanted = ["nested/region.osrm.properties", "region.osrm.hsgr"]
+            assert download_bundle(storage, s3_path, str(partial), wanted) == 2
+            assert sorted(str(p.relative_to(partial)) for p in partial.rglob("*") if p.is_file()) == sorted(wanted)
+            assert (partial / "region.osrm.hsgr").read_bytes() == contents["region.osrm.hsgr"]
+        finally:
+            storage.delete_file(bundle_key)
+            storage.delete_file(index_key)
+
+
+def test_bundle_failure_keeps_previous_object(monkeypatch):
+    """Test that a producer failing mid-stream aborts the upload instead of replacing the bundle."""
+    storage = S3Storage()
+    s3_path = "osrm/test/bundle-failure"
+    bundle_key, index_key = bundle_keys(s3_path)
+
+    def failing_write_bundle(files, base_dir, sink, level=3, threads=-1):
+        sink.write(b"partial bundle" * 1000)
+        sink.flush()
+        raise OSError("disk read failed")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = Path(temp_dir) / "source"
+        make_dataset(source)
+        try:
+            assert upload_bundle(storage, str(source), s3_path, level=1)
+            previous = storage.read_object(bundle_key)
+
+            monkeypatch.setattr(bundle_module, "write_bundle", failing_write_bundle)
+            assert not upload_bundle(storage, str(source), s3_path, level=1)
+            assert storage.read_object(bundle_key) == previous
+        finally:
+            storage.delete_file(bundle_key)
+            storage.delete_file(index_key)
+
+
+def test_bundle_stale_index_is_not_used(monkeypatch):
+    """Test that a failed index write fails the upload and the old index is no longer trusted."""
+    storage = S3Storage()
+    s3_path = "osrm/test/bundle-stale-index"
+    bundle_key, index_key = bundle_keys(s3_path)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = Path(temp_dir) / "source"
+        contents = make_dataset(source)
+        try:
+            assert upload_bundle(storage, str(source), s3_path, level=1)
+            assert read_bundle_member(storage, s3_path, "region.osrm.names") == contents["region.osrm.names"]
+
+            (source / "region.osrm.names").write_bytes(b"renamed streets\n" * 500)
+            monkeypatch.setattr(storage, "write_object", lambda key, data: False)
+            assert not upload_bundle(storage, str(source), s3_path, level=1)
+
+            # The bundle was replaced but the index still describes the previous one
+            assert read_bundle_member(storage, s3_path, "region.osrm.names") is None
+            assert download_bundle(storage, s3_path, str(Path(temp_dir) / "partial"), ["region.osrm.names"]) == 0
+        finally:
+            storage.delete_file(bundle_key)
+            storage.delete_file(index_key)
@@ -0,0 +1,114 @@
+"""Test the pooled async OSRM client against a fake osrm-routed."""
+
+import asyncio
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import pytest
+from src.client.osrm import OSRMClient, OSRMError, Request, format_coordinates, format_option
+
+
+def test_format_coordinates_and_options():
+    """Test the path and query formatting of coordinates and options."""
+    assert format_coordinates(np.array([[-122.4194, 37.7749], [-122.2712, 37.8044]])) == (
+        "-122.419400,37.774900;-122.271200,37.804400"
+    )
+    assert format_option("steps", True) == "true"
+    assert format_option("radiuses", [5, None, 10]) == "5;;10"
+    assert format_option("bearings", [(90, 20), None]) == "90,20;"
+    assert format_option("sources", np.array([0, 2])) == "0;2"
+    assert format_option("annotations", ["duration", "distance"]) == "duration,distance"
+
+
+def test_route_table_match_decode_to_arrays(osrm_server):
+    """Test that responses decode into arrays and the client requests compact responses."""
+    base_url, server = osrm_server
+
+    async def run():
+        async with OSRMClient(base_url) as client:
+            return (
+                await client.route([[-122.42, 37.77], [-122.3, 37.8], [-122.27, 37.8]], annotations=["duration", "nodes"]),
+                await client.table([[0, 0], [1, 1]]),
+                await client.match([[0, 0], [0.5, 0.5], [1, 1]], timestamps=[0, 10, 20]),
+                await client.nearest([0, 0], number=3),
+                await client.tile(1310, 3166, 13),
+            )
+
+    route, table, match, nearest, tile = asyncio.run(run())
+
+    best = route.routes[0]
+    assert best.geometry.shape == (3, 2) and best.geometry.dtype == np.float64
+    np.testing.assert_array_equal(best.leg_durations, [80.0, 40.0])
+    np.testing.assert_array_equal(best.annotations["duration"], [30, 50, 40])
+    assert route.waypoints.locations.shape == (3, 2) and route.waypoints.names[0] == "Market"
+
+    assert table.durations.shape == (2, 2) and np.isnan(table.durations[1, 0])
+    assert table.distances is None
+
+    np.testing.assert_array_equal(match.matchings_index, [0, -1, 0])
+    assert np.isnan(match.tracepoints.locations[1]).all()
+    assert match.confidences[0] == pytest.approx(0.9)
+    assert nearest.waypoints.locations.shape == (1, 2)
+    assert tile == b"\x1a\x00mvt"
+
+    route_query = parse_qs(urlsplit(server.requests[0]).query)
+    assert route_query["geometries"] == ["geojson"] and route_query["generate_hints"] == ["false"]
+    assert route_query["annotations"] == ["duration,nodes"]
+    assert "geometries" not in parse_qs(urlsplit(server.requests[1]).query)
+    assert urlsplit(server.requests[3]).path == "/nearest/v1/driving/0.000000,0.000000"
+
+
+def test_errors_raise_osrm_error(osrm_server):
+    """Test that API errors and malformed responses raise OSRMError."""
+    base_url, _ = osrm_server
+
+    async def run():
+        async with OSRMClient(base_url) as client:
+            with pytest.raises(OSRMError) as error:
+                await client.route([[0, 0], [1, 1]], exclude="NoRoute")
+            with pytest.raises(ValueError):
+                await client.route([[0, 0], [1, 1]], geometries="polyline")
+            with pytest.raises(OSRMError) as invalid:
+                await client.trip([[0, 0], [1, 1]], source="broken")
+            return error.value, invalid.value, await client.trip([[0, 0], [1, 1]])
+
+    error, invalid, trip = asyncio.run(run())
+    assert error.code == "NoRoute" and error.status == 400
+    assert invalid.code == "InvalidResponse"
+    np.testing.assert_array_equal(trip.waypoint_index, [0, 1])
+
+
+def test_batch_bounds_concurrency_and_reuses_connections(osrm_server):
+    """Test ordered batch results, the in-flight bound, keep-alive reuse and per-request errors."""
+    base_url, server = osrm_server
+    server.delay = 0.02
+
+    def requests():
+        for i in range(40):
+            yield Request("route", [[0, 0], [1, 1]], {"exclude": "NoRoute"} if i == 7 else {})
+
+    async def run():
+        async with OSRMClient(base_url, concurrency=4) as client:
+            return await client.batch(requests())
+
+    results = asyncio.run(run())
+
+    assert len(results) == 40
+    assert isinstance(results[7], OSRMError) and results[7].code == "NoRoute"
+    assert all(result.routes[0].distance == 1500.5 for i, result in enumerate(results) if i != 7)
+    assert server.peak_in_flight <= 4
+    assert len(server.clients) <= 4
+
+
+def test_stream_stops_cleanly_when_abandoned(osrm_server):
+    """Test that leaving a stream early cancels its workers."""
+    base_url, server = osrm_server
+
+    async def run():
+        async with OSRMClient(base_url, concurrency=2) as client:
+            stream = client.stream(Request("nearest", [[0, 0]]) for _ in range(1000))
+            async for _ in stream:
+                break
+            await stream.aclose()
+
+    asyncio.run(run())
+    assert len(server.requests) < 1000
@@ -0,0 +1,257 @@
+"""Test OSM downloads against a local HTTP server."""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+import pytest
+from src.core import download_osm as download_module
+from src.core.download_osm import download_osm
+from src.utils import http_download
+from src.utils.http_download import segmented_download
+from src.utils.s3_utils import MB, get_storage
+from tests.conftest import QuietHandler, serve_directory
+
+
+class RangeHandler(QuietHandler):
+    """Static file handler with single-range support that counts bytes served."""
+    
+    def do_HEAD(self):
+        self.server.head_requests += 1
+        self.serve(include_body=False)
+    
+    def do_GET(self):
+        self.serve(include_body=True)
+    
+    def serve(self, include_body):
+        path = Path(self.directory) / self.path.lstrip("/")
+        if not path.is_file():
+            self.send_error(404)
+            return
+        
+        data = path.read_bytes()
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        
+        range_header = self.headers.get("Range")
+        if range_header:
+            start, end = range_header.split("=", 1)[1].split("-")
+            start, end = int(start), int(end) if end else len(data) - 1
+            body = data[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        else:
+            body = data
+            self.send_response(200)
+        
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if include_body:
+            self.wfile.write(body)
+            self.server.bytes_served += len(body)
+
+
+@pytest.fixture
+def osm_server():
+    """Plain static server without range support."""
+    with serve_directory(QuietHandler) as (serve_dir, base_url, _):
+        yield serve_dir, base_url
+
+
+@pytest.fixture
+def range_server():
+    """Static server with range support; also yields the server for byte counts."""
+    with serve_directory(RangeHandler) as served:
+        yield served
+
+
+def test_stream_download_to_s3(osm_server, monkeypatch):
+    """Test streaming an extract into a multipart upload without a local copy."""
+    serve_dir, base_url = osm_server
+    payload = os.urandom(12 * MB)
+    (serve_dir / "test-latest.osm.pbf").write_bytes(payload)
+    
+    storage = get_storage()
+    monkeypatch.setattr(storage, "multipart_chunksize", 5 * MB)
+    monkeypatch.setenv("OSM_DOWNLOAD_URL", f"{base_url}/test-latest.osm.pbf")
+    monkeypatch.setenv("OSM_FILENAME", "test-latest.osm.pbf")
+    
+    assert download_osm(storage_type="s3", s3_prefix="osrm/test/stream", stream=True)
+    
+    s3_key = "osrm/test/stream/test-latest.osm.pbf"
+    body = storage.client.get_object(Bucket=storage.bucket, Key=s3_key)["Body"].read()
+    assert body == payload
+    
+    # Clean up
+    storage.delete_file(s3_key)
+
+
+def test_stream_download_missing_url(osm_server, monkeypatch):
+    """Test that a failed source request does not create an object."""
+    _, base_url = osm_server
+    monkeypatch.setenv("OSM_DOWNLOAD_URL", f"{base_url}/missing.osm.pbf")
+    monkeypatch.setenv("OSM_FILENAME", "missing.osm.pbf")
+    
+    assert not download_osm(storage_type="s3", s3_prefix="osrm/test/stream", stream=True)
+    assert not get_storage().file_exists("osrm/test/stream/missing.osm.pbf")
+
+
+def publish(serve_dir, name, payload, md5=None):
+    """Write a file and its .md5 checksum into the served directory."""
+    (serve_dir / name).write_bytes(payload)
+    md5 = md5 or hashlib.md5(payload).hexdigest()
+    (serve_dir / f"{name}.md5").write_text(f"{md5}  {name}\n")
+
+
+def test_segmented_download(range_server, monkeypatch):
+    """Test a multi-segment download verified against the published checksum."""
+    serve_dir, base_url, server = range_server
+    monkeypatch.setattr(http_download, "MIN_SEGMENT_SIZE", MB)
+    payload = os.urandom(6 * MB + 123)
+    publish(serve_dir, "region.osm.pbf", payload)
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output = Path(temp_dir) / "region.osm.pbf"
+        result = segmented_download(f"{base_url}/region.osm.pbf", str(output), segments=4)
+        assert result and result.md5 == hashlib.md5(payload).hexdigest()
+        assert output.read_bytes() == payload
+        assert not (Path(temp_dir) / "region.osm.pbf.part.json").exists()
+
+
+def test_segmented_download_resumes(range_server, monkeypatch):
+    """Test that an interrupted download only fetches the missing byte ranges."""
+    serve_dir, base_url, server = range_server
+    monkeypatch.setattr(http_download, "MIN_SEGMENT_SIZE", MB)
+    payload = os.urandom(4 * MB)
+    publish(serve_dir, "region.osm.pbf", payload)
+    url = f"{base_url}/region.osm.pbf"
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output = Path(temp_dir) / "region.osm.pbf"
+        
+        # Simulate a run interrupted with each of two segments half written
+        half = 2 * MB
+        part = bytearray(len(payload))
+        part[0:MB] = payload[0:MB]
+        part[half:half + MB] = payload[half:half + MB]
+        Path(f"{output}.part").write_bytes(bytes(part))
+        Path(f"{output}.part.json").write_text(json.dumps({
+            "url": url,
+            "size": len(payload),
+            "validator": f'"{hashlib.md5(payload).hexdigest()}"',
+            "segments": [[0, half - 1, MB], [half, len(payload) - 1, MB]],
+        }))
+        
+        assert segmented_download(url, str(output), segments=2)
+        assert output.read_bytes() == payload
+        # Only the missing halves plus the checksum file were transferred
+        assert server.bytes_served < 2 * MB + 1024
+
+
+def test_segmented_download_restarts_without_part_file(range_server, monkeypatch):
+    """Test that saved progress is discarded when the partial file it describes is gone."""
+    serve_dir, base_url, _ = range_server
+    monkeypatch.setattr(http_download, "MIN_SEGMENT_SIZE", MB)
+    payload = os.urandom(2 * MB)
+    publish(serve_dir, "region.osm.pbf", payload)
+    url = f"{base_url}/region.osm.pbf"
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output = Path(temp_dir) / "region.osm.pbf"
+        Path(f"{output}.part.json").write_text(json.dumps({
+            "url": url,
+            "size": len(payload),
+            "validator": f'"{hashlib.md5(payload).hexdigest()}"',
+            "segments": [[0, MB - 1, MB], [MB, len(payload) - 1, 0]],
+        }))
+        
+        assert segmented_download(url, str(output), segments=2)
+        assert output.read_bytes() == payload
+
+
+def test_segmented_download_checksum_mismatch(range_server):
+    """Test that a corrupt download is rejected and discarded."""
+    serve_dir, base_url, _ = range_server
+    publish(serve_dir, "region.osm.pbf", b"corrupted payload", md5="0" * 32)
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output = Path(temp_dir) / "region.osm.pbf"
+        assert not segmented_download(f"{base_url}/region.osm.pbf", str(output), segments=4)
+        assert not output.exists()
+        assert not Path(f"{output}.part").exists()
+
+
+def test_download_falls_back_without_ranges(osm_server, monkeypatch):
+    """Test single-stream fallback when the server does not advertise ranges."""
+    serve_dir, base_url = osm_server
+    payload = os.urandom(MB)
+    publish(serve_dir, "test-latest.osm.pbf", payload)
+    monkeypatch.setenv("OSM_DOWNLOAD_URL", f"{base_url}/test-latest.osm.pbf")
+    monkeypatch.setenv("OSM_FILENAME", "test-latest.osm.pbf")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        monkeypatch.chdir(temp_dir)
+        assert download_osm(storage_type="local", segments=4)
+        assert (Path(temp_dir) / "data/raw/test-latest.osm.pbf").read_bytes() == payload
+
+
+def test_conditional_download_local(range_server, monkeypatch):
+    """Test that an unchanged upstream extract is not downloaded again."""
+    serve_dir, base_url, server = range_server
+    payload = os.urandom(MB)
+    publish(serve_dir, "test-latest.osm.pbf", payload)
+    monkeypatch.setenv("OSM_DOWNLOAD_URL", f"{base_url}/test-latest.osm.pbf")
+    monkeypatch.setenv("OSM_FILENAME", "test-latest.osm.pbf")
+    
+    # The checksum verified against the published .md5 is reused for the state
+    hashed = []
+    monkeypatch.setattr(download_module, "file_md5", lambda path: hashed.append(path))
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        monkeypatch.chdir(temp_dir)
+        assert download_osm(storage_type="local", conditional=True)
+        state = json.loads(Path("data/raw/test-latest.osm.pbf.source.json").read_text())
+        assert state["md5"] == hashlib.md5(payload).hexdigest()
+        assert hashed == []
+        # Nothing stored yet, so the download's own probe is the only one
+        assert server.head_requests == 1
+        
+        served = server.bytes_served
+        assert download_osm(storage_type="local", conditional=True)
+        assert server.bytes_served == served
+        
+        # A new upstream extract is fetched again
+        updated = os.urandom(MB)
+        publish(serve_dir, "test-latest.osm.pbf", updated)
+        assert download_osm(storage_type="local", conditional=True)
+        assert Path("data/raw/test-latest.osm.pbf").read_bytes() == updated
+
+
+def test_conditional_download_s3_metadata(range_server, monkeypatch):
+    """Test that upstream validators are stored as S3 metadata and honoured."""
+    serve_dir, base_url, server = range_server
+    payload = os.urandom(MB)
+    publish(serve_dir, "test-latest.osm.pbf", payload)
+    monkeypatch.setenv("OSM_DOWNLOAD_URL", f"{base_url}/test-latest.osm.pbf")
+    monkeypatch.setenv("OSM_FILENAME", "test-latest.osm.pbf")
+    s3_key = "osrm/test/conditional/test-latest.osm.pbf"
+    storage = get_storage()
+    
+    try:
+        assert download_osm(storage_type="s3", s3_prefix="osrm/test/conditional", conditional=True)
+        metadata = storage.get_file_info(s3_key)["metadata"]
+        assert metadata["md5"] == hashlib.md5(payload).hexdigest()
+        assert metadata["source-etag"] == f'"{metadata["md5"]}"'
+        
+        served = server.bytes_served
+        assert download_osm(storage_type="s3", s3_prefix="osrm/test/conditional", conditional=True)
+        assert server.bytes_served == served
+    finally:
+        storage.delete_file(s3_key)
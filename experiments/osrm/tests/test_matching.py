@@ -0,0 +1,185 @@
+"""Test streaming batch map-matching against a fake /match service."""
+
+import asyncio
+import json
+import threading
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from src.client.matching import Columns, Segmenter, match_traces
+from src.client.osrm import OSRMClient
+from tests.conftest import QuietHandler, serve_directory
+
+
+WINDOW = 12
+
+
+class MatchHandler(QuietHandler):
+    """
+    /match snapping every point onto itself, one matching per request.
+
+    The matched geometry visits every trace point with a midpoint between
+    each pair, so stitching can be checked exactly. Requests over WINDOW
+    points are rejected like osrm-routed's --max-matching-size.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        points = np.array([[float(v) for v in pair.split(",")] for pair in url.path.split("/")[-1].split(";")])
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        with self.server.lock:
+            self.server.sizes.append(len(points))
+        timestamps = [int(t) for t in query["timestamps"].split(";")]
+        if len(points) > WINDOW or timestamps != sorted(timestamps) or len(timestamps) != len(points):
+            self.reply(400, {"code": "TooBig", "message": "rejected"})
+            return
+        geometry = np.empty((2 * len(points) - 1, 2))
+        geometry[0::2] = points
+        geometry[1::2] = (points[:-1] + points[1:]) / 2
+        self.reply(200, {
+            "code": "Ok",
+            "matchings": [{
+                "distance": 1, "duration": 1, "weight": 1, "confidence": 0.5,
+                "geometry": {"type": "LineString", "coordinates": geometry.tolist()},
+                "legs": [],
+            }],
+            "tracepoints": [
+                {"location": point.tolist(), "matchings_index": 0, "waypoint_index": i} for i, point in enumerate(points)
+            ],
+        })
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def match_server():
+    with serve_directory(MatchHandler) as (_, base_url, server):
+        server.lock = threading.Lock()
+        server.sizes = []
+        yield base_url, server
+
+
+def expected_geometry(points):
+    geometry = np.empty((2 * len(points) - 1, 2))
+    geometry[0::2] = points
+    geometry[1::2] = (points[:-1] + points[1:]) / 2
+    return geometry
+
+
+def trace(count, start_time, lon0):
+    times = start_time + np.arange(count) * 5
+    points = np.column_stack([lon0 + np.arange(count) * 0.001, 37.0 + np.arange(count) * 0.0005])
+    return times, points
+
+
+def test_segmenter_windows_overlap_and_split_at_gaps():
+    """Test window sizes, ownership of the overlap, and segments at time gaps."""
+    segmenter = Segmenter(window=10, overlap=4, max_gap=60)
+    windows = []
+    for i in range(25):
+        windows += segmenter.add("a", i * 5, float(i), 0.0)
+    windows += segmenter.add("a", 1000, 100.0, 0.0)  # gap: closes the first segment
+    windows += segmenter.add("b", 1000, 0.0, 0.0)
+    windows += segmenter.add("b", 1001, float("nan"), 0.0)
+    windows += segmenter.add("a", 990, 0.0, 0.0)  # out of order
+    windows += segmenter.finish()
+
+    first = [window for window in windows if window.vehicle == "a" and window.segment == 0]
+    assert [len(window.points) for window in first] == [10, 10, 10, 7]
+    assert [window.final for window in first] == [False, False, False, True]
+    owned = np.concatenate([window.points[window.own_start:window.own_end, 0] for window in first])
+    np.testing.assert_array_equal(owned, np.arange(25))
+    assert len(windows) == len(first)  # the single-point segments are skipped
+    assert segmenter.stats == {"points": 29, "invalid": 1, "out_of_order": 1, "short_segments": 2}
+
+
+def test_match_traces_stitches_windows(match_server, tmp_path):
+    """Test interleaved vehicles from CSV and Parquet, window limits and exact stitched geometry."""
+    base_url, server = match_server
+    times_a, points_a = trace(40, 1000, -122.0)
+    times_b, points_b = trace(7, 1000, -121.0)
+    times_c, points_c = trace(30, 5000, -122.0)  # vehicle a after a gap: second segment
+    rows = sorted(
+        [("a", t, *p) for t, p in zip(times_a, points_a)] + [("b", t, *p) for t, p in zip(times_b, points_b)],
+        key=lambda row: row[1],
+    )
+    with open(tmp_path / "part1.csv", "w") as f:
+        f.write("vehicle_id,timestamp,lon,lat\n")
+        f.writelines(f"{v},{t},{float(lon)!r},{float(lat)!r}\n" for v, t, lon, lat in rows)
+    pq.write_table(pa.table({
+        "vehicle": ["a"] * len(times_c),
+        "time": pa.array(times_c * 1000, pa.timestamp("ms")),
+        "x": points_c[:, 0], "y": points_c[:, 1],
+    }), tmp_path / "part2.parquet")
+
+    async def run(path, columns):
+        async with OSRMClient(base_url, concurrency=4) as client:
+            return await match_traces([path], tmp_path / f"{path.stem}.parquet.out", columns, window=WINDOW, overlap=4, client=client)
+
+    assert asyncio.run(run(tmp_path / "part1.csv", Columns()))
+    assert asyncio.run(run(tmp_path / "part2.parquet", Columns("vehicle", "time", "x", "y")))
+    assert max(server.sizes) <= WINDOW
+
+    first = pq.read_table(tmp_path / "part1.parquet.out").to_pylist()
+    second = pq.read_table(tmp_path / "part2.parquet.out").to_pylist()
+    by_vehicle = {row["vehicle_id"]: row for row in first}
+    assert set(by_vehicle) == {"a", "b"}
+    for row, points in [(by_vehicle["a"], points_a), (by_vehicle["b"], points_b), (second[0], points_c)]:
+        assert row["part"] == 0 and row["points"] == row["matched_points"] == len(points)
+        assert row["confidence"] == pytest.approx(0.5) and row["failed_windows"] == 0
+        np.testing.assert_allclose(np.array(row["geometry"]), expected_geometry(points))
+    assert by_vehicle["a"]["start_time"] == 1000 and by_vehicle["a"]["end_time"] == int(times_a[-1])
+    assert second[0]["start_time"] == 5000
+
+
+def test_match_traces_writes_long_segments_in_parts(match_server, tmp_path):
+    """Test that a long segment is written as parts that join into its exact geometry."""
+    base_url, _ = match_server
+    times, points = trace(60, 0, 0.0)
+    pq.write_table(pa.table({"vehicle_id": ["v"] * 60, "timestamp": times, "lon": points[:, 0], "lat": points[:, 1]}),
+                   tmp_path / "traces.parquet")
+
+    async def run():
+        async with OSRMClient(base_url, concurrency=4) as client:
+            return await match_traces(
+                [tmp_path / "traces.parquet"], tmp_path / "out.parquet", window=WINDOW, overlap=4, client=client,
+                part_windows=2
+            )
+
+    assert asyncio.run(run())
+    rows = sorted(pq.read_table(tmp_path / "out.parquet").to_pylist(), key=lambda row: row["part"])
+    # 60 points in windows of 12 advancing by 8: 7 windows, so 4 parts
+    assert [row["part"] for row in rows] == [0, 1, 2, 3]
+    assert {row["segment"] for row in rows} == {0}
+    assert sum(row["points"] for row in rows) == sum(row["matched_points"] for row in rows) == 60
+    assert rows[0]["start_time"] == 0 and rows[-1]["end_time"] == int(times[-1])
+    assert all(a["end_time"] < b["start_time"] for a, b in zip(rows, rows[1:]))
+    geometry = np.concatenate([np.array(row["geometry"]) for row in rows])
+    np.testing.assert_allclose(geometry, expected_geometry(points))
+
+
+def test_match_traces_reports_failed_windows(match_server, tmp_path):
+    """Test that rejected windows are counted and the run fails."""
+    base_url, _ = match_server
+    times, points = trace(30, 0, 0.0)
+    pq.write_table(pa.table({"vehicle_id": ["v"] * 30, "timestamp": times, "lon": points[:, 0], "lat": points[:, 1]}),
+                   tmp_path / "traces.parquet")
+
+    async def run():
+        async with OSRMClient(base_url) as client:
+            return await match_traces([tmp_path / "traces.parquet"], tmp_path / "out.arrow", window=WINDOW + 5, overlap=4, client=client)
+
+    assert not asyncio.run(run())
+    with pa.ipc.open_file(tmp_path / "out.arrow") as reader:
+        row = reader.read_all().to_pylist()[0]
+    assert row["failed_windows"] >= 1 and row["matched_points"] < row["points"] == 30
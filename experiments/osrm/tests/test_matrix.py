@@ -0,0 +1,141 @@
+"""Test the tiled matrix engine against a fake /table service."""
+
+import asyncio
+import json
+import threading
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import pytest
+from src.client.matrix import TilePlan, compute_matrix
+from src.client.osrm import OSRMClient
+from tests.conftest import QuietHandler, serve_directory
+
+
+MAX_TABLE_SIZE = 10
+
+
+class TableHandler(QuietHandler):
+    """
+    /table answering duration = |lon_a - lon_b| and distance = 10 x duration.
+
+    Enforces the table size limit (sources x destinations at most
+    MAX_TABLE_SIZE²), leaves no route (null) from points with
+    lat 99, and fails requests whose first source is in server.fail_once the
+    first time it sees them.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        points = np.array([[float(v) for v in pair.split(",")] for pair in url.path.split("/")[-1].split(";")])
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        sources = [int(i) for i in query["sources"].split(";")]
+        targets = [int(i) for i in query["destinations"].split(";")]
+        with self.server.lock:
+            self.server.requests += 1
+            first_lon = float(points[sources[0], 0])
+            fail = first_lon in self.server.fail_once
+            self.server.fail_once.discard(first_lon)
+
+        too_big = len(sources) * len(targets) > MAX_TABLE_SIZE * MAX_TABLE_SIZE
+        if too_big or fail:
+            code = "TooBig" if too_big else "InternalError"
+            self.reply(400, {"code": code, "message": "rejected"})
+            return
+        durations = [
+            [None if points[s, 1] == 99 else abs(points[s, 0] - points[t, 0]) for t in targets] for s in sources
+        ]
+        body = {
+            "code": "Ok",
+            "durations": durations,
+            "distances": [[None if d is None else d * 10 for d in row] for row in durations],
+            "sources": [{"location": points[s].tolist()} for s in sources],
+            "destinations": [{"location": points[t].tolist()} for t in targets],
+        }
+        self.reply(200, body)
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def table_server():
+    with serve_directory(TableHandler) as (_, base_url, server):
+        server.lock = threading.Lock()
+        server.requests = 0
+        server.fail_once = set()
+        yield base_url, server
+
+
+def run_matrix(base_url, origins, destinations, output_dir, **kwargs):
+    async def run():
+        async with OSRMClient(base_url, concurrency=4) as client:
+            return await compute_matrix(origins, destinations, str(output_dir), MAX_TABLE_SIZE, client=client, **kwargs)
+    return asyncio.run(run())
+
+
+def test_tile_plan_fits_table_limit():
+    """Test that every tile stays within osrm-routed's product limit and the tiles cover the matrix."""
+    for rows, cols in [(23, 17), (3, 40), (40, 2), (1, 1)]:
+        plan = TilePlan.for_limit(rows, cols, MAX_TABLE_SIZE)
+        assert plan.tile_rows * plan.tile_cols <= MAX_TABLE_SIZE * MAX_TABLE_SIZE
+        covered = np.zeros((rows, cols), dtype=int)
+        for tile_row in range(plan.shape[0]):
+            for tile_col in range(plan.shape[1]):
+                covered[plan.bounds(tile_row, tile_col)] += 1
+        assert (covered == 1).all()
+    assert TilePlan.for_limit(3, 40, MAX_TABLE_SIZE).tile_cols == 33
+    assert TilePlan.for_limit(200, 200, 100).shape == (2, 2)
+    assert TilePlan.for_limit(5, 20000, 100).tile_cols == 2000
+
+
+def test_compute_matrix_into_memmaps(table_server, tmp_path):
+    """Test the assembled float32 matrices, NaN for missing routes, and retries of failed tiles."""
+    base_url, server = table_server
+    origins = np.column_stack([np.arange(23, dtype=float), np.zeros(23)])
+    origins[4, 1] = 99
+    destinations = np.column_stack([np.arange(17, dtype=float) * 2, np.zeros(17)])
+    server.fail_once = {10.0}
+
+    assert run_matrix(base_url, origins, destinations, tmp_path / "matrix")
+
+    durations = np.load(tmp_path / "matrix/durations.npy", mmap_mode="r")
+    distances = np.load(tmp_path / "matrix/distances.npy", mmap_mode="r")
+    expected = np.abs(origins[:, :1] - destinations[:, 0]).astype(np.float32)
+    expected[4] = np.nan
+    assert durations.dtype == np.float32 and durations.shape == (23, 17)
+    np.testing.assert_array_equal(durations, expected)
+    np.testing.assert_array_equal(distances, expected * 10)
+    assert np.load(tmp_path / "matrix/tiles_done.npy").all()
+
+
+def test_compute_matrix_resumes_only_missing_tiles(table_server, tmp_path):
+    """Test that a failed run leaves a resumable matrix and a rerun only fetches missing tiles."""
+    base_url, server = table_server
+    origins = np.column_stack([np.arange(20, dtype=float), np.zeros(20)])
+    plan = TilePlan.for_limit(20, 20, MAX_TABLE_SIZE)
+    server.fail_once = {0.0, 10.0}
+
+    assert not run_matrix(base_url, origins, origins, tmp_path / "matrix", distances=False, attempts=1)
+    done = np.load(tmp_path / "matrix/tiles_done.npy")
+    assert done.sum() == done.size - 2
+    assert not (tmp_path / "matrix/distances.npy").exists()
+
+    server.requests = 0
+    server.fail_once = set()
+    assert run_matrix(base_url, origins, origins, tmp_path / "matrix", distances=False)
+    assert server.requests == 2
+    np.testing.assert_array_equal(
+        np.load(tmp_path / "matrix/durations.npy"), np.abs(origins[:, :1] - origins[:, 0]).astype(np.float32)
+    )
+
+    # Different inputs start over rather than reusing blocks
+    server.requests = 0
+    assert run_matrix(base_url, origins + 1, origins, tmp_path / "matrix", distances=False)
+    assert server.requests == plan.shape[0] * plan.shape[1]
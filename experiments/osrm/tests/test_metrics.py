@@ -0,0 +1,104 @@
+"""Test Prometheus metrics export and container sampling."""
+
+import pytest
+from src.core.process import StepResult
+from src.utils import metrics as metrics_module
+from src.utils.container_stats import ContainerSampler, parse_size, parse_stats_line
+from src.utils.metrics import MetricsRegistry, export_metrics, record_stage, record_transfer
+from tests.conftest import QuietHandler, serve_directory
+
+
+class PushHandler(QuietHandler):
+    """Accept push gateway PUTs and keep the last body per path."""
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.pushed[self.path] = body.decode()
+        self.send_response(200)
+        self.end_headers()
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Replace the process-wide registry with an empty one."""
+    fresh = MetricsRegistry()
+    monkeypatch.setattr(metrics_module, "_metrics", fresh)
+    return fresh
+
+
+def test_render_exposition_format(registry):
+    """Test HELP/TYPE headers, label escaping and exact large values."""
+    registry.set("output_dataset_bytes", 4_200_000_123)
+    registry.set("stage_duration_seconds", 1.5, stage="extract")
+    registry.set("stage_duration_seconds", 2, stage='we"ird')
+
+    lines = registry.render().splitlines()
+    assert "# TYPE osrm_pipeline_output_dataset_bytes gauge" in lines
+    assert "osrm_pipeline_output_dataset_bytes 4200000123" in lines
+    assert 'osrm_pipeline_stage_duration_seconds{stage="extract"} 1.5' in lines
+    assert 'osrm_pipeline_stage_duration_seconds{stage="we\\"ird"} 2' in lines
+
+
+def test_record_transfer_and_stage(registry):
+    """Test that transfer batches accumulate per direction and stage results are recorded."""
+    record_transfer("upload", 2, 100, 1.0)
+    record_transfer("upload", 1, 300, 1.0)
+    assert registry.get("s3_transfer_files", direction="upload") == 3
+    assert registry.get("s3_transfer_throughput_bytes_per_second", direction="upload") == 200
+
+    result = StepResult(
+        service="osrm-extract", success=True, duration=10.0,
+        phases={"parsing": 4.0}, peak_memory_bytes=1024, cpu_seconds=7.5
+    )
+    record_stage("extract", result)
+    assert registry.get("phase_duration_seconds", stage="extract", phase="parsing") == 4.0
+    assert registry.get("container_memory_peak_bytes", stage="extract") == 1024
+    assert registry.get("container_cpu_seconds", stage="extract") == 7.5
+
+
+def test_export_textfile_and_pushgateway(registry, tmp_path, monkeypatch):
+    """Test that both configured exporters receive the same rendered metrics."""
+    textfile = tmp_path / "collector" / "osrm.prom"
+    with serve_directory(PushHandler) as (_, base_url, server):
+        server.pushed = {}
+        monkeypatch.setenv("METRICS_TEXTFILE", str(textfile))
+        monkeypatch.setenv("METRICS_PUSHGATEWAY_URL", base_url)
+
+        assert export_metrics("complete-pipeline", True, 12.0)
+
+        pushed = server.pushed["/metrics/job/osrm_pipeline/operation/complete-pipeline"]
+        assert pushed == textfile.read_text()
+        assert 'osrm_pipeline_operation_success{operation="complete-pipeline"} 1' in pushed
+        assert list(textfile.parent.iterdir()) == [textfile]
+
+
+def test_export_disabled_without_configuration(registry, monkeypatch):
+    """Test that nothing is written when no exporter is configured."""
+    monkeypatch.delenv("METRICS_TEXTFILE", raising=False)
+    monkeypatch.delenv("METRICS_PUSHGATEWAY_URL", raising=False)
+    assert export_metrics("download", False, 1.0)
+    assert registry.get("operation_success", operation="download") == 0
+
+
+def test_parse_docker_stats():
+    """Test docker stats size and CPU parsing."""
+    assert parse_size("1.5GiB") == 1610612736
+    assert parse_size("512MB") == 512_000_000
+    assert parse_size("--") is None
+    assert parse_stats_line("2GiB / 15.5GiB|150.00%") == (2147483648, 1.5)
+
+
+def test_container_sampler_peak_and_cpu():
+    """Test that samples keep the peak memory and integrate CPU between samples."""
+    samples = iter([[], ["1GiB / 8GiB|100%"], ["3GiB / 8GiB|200%", "1GiB / 8GiB|0%"], ["2GiB / 8GiB|50%"]])
+    times = iter([1.0, 2.0, 4.0, 7.0])
+    sampler = ContainerSampler(
+        "compose.yml", "osrm-extract",
+        stats=lambda compose_file, service: next(samples),
+        clock=lambda: next(times)
+    )
+    for _ in range(4):
+        sampler.sample()
+
+    assert sampler.peak_memory_bytes == 4 * 1024 ** 3
+    assert sampler.cpu_seconds == 2.0 * 2 + 0.5 * 3
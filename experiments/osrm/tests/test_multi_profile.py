@@ -0,0 +1,112 @@
+"""Test parallel multi-profile builds and the shared resource budget."""
+
+import threading
+import time
+from pathlib import Path
+import pytest
+from src.core import multi_profile
+from src.core.process import StepResult
+from src.utils.budget import ResourceBudget
+from src.utils.s3_utils import S3Storage
+
+
+def test_budget_admits_only_what_fits():
+    """Test that reservations beyond the memory budget wait for a release."""
+    budget = ResourceBudget(cpus=8, memory_gb=25)
+    running, peak = [], []
+    lock = threading.Lock()
+
+    def build(name):
+        with budget.reserve(2, 12, name):
+            with lock:
+                running.append(name)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(name)
+
+    threads = [threading.Thread(target=build, args=(name,)) for name in ["car", "foot", "bicycle"]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) == 2
+    assert budget.used_cpus == 0 and budget.used_memory_gb == 0
+
+
+def test_budget_clamps_oversized_requests():
+    """Test that a request larger than the budget still runs, alone."""
+    budget = ResourceBudget(cpus=4, memory_gb=8)
+    with budget.reserve(16, 64):
+        assert not budget.fits(0.5, 0)
+    assert budget.fits(4, 8)
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Scratch directory with a downloaded extract and faked compose steps."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OSM_FILENAME", "test-latest.osm.pbf")
+    monkeypatch.setenv("BUILD_CPU_BUDGET", "4")
+    monkeypatch.setenv("BUILD_MEMORY_BUDGET_GB", "24")
+    Path("data/raw").mkdir(parents=True)
+    Path("data/raw/test-latest.osm.pbf").write_bytes(b"pbf")
+    runs = []
+
+    def run_step(step, timeout=1800, env=None):
+        data_dir = Path(env["OSRM_DATA_DIR"])
+        assert (data_dir / "raw/test-latest.osm.pbf").read_bytes() == b"pbf"
+        runs.append((env["OSRM_PROFILE"], step, env["COMPOSE_PROJECT_NAME"]))
+        if step == "customize":
+            (data_dir / "processed").mkdir(parents=True, exist_ok=True)
+            (data_dir / "processed/test-latest.osrm.mldgr").write_text(env["OSRM_PROFILE"])
+        return StepResult(service=f"osrm-{step}", success=True, returncode=0)
+
+    monkeypatch.setattr(multi_profile, "download_osm", lambda **kwargs: True)
+    monkeypatch.setattr(multi_profile, "run_docker_compose_step", run_step)
+    monkeypatch.setattr(multi_profile, "cleanup_docker", lambda compose_file, env=None: True)
+    return runs
+
+
+def test_build_profiles_isolated_outputs(workspace):
+    """Test that every profile runs all steps in its own directory and compose project."""
+    assert multi_profile.build_profiles(["car", "foot", "bicycle"])
+
+    for profile in ["car", "foot", "bicycle"]:
+        steps = [step for name, step, project in workspace if name == profile]
+        assert steps == ["extract", "partition", "customize"]
+        assert {project for name, _, project in workspace if name == profile} == {f"osrm-{profile}"}
+        processed = Path(f"data/profiles/{profile}/processed/test-latest.osrm.mldgr")
+        assert processed.read_text() == profile
+        assert not Path(f"data/profiles/{profile}/raw/test-latest.osm.pbf").exists()
+    assert Path("data/raw/test-latest.osm.pbf").exists()
+
+
+def test_build_profiles_fails_when_one_profile_fails(workspace, monkeypatch):
+    """Test that a failed profile fails the run without stopping the others."""
+    run_step = multi_profile.run_docker_compose_step
+
+    def flaky(step, timeout=1800, env=None):
+        if env["OSRM_PROFILE"] == "foot" and step == "partition":
+            return StepResult(service="osrm-partition", success=False, returncode=1)
+        return run_step(step, timeout, env)
+
+    monkeypatch.setattr(multi_profile, "run_docker_compose_step", flaky)
+    assert not multi_profile.build_profiles(["car", "foot"])
+    assert Path("data/profiles/car/processed/test-latest.osrm.mldgr").exists()
+    assert not Path("data/profiles/foot/processed").exists()
+
+
+def test_build_profiles_publishes_per_profile_prefix(workspace, monkeypatch):
+    """Test that S3 mode uploads each profile under osrm/profiles/<profile>."""
+    monkeypatch.setattr(multi_profile, "download_from_s3", lambda *args, **kwargs: True)
+    storage = S3Storage()
+    try:
+        assert multi_profile.build_profiles(["car", "bicycle"], storage_mode="s3")
+        for profile in ["car", "bicycle"]:
+            key = f"osrm/profiles/{profile}/test-latest.osrm.mldgr"
+            assert storage.read_object(key) == profile.encode()
+    finally:
+        for profile in ["car", "bicycle"]:
+            storage.delete_file(f"osrm/profiles/{profile}/test-latest.osrm.mldgr")
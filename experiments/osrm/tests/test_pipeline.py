@@ -0,0 +1,153 @@
+"""Test pipelined uploads in the complete pipeline."""
+
+import shutil
+from pathlib import Path
+import pytest
+import main
+from src.core import process as process_module
+from src.core import transfer as transfer_module
+from src.core.process import stable_outputs
+from src.core.transfer import TransferWorker
+from src.utils.bundle import bundle_keys
+from src.utils.s3_utils import S3Storage
+
+
+REGION = "test-latest"
+
+
+def fake_step(step, rewrite_names=False):
+    """Write the files a pipeline step would produce into data/."""
+    intermediate = Path("data/intermediate")
+    intermediate.mkdir(parents=True, exist_ok=True)
+    if step == "extract":
+        for suffix in [".names", ".properties", ".ebg", ".geometry"]:
+            (intermediate / f"{REGION}.osrm{suffix}").write_bytes(f"extract{suffix}".encode())
+    elif step == "partition":
+        for suffix in [".ebg", ".geometry", ".partition", ".cells"]:
+            (intermediate / f"{REGION}.osrm{suffix}").write_bytes(f"partition{suffix}".encode())
+        if rewrite_names:
+            (intermediate / f"{REGION}.osrm.names").write_bytes(b"partition rewrote names")
+    elif step == "customize":
+        for suffix in [".mldgr", ".cell_metrics"]:
+            (intermediate / f"{REGION}.osrm{suffix}").write_bytes(f"customize{suffix}".encode())
+        Path("data/processed").mkdir(parents=True, exist_ok=True)
+        for path in intermediate.glob(f"{REGION}.osrm*"):
+            shutil.copy(path, Path("data/processed") / path.name)
+    return True
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    """Run complete_pipeline in a scratch directory with faked steps, recording uploads."""
+    monkeypatch.chdir(tmp_path)
+    storage = S3Storage()
+    events = []
+    real_upload = transfer_module.upload_to_s3
+
+    def recording_upload(local_path, s3_path, filename=None, **kwargs):
+        names = [Path(path).name for path in kwargs.get("files") or []]
+        events.append(("upload", filename or local_path, sorted(names)))
+        return real_upload(local_path, s3_path, filename, **kwargs)
+
+    def run(rewrite_names=False):
+        def step(name, timeout=1800):
+            events.append(("step", name))
+            return fake_step(name, rewrite_names)
+
+        monkeypatch.setattr(process_module, "run_docker_compose_step", step)
+        monkeypatch.setattr(transfer_module, "upload_to_s3", recording_upload)
+        monkeypatch.setattr(transfer_module, "download_from_s3", lambda *args, **kwargs: True)
+        monkeypatch.setattr(main, "upload_to_s3", recording_upload)
+        monkeypatch.setattr(main, "download_osm", lambda **kwargs: True)
+        monkeypatch.setattr(main, "cleanup_docker", lambda compose_file: True)
+        monkeypatch.setattr(main, "read_source_state", lambda storage_mode: {"md5": "abc"})
+        return main.complete_pipeline(storage_mode="s3", pipelined=True)
+
+    try:
+        yield storage, events, run
+    finally:
+        for key in storage.list_files("osrm/processed/"):
+            storage.delete_file(key)
+
+
+def test_stable_outputs(tmp_path):
+    """Test that files rewritten by later steps are not reported as stable."""
+    for suffix in [".names", ".ebg", ".partition", ".mldgr"]:
+        (tmp_path / f"{REGION}.osrm{suffix}").write_bytes(b"x")
+    (tmp_path / f"{REGION}.osm.pbf").write_bytes(b"x")
+
+    assert [p.name for p in stable_outputs("extract", str(tmp_path))] == [f"{REGION}.osrm.names"]
+    assert [p.name for p in stable_outputs("partition", str(tmp_path))] == [
+        f"{REGION}.osrm.ebg", f"{REGION}.osrm.names", f"{REGION}.osrm.partition"
+    ]
+    assert len(stable_outputs("customize", str(tmp_path))) == 4
+
+
+def test_transfer_worker_reports_failures():
+    """Test that the worker surfaces both False results and exceptions."""
+    def boom():
+        raise RuntimeError("boom")
+
+    with TransferWorker() as transfers:
+        transfers.submit("ok", lambda: True)
+        transfers.submit("false", lambda: False)
+        transfers.submit("boom", boom)
+        assert transfers.wait("ok")
+        assert not transfers.wait_all()
+        assert transfers.wait("missing")
+
+
+def test_pipelined_uploads_overlap_steps(pipeline):
+    """Test that stable outputs are queued per step and the stamp is uploaded last."""
+    storage, events, run = pipeline
+    assert run()
+
+    uploads = [event for event in events if event[0] == "upload"]
+    assert uploads[0] == ("upload", "data/intermediate", [f"{REGION}.osrm.names", f"{REGION}.osrm.properties"])
+    assert uploads[1] == ("upload", "data/intermediate", [
+        f"{REGION}.osrm.cells", f"{REGION}.osrm.ebg", f"{REGION}.osrm.geometry", f"{REGION}.osrm.partition"
+    ])
+    assert uploads[2] == ("upload", "data/processed", [f"{REGION}.osrm.cell_metrics", f"{REGION}.osrm.mldgr"])
+    assert uploads[-1] == ("upload", main.BUILD_STAMP, [])
+    assert events.index(("step", "partition")) < events.index(uploads[1])
+
+    for path in Path("data/processed").iterdir():
+        assert storage.read_object(f"osrm/processed/{path.name}") == path.read_bytes()
+
+
+def test_pipelined_uploads_resend_rewritten_files(pipeline):
+    """Test that a file rewritten after it was queued is uploaded again."""
+    storage, events, run = pipeline
+    assert run(rewrite_names=True)
+
+    final = [event for event in events if event[0] == "upload"][2]
+    assert f"{REGION}.osrm.names" in final[2]
+    assert storage.read_object(f"osrm/processed/{REGION}.osrm.names") == b"partition rewrote names"
+
+
+def test_conditional_bundle_run_skips_current_dataset(tmp_path, monkeypatch):
+    """Test that --conditional --bundle finds the build stamp inside the bundle and skips the rebuild."""
+    monkeypatch.chdir(tmp_path)
+    storage = S3Storage()
+    steps = []
+
+    def step(name, timeout=1800):
+        steps.append(name)
+        return fake_step(name)
+
+    monkeypatch.setattr(process_module, "run_docker_compose_step", step)
+    monkeypatch.setattr(transfer_module, "download_from_s3", lambda *args, **kwargs: True)
+    monkeypatch.setattr(main, "download_from_s3", lambda *args, **kwargs: True)
+    monkeypatch.setattr(main, "cleanup_docker", lambda compose_file: True)
+    monkeypatch.setattr(main, "check_source_unchanged", lambda storage_mode: {"md5": "abc"})
+    monkeypatch.setattr(main, "read_source_state", lambda storage_mode: {"md5": "abc"})
+    try:
+        assert main.complete_pipeline(storage_mode="s3", conditional=True, bundle=True)
+        assert steps == ["extract", "partition", "customize"]
+        assert main.read_build_stamp("s3", bundle=True)["md5"] == "abc"
+
+        assert main.complete_pipeline(storage_mode="s3", conditional=True, bundle=True)
+        assert steps == ["extract", "partition", "customize"]
+    finally:
+        for key in bundle_keys("osrm/processed"):
+            storage.delete_file(key)
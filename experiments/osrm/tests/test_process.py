@@ -0,0 +1,151 @@
+"""Test streaming docker-compose runs and OSRM log parsing."""
+
+import os
+import pytest
+from src.core import process as process_module
+from src.core.process import CpuLimits, resolve_cpu_limits, run_docker_compose, run_docker_compose_step
+from src.utils import budget as budget_module
+from src.utils.budget import cgroup_cpu_limit, format_cpuset
+from src.utils.osrm_log import OsrmLogParser, clean_line
+
+
+EXTRACT_LOG = """\
+osrm-extract-1  | [info] Parsing in progress..
+osrm-extract-1  | [info] input file: test-latest.osm.pbf
+osrm-extract-1  | [info] Parsing finished after 12.5 seconds
+osrm-extract-1  | [info] Sorting used nodes        ... ok, after 0.25s
+osrm-extract-1  | [info] Sorting edges by start    ... ok, after 0.75s
+osrm-extract-1  | [warn] Unexpected turn restriction
+osrm-extract-1  | [info] Generating edge-expanded graph representation
+osrm-extract-1  | [info]  . 10% . 20% . 30% . 40% . 50%
+osrm-extract-1  | [info]  . 60% . 70% . 80% . 90% . 100%
+osrm-extract-1  | [info] extraction finished after 45s
+"""
+
+# The same run as logged by recent images, which stamp every line
+TIMESTAMPED_EXTRACT_LOG = """\
+osrm-extract-1  | [2024-05-08T20:01:02.123456789] [info] Parsing in progress..
+osrm-extract-1  | [2024-05-08T20:01:02.123501337] [info] input file: test-latest.osm.pbf
+osrm-extract-1  | [2024-05-08T20:01:14.623982150] [info] Parsing finished after 12.5 seconds
+osrm-extract-1  | [2024-05-08T20:01:14.874120004] [info] Sorting used nodes        ... ok, after 0.25s
+osrm-extract-1  | [2024-05-08T20:01:15.624533810] [info] Sorting edges by start    ... ok, after 0.75s
+osrm-extract-1  | [2024-05-08T20:01:15.701000000] [warn] Unexpected turn restriction
+osrm-extract-1  | [2024-05-08T20:01:15.702000000] [info] Generating edge-expanded graph representation
+osrm-extract-1  | [2024-05-08T20:01:20.000000000] [info]  . 10% . 20% . 30% . 40% . 50%
+osrm-extract-1  | [2024-05-08T20:01:25.000000000] [info]  . 60% . 70% . 80% . 90% . 100%
+osrm-extract-1  | [2024-05-08T20:01:47.000000000] [info] extraction finished after 45s
+"""
+
+
+class FakeClock:
+    """Clock advancing one second per call."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += 1.0
+        return self.now
+
+
+def test_clean_line():
+    """Test stripping of compose prefixes and OSRM level tags."""
+    assert clean_line("osrm-extract-1  | [warn] careful\n") == ("warn", "careful")
+    assert clean_line("plain output") == ("info", "plain output")
+    assert clean_line("osrm-extract-1  | [2024-05-08T20:01:02.123456789] [error] bad input\n") == ("error", "bad input")
+
+
+@pytest.mark.parametrize("log", [EXTRACT_LOG, TIMESTAMPED_EXTRACT_LOG], ids=["plain", "timestamped"])
+def test_parser_phases_durations_progress(log):
+    """Test that markers, reported durations and percentages are aggregated."""
+    parser = OsrmLogParser(clock=FakeClock())
+    for line in log.splitlines():
+        parser.feed(line)
+    phases = parser.finish()
+
+    assert list(phases) == ["parsing", "sorting", "edge expansion"]
+    assert phases["parsing"] == 3.0
+    assert phases["sorting"] == 3.0
+    assert parser.reported == {"parsing": 12.5, "sorting used nodes": 0.25, "sorting edges by start": 0.75, "extraction": 45.0}
+    assert [event["percent"] for event in parser.progress] == [50, 100]
+    assert {event["phase"] for event in parser.progress} == {"edge expansion"}
+
+
+def test_run_docker_compose_streams_result(fake_compose, tmp_path):
+    """Test that a successful run returns a truthy result with timings and a bounded tail."""
+    log_file = tmp_path / "extract.log"
+    log_file.write_text(EXTRACT_LOG + "".join(f"line {i}\n" for i in range(200)))
+    fake_compose(f"cat {log_file}")
+
+    result = run_docker_compose("docker-compose.extract.yml", "osrm-extract", timeout=30)
+    assert result
+    assert result.returncode == 0
+    assert "edge expansion" in result.phases
+    assert result.reported["parsing"] == 12.5
+    assert len(result.tail) == 50
+    assert result.tail[-1] == "line 199"
+
+
+def test_run_docker_compose_failure_and_timeout(fake_compose):
+    """Test that failing and hanging services produce falsy results."""
+    fake_compose("echo '[error] boom'", exit_code=3)
+    result = run_docker_compose("docker-compose.extract.yml", "osrm-extract", timeout=30)
+    assert not result
+    assert result.returncode == 3
+    assert result.tail == ["[error] boom"]
+
+    fake_compose("echo '[info] Parsing in progress'; exec sleep 30")
+    result = run_docker_compose("docker-compose.extract.yml", "osrm-extract", timeout=1)
+    assert not result
+    assert result.duration < 10
+    assert "parsing" in result.phases
+
+
+def test_cgroup_cpu_limit(tmp_path, monkeypatch):
+    """Test reading cgroup v2 CPU quotas, including the unlimited case."""
+    cpu_max = tmp_path / "cpu.max"
+    monkeypatch.setattr(budget_module, "CGROUP_CPU_MAX", cpu_max)
+    monkeypatch.setattr(budget_module, "CGROUP_CPU_V1", (tmp_path / "quota", tmp_path / "period"))
+    assert cgroup_cpu_limit() is None
+
+    cpu_max.write_text("250000 100000\n")
+    assert cgroup_cpu_limit() == 2.5
+    cpu_max.write_text("max 100000\n")
+    assert cgroup_cpu_limit() is None
+
+    assert format_cpuset({0, 1, 2, 5, 7, 8}) == "0-2,5,7-8"
+
+
+def test_resolve_cpu_limits(monkeypatch):
+    """Test per-step thread overrides, explicit limits and the auto mode."""
+    env = {"OSRM_THREADS": "8", "OSRM_PARTITION_THREADS": "2", "OSRM_CPUSET": "0-3"}
+    assert resolve_cpu_limits("extract", env) == CpuLimits(threads=8, cpuset="0-3")
+    assert resolve_cpu_limits("partition", env) == CpuLimits(threads=2, cpuset="0-3")
+    assert resolve_cpu_limits("customize", {}) == CpuLimits()
+
+    monkeypatch.setattr(process_module, "cgroup_cpu_limit", lambda: 2.5)
+    monkeypatch.setattr(process_module, "available_cpus", lambda: 2.5)
+    monkeypatch.setattr(process_module, "affinity_cpus", lambda: set(range(os.cpu_count() or 1)))
+    assert resolve_cpu_limits("extract", {"OSRM_THREADS": "auto"}) == CpuLimits(threads=2, cpus=2.5)
+    assert resolve_cpu_limits("extract", {"OSRM_THREADS": "auto", "OSRM_CPUS": "1.5"}).cpus == 1.5
+
+    # Invalid values are logged instead of crashing the step
+    assert resolve_cpu_limits("extract", {"OSRM_THREADS": "eight"}) == CpuLimits(threads=2, cpus=2.5)
+    assert resolve_cpu_limits("partition", {"OSRM_THREADS": "4", "OSRM_PARTITION_THREADS": "0"}).threads == 2
+    assert resolve_cpu_limits("customize", {"OSRM_THREADS": "4", "OSRM_CPUS": "two"}) == CpuLimits(threads=4)
+
+    applied = CpuLimits(threads=4, cpus=2.0).apply({"OSRM_CPUSET": "0", "OSRM_PROFILE": "car"})
+    assert applied == {"OSRM_THREADS": "4", "OSRM_CPUS": "2", "OSRM_PROFILE": "car"}
+
+
+def test_run_step_passes_cpu_limits(fake_compose, monkeypatch):
+    """Test that the resolved limits reach docker-compose through its environment."""
+    fake_compose('echo "threads=$OSRM_THREADS cpuset=${OSRM_CPUSET:-none} cpus=$OSRM_CPUS"')
+    monkeypatch.setenv("OSRM_THREADS", "6")
+    monkeypatch.setenv("OSRM_CUSTOMIZE_THREADS", "3")
+    monkeypatch.setenv("OSRM_CPUS", "3.5")
+
+    assert run_docker_compose_step("partition", timeout=30).tail == ["threads=6 cpuset=none cpus=3.5"]
+    assert run_docker_compose_step("customize", timeout=30).tail == ["threads=3 cpuset=none cpus=3.5"]
+    result = run_docker_compose_step("customize", timeout=30, limits=CpuLimits(threads=1, cpuset="0"))
+    assert result.tail == ["threads=1 cpuset=0 cpus="]
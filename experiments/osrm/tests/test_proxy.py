@@ -0,0 +1,204 @@
+"""Test the caching, request-coalescing proxy against the fake osrm-routed."""
+
+import asyncio
+import threading
+import httpx
+import pytest
+from src.client.proxy import CachedResponse, CachingProxy, DiskCache, MemoryCache, normalize_target
+
+
+ROUTE = "/route/v1/driving/-122.419412,37.774929;-122.271111,37.804444"
+
+
+def run_proxy(base_url, scenario, **kwargs):
+    """Start a proxy on a free port, run scenario(client, proxy) against it, and shut down."""
+    async def run():
+        proxy = CachingProxy(base_url, **kwargs)
+        server = await proxy.serve("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+                return await scenario(client, proxy)
+        finally:
+            server.close()
+            await server.wait_closed()
+            await proxy.close()
+    return asyncio.run(run())
+
+
+def test_normalize_target():
+    """Test coordinate rounding, option canonicalization and uncacheable targets."""
+    assert normalize_target(f"{ROUTE}?steps=False&overview=full&alternatives=false") == (
+        "/route/v1/driving/-122.41941,37.77493;-122.27111,37.80444?overview=full"
+    )
+    assert normalize_target(f"{ROUTE}?overview=full&steps=false") == normalize_target(f"{ROUTE}?overview=full")
+    assert normalize_target("/table/v1/driving/0,0;1,1?annotations=duration,distance&sources=0") == (
+        "/table/v1/driving/0.00000,0.00000;1.00000,1.00000?annotations=duration,distance&sources=0"
+    )
+    assert normalize_target("/nearest/v1/driving/0.1234567,1.7654321.json?number=1", precision=3) == (
+        "/nearest/v1/driving/0.123,1.765.json"
+    )
+    assert normalize_target("/tile/v1/driving/tile(1310,3166,13).mvt") == "/tile/v1/driving/tile(1310,3166,13).mvt"
+    assert normalize_target("/route/v1/driving/polyline(ofp_Ik_vpAilAyu@)") is None
+    assert normalize_target("/health") is None
+
+
+def test_memory_cache_evicts_least_recently_used():
+    """Test the byte bound and LRU order."""
+    cache = MemoryCache(max_bytes=10)
+    for key in "abc":
+        cache.put(key, CachedResponse(200, "application/json", b"xxxx"))
+    assert cache.get("a") is None and cache.size == 8
+    cache.get("b")
+    cache.put("d", CachedResponse(200, "application/json", b"xxxx"))
+    assert list(cache.entries) == ["b", "d"]
+    cache.put("huge", CachedResponse(200, "application/json", b"x" * 11))
+    assert "huge" not in cache.entries
+
+
+def test_proxy_caches_equivalent_requests(osrm_server):
+    """Test that equivalent requests hit the cache, errors are not cached and stats are served."""
+    base_url, server = osrm_server
+
+    async def scenario(client, proxy):
+        first = await client.get(f"{ROUTE}?steps=false")
+        second = await client.get(f"{ROUTE.replace('37.774929', '37.7749291')}?steps=False")
+        errors = [await client.get(f"{ROUTE}?exclude=NoRoute") for _ in range(2)]
+        stats = (await client.get("/_proxy/stats")).json()
+        return first, second, errors, stats
+
+    first, second, errors, stats = run_proxy(base_url, scenario, version_source=lambda: "v1")
+
+    assert first.headers["x-cache"] == "MISS" and second.headers["x-cache"] == "HIT"
+    assert first.content == second.content and first.json()["code"] == "Ok"
+    assert first.headers["x-dataset-version"] == "v1"
+    assert [response.status_code for response in errors] == [400, 400]
+    assert server.requests.count(server.requests[0]) == 1
+    assert server.requests[0] == "/route/v1/driving/-122.41941,37.77493;-122.27111,37.80444"
+    assert len(server.requests) == 3
+    assert stats["hits"] == 1 and stats["misses"] == 3 and stats["version"] == "v1"
+
+
+def test_proxy_coalesces_concurrent_requests(osrm_server):
+    """Test that identical in-flight requests share one upstream call."""
+    base_url, server = osrm_server
+    server.delay = 0.3
+
+    async def scenario(client, proxy):
+        return await asyncio.gather(*(client.get(ROUTE) for _ in range(10)))
+
+    responses = run_proxy(base_url, scenario, version_source=lambda: "v1")
+
+    assert len(server.requests) == 1
+    states = [response.headers["x-cache"] for response in responses]
+    assert states.count("MISS") == 1 and states.count("COALESCED") == 9
+    assert len({response.content for response in responses}) == 1
+
+
+def test_new_dataset_version_drops_both_tiers(osrm_server, tmp_path):
+    """Test that publishing a new release empties the caches and the disk tier survives restarts."""
+    base_url, server = osrm_server
+    version = {"name": "20250101T000000Z"}
+    settings = dict(version_source=lambda: version["name"], version_interval=0, disk_dir=str(tmp_path / "cache"))
+
+    async def first_run(client, proxy):
+        states = [(await client.get(ROUTE)).headers["x-cache"]]
+        proxy.memory.clear()
+        states.append((await client.get(ROUTE)).headers["x-cache"])
+        return states
+
+    assert run_proxy(base_url, first_run, **settings) == ["MISS", "DISK"]
+
+    async def restarted(client, proxy):
+        states = [(await client.get(ROUTE)).headers["x-cache"]]
+        version["name"] = "20250102T000000Z"
+        states.append((await client.get(ROUTE)).headers["x-cache"])
+        states.append((await client.get(ROUTE)).headers["x-cache"])
+        return states
+
+    assert run_proxy(base_url, restarted, **settings) == ["DISK", "MISS", "HIT"]
+    assert len(server.requests) == 2
+    assert [path.name for path in (tmp_path / "cache").iterdir()] == ["20250102T000000Z"]
+
+
+@pytest.mark.parametrize("method", ["POST", "DELETE"])
+def test_proxy_only_serves_get(osrm_server, method):
+    """Test that other methods are refused without reaching osrm-routed."""
+    base_url, server = osrm_server
+
+    async def scenario(client, proxy):
+        return await client.request(method, ROUTE)
+
+    assert run_proxy(base_url, scenario, version_source=lambda: None).status_code == 405
+    assert server.requests == []
+
+
+def test_waiters_take_over_when_leader_is_cancelled(osrm_server):
+    """Test that coalesced requests fetch for themselves when the leading request is cancelled."""
+    base_url, server = osrm_server
+    server.delay = 0.3
+
+    async def run():
+        proxy = CachingProxy(base_url, version_source=lambda: "v1")
+        try:
+            leader = asyncio.create_task(proxy.handle(ROUTE))
+            await asyncio.sleep(0.05)
+            waiters = [asyncio.create_task(proxy.handle(ROUTE)) for _ in range(3)]
+            await asyncio.sleep(0.05)
+            leader.cancel()
+            return await asyncio.gather(*waiters)
+        finally:
+            await proxy.close()
+
+    results = asyncio.run(run())
+
+    assert sorted(state for _, state in results) == ["COALESCED", "COALESCED", "MISS"]
+    assert all(response.status == 200 for response, _ in results)
+    assert len(server.requests) == 2
+
+
+def test_version_switch_clears_disk_off_the_event_loop(osrm_server, tmp_path, monkeypatch):
+    """Test that the disk tier drops old versions in a worker thread."""
+    base_url, _ = osrm_server
+    threads = []
+    real_set_version = DiskCache.set_version
+
+    def set_version(self, version):
+        threads.append(threading.get_ident())
+        real_set_version(self, version)
+
+    monkeypatch.setattr(DiskCache, "set_version", set_version)
+    (tmp_path / "cache/20250101T000000Z").mkdir(parents=True)
+    (tmp_path / "cache/20250101T000000Z/stale").write_bytes(b"200 application/json\n{}")
+
+    async def scenario(client, proxy):
+        return (await client.get(ROUTE)).headers["x-cache"], threading.get_ident()
+
+    state, loop_thread = run_proxy(
+        base_url, scenario, version_source=lambda: "20250102T000000Z", disk_dir=str(tmp_path / "cache")
+    )
+    assert state == "MISS"
+    assert threads and loop_thread not in threads
+    assert [path.name for path in (tmp_path / "cache").iterdir()] == ["20250102T000000Z"]
+
+
+@pytest.mark.parametrize("target", [
+    "http://169.254.169.254/latest/meta-data",
+    "//169.254.169.254/latest/meta-data",
+    "169.254.169.254/latest/meta-data",
+])
+def test_proxy_rejects_targets_naming_another_host(target):
+    """Test that absolute-form and //host targets are refused instead of fetched."""
+    fetched = []
+    transport = httpx.MockTransport(lambda request: fetched.append(str(request.url)) or httpx.Response(200))
+
+    async def run():
+        proxy = CachingProxy("http://osrm:5000", version_source=lambda: "v1", transport=transport)
+        try:
+            return await proxy.handle(target), await proxy.handle("/health")
+        finally:
+            await proxy.close()
+
+    (rejected, state), _ = asyncio.run(run())
+    assert rejected.status == 400 and state == "BYPASS"
+    assert fetched == ["http://osrm:5000/health"]
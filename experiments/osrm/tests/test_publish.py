@@ -0,0 +1,116 @@
+"""Test dataset hot swaps through osrm-datastore releases."""
+
+import json
+import os
+from pathlib import Path
+import pytest
+from src.core import publish as publish_module
+from src.core.process import REQUIRED_OUTPUTS
+from src.core.publish import current_release, health_check, list_releases, prune_releases, publish, set_current, stage_release
+from tests.conftest import QuietHandler, serve_directory
+
+
+REGION = "test-latest"
+
+
+class RouteHandler(QuietHandler):
+    """Fake osrm-routed answering routes only while the server is marked healthy."""
+
+    def do_GET(self):
+        healthy = self.server.healthy
+        body = json.dumps({"code": "Ok", "routes": []} if healthy else {"code": "NoSegment", "message": "no data"})
+        self.send_response(200 if healthy else 400)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+
+@pytest.fixture
+def osrm_server(monkeypatch):
+    """Fake routing server; yields the server so tests can flip its health."""
+    with serve_directory(RouteHandler) as (_, base_url, server):
+        server.healthy = True
+        monkeypatch.setenv("OSRM_SERVER_URL", base_url)
+        yield server
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    """A complete dataset in data/processed and an empty releases directory."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OSRM_REGION", REGION)
+    monkeypatch.setenv("OSRM_RELEASES_DIR", "data/releases")
+    monkeypatch.setenv("PUBLISH_HEALTH_ATTEMPTS", "1")
+    processed = Path("data/processed")
+    processed.mkdir(parents=True)
+    for suffixes in REQUIRED_OUTPUTS.values():
+        for suffix in suffixes:
+            (processed / f"{REGION}.osrm{suffix}").write_text(suffix)
+    return processed
+
+
+def test_health_check(osrm_server):
+    """Test that only an "Ok" route response counts as healthy."""
+    url = os.environ["OSRM_SERVER_URL"]
+    assert health_check(url, "0,0;1,1")
+    osrm_server.healthy = False
+    assert not health_check(url, "0,0;1,1")
+    assert not health_check("http://127.0.0.1:9", "0,0;1,1", timeout=1)
+
+
+def test_stage_release_links_and_prune_keeps_current(dataset):
+    """Test that releases hard-link the dataset and pruning never removes the serving one."""
+    assert stage_release(Path("data/empty"), REGION) is None
+
+    versions = []
+    for name in ["20250101T000000Z", "20250102T000000Z", "20250103T000000Z", "20250104T000000Z"]:
+        Path(f"data/releases/{name}").mkdir(parents=True)
+        versions.append(name)
+    staged = stage_release(dataset, REGION)
+    assert staged and staged > versions[-1]
+    assert os.path.samefile(dataset / f"{REGION}.osrm.mldgr", Path(f"data/releases/{staged}/{REGION}.osrm.mldgr"))
+
+    set_current(versions[0])
+    assert current_release() == versions[0]
+    prune_releases(keep=2)
+    assert list_releases() == [versions[0], versions[-1], staged]
+
+
+def test_publish_swaps_and_rolls_back(dataset, osrm_server, monkeypatch):
+    """Test a healthy swap, then a failed one that reloads the previous release."""
+    loads = []
+
+    def load(version, region, timeout=1800):
+        loads.append(version)
+        osrm_server.healthy = version != "bad"
+        return True
+
+    monkeypatch.setattr(publish_module, "load_datastore", load)
+
+    assert publish()
+    first = current_release()
+    assert loads == [first] and osrm_server.healthy
+
+    monkeypatch.setattr(publish_module, "stage_release", lambda source_dir, region: "bad")
+    assert not publish()
+    assert loads == [first, "bad", first]
+    assert current_release() == first and osrm_server.healthy
+
+
+def test_publish_refuses_unhealthy_server_without_force(dataset, osrm_server, monkeypatch):
+    """Test that an unhealthy server blocks the swap unless forced, and the first release becomes current."""
+    loads = []
+
+    def load(version, region, timeout=1800):
+        loads.append(version)
+        osrm_server.healthy = True
+        return True
+
+    monkeypatch.setattr(publish_module, "load_datastore", load)
+    osrm_server.healthy = False
+
+    assert not publish()
+    assert loads == [] and list_releases() == []
+
+    assert publish(force=True)
+    assert loads == list_releases() == [current_release()]
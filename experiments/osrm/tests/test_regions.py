@@ -0,0 +1,156 @@
+"""Test the region DAG scheduler and memory-aware admission."""
+
+import json
+import threading
+import time
+from pathlib import Path
+import pytest
+from src.core import regions as regions_module
+from src.core.process import StepResult
+from src.core.regions import Region, build_regions, estimate_memory_gb, load_regions
+from src.utils.budget import GB, ResourceBudget
+from src.utils.scheduler import DagScheduler, Task
+
+
+class Tracker:
+    """Record which tasks run concurrently and the memory they hold."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = {}
+        self.order = []
+        self.peak_memory = 0.0
+        self.overlaps = set()
+
+    def task(self, name, memory_gb, deps=(), succeed=True):
+        def run():
+            with self.lock:
+                self.running[name] = memory_gb
+                self.order.append(name)
+                self.peak_memory = max(self.peak_memory, sum(self.running.values()))
+                self.overlaps.update(frozenset((name, other)) for other in self.running if other != name)
+            time.sleep(0.05)
+            with self.lock:
+                del self.running[name]
+            return succeed
+        return Task(name=name, run=run, deps=list(deps), memory_gb=memory_gb)
+
+
+def test_scheduler_respects_memory_budget():
+    """Test that small tasks share the budget while a large one runs alone."""
+    tracker = Tracker()
+    tasks = [tracker.task(f"small{i}", 5) for i in range(4)] + [tracker.task("large", 20)]
+    results = DagScheduler(ResourceBudget(cpus=8, memory_gb=25), max_workers=8).run(tasks)
+
+    assert all(results.values())
+    assert tracker.peak_memory <= 25
+    assert tracker.order[0] == "large"
+    assert any(frozenset((f"small{i}", f"small{j}")) in tracker.overlaps for i in range(4) for j in range(4) if i != j)
+
+
+def test_scheduler_orders_dependencies_and_skips_failures():
+    """Test that tasks wait for their dependencies and failures skip only dependents."""
+    tracker = Tracker()
+    tasks = [
+        tracker.task("a/download", 1),
+        tracker.task("a/extract", 1, deps=["a/download"], succeed=False),
+        tracker.task("a/partition", 1, deps=["a/extract"]),
+        tracker.task("b/download", 1),
+        tracker.task("b/extract", 1, deps=["b/download"]),
+    ]
+    results = DagScheduler(ResourceBudget(cpus=8, memory_gb=25)).run(tasks)
+
+    assert results == {
+        "a/download": True, "a/extract": False, "a/partition": False,
+        "b/download": True, "b/extract": True,
+    }
+    assert "a/partition" not in tracker.order
+    assert tracker.order.index("b/download") < tracker.order.index("b/extract")
+
+
+def test_scheduler_rejects_unknown_dependencies_and_cycles():
+    """Test dependency validation and cycle detection."""
+    scheduler = DagScheduler(ResourceBudget(cpus=1, memory_gb=1))
+    with pytest.raises(ValueError):
+        scheduler.run([Task(name="a", run=lambda: True, deps=["missing"])])
+
+    results = scheduler.run([
+        Task(name="a", run=lambda: True, deps=["b"]),
+        Task(name="b", run=lambda: True, deps=["a"]),
+    ])
+    assert results == {"a": False, "b": False}
+
+
+def test_load_regions_and_estimates(tmp_path, monkeypatch):
+    """Test the region list format and the memory estimate precedence."""
+    monkeypatch.chdir(tmp_path)
+    Path("regions.json").write_text(json.dumps({"regions": [
+        {"name": "big", "url": "http://example.com/big-latest.osm.pbf", "memory_gb": {"extract": 20}},
+        {"name": "small", "url": "http://example.com/small-latest.osm.pbf", "profile": "foot"},
+    ]}))
+
+    big, small = load_regions()
+    assert small.osrm_name == "small-latest" and small.profile == "foot"
+    assert small.env()["OSRM_DATA_DIR"] == "./data/regions/small"
+    assert load_regions(only=["small"]) == [small]
+    with pytest.raises(ValueError):
+        load_regions(only=["nowhere"])
+
+    assert estimate_memory_gb(big, "extract") == 20
+    small.osm_file.parent.mkdir(parents=True)
+    with open(small.osm_file, "wb") as f:
+        f.truncate(GB // 2)
+    assert estimate_memory_gb(small, "extract") == 4.0
+    assert estimate_memory_gb(small, "customize") == 1.5
+
+    regions_module.record_measured_peak(small, "extract", 2 * GB)
+    assert estimate_memory_gb(small, "extract") == pytest.approx(2.4)
+
+
+def test_build_regions_runs_every_stage_per_region(tmp_path, monkeypatch):
+    """Test that each region downloads and builds into its own directory."""
+    monkeypatch.chdir(tmp_path)
+    runs = []
+
+    def download(storage_type, conditional, source, raw_dir):
+        Path(raw_dir).mkdir(parents=True, exist_ok=True)
+        (Path(raw_dir) / source[1]).write_bytes(b"pbf")
+        return True
+
+    def run_step(step, timeout=1800, env=None):
+        data_dir = Path(env["OSRM_DATA_DIR"])
+        assert (data_dir / "raw" / env["OSM_FILENAME"]).exists()
+        runs.append((env["COMPOSE_PROJECT_NAME"], step))
+        if step == "customize":
+            (data_dir / "processed").mkdir(parents=True, exist_ok=True)
+            (data_dir / f"processed/{env['OSRM_REGION']}.osrm.mldgr").write_text(step)
+        return StepResult(service=f"osrm-{step}", success=True, returncode=0, peak_memory_bytes=GB)
+
+    monkeypatch.setattr(regions_module, "download_osm", download)
+    monkeypatch.setattr(regions_module, "run_docker_compose_step", run_step)
+    monkeypatch.setattr(regions_module, "cleanup_docker", lambda compose_file, env=None: True)
+
+    regions = [
+        Region(name="oregon", url="http://example.com/oregon-latest.osm.pbf"),
+        Region(name="nevada", url="http://example.com/nevada-latest.osm.pbf"),
+    ]
+    assert build_regions(regions, budget=ResourceBudget(cpus=4, memory_gb=25))
+
+    for region in regions:
+        assert [step for project, step in runs if project == f"osrm-{region.name}"] == [
+            "extract", "partition", "customize"
+        ]
+        assert (region.workdir / f"processed/{region.osrm_name}.osrm.mldgr").exists()
+        assert regions_module.read_measured_peaks(region) == {"extract": 1.0, "partition": 1.0, "customize": 1.0}
+
+
+def test_region_tasks_publish_outside_default_dataset(monkeypatch):
+    """Test that S3 mode uploads each region under osrm/regions/<region>, not osrm/processed."""
+    uploads = []
+    monkeypatch.setattr(regions_module, "upload_to_s3", lambda local, s3_path, sync=False: uploads.append(s3_path) or True)
+    region = Region(name="oregon", url="http://example.com/oregon-latest.osm.pbf")
+
+    tasks = regions_module.region_tasks(region, storage_mode="s3")
+    assert tasks[-1].name == "oregon/upload" and tasks[-1].deps == ["oregon/customize"]
+    assert tasks[-1].run()
+    assert uploads == ["osrm/regions/oregon"]
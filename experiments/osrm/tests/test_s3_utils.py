@@ -1,9 +1,13 @@
 """Test S3 utility functions."""
 
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import pytest
-from src.utils.s3_utils import S3Storage
+from botocore.exceptions import ClientError
+from src.core import transfer as transfer_module
+from src.core.transfer import download_from_s3, upload_to_s3
+from src.utils.s3_utils import S3Storage, get_storage
 
 
 def test_s3_storage_init():
@@ -15,6 +19,16 @@ def test_s3_storage_init():
     assert storage.bucket == "dev"
 
 
+def test_shared_client():
+    """Test that storage instances share one pooled client per configuration."""
+    assert S3Storage().client is S3Storage().client
+    
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        storages = list(executor.map(lambda _: get_storage(), range(16)))
+    assert all(storage is storages[0] for storage in storages)
+    assert storages[0].client is S3Storage().client
+
+
 def test_upload_download_file():
     """Test uploading and downloading a file."""
     storage = S3Storage()
@@ -131,4 +145,130 @@ def test_nonexistent_file():
     assert storage.get_file_info("osrm/test/nonexistent.txt") is None
     
     # Download nonexistent file
-    assert not storage.download_file("osrm/test/nonexistent.txt", "/tmp/test.txt")
\ No newline at end of file
+    assert not storage.download_file("osrm/test/nonexistent.txt", "/tmp/test.txt")
+
+def test_upload_directory_parallel():
+    """Test uploading a directory with multiple workers."""
+    storage = S3Storage()
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for i in range(6):
+            (Path(temp_dir) / f"upload_{i}.txt").write_text(f"Parallel content {i}")
+        (Path(temp_dir) / "nested").mkdir()
+        (Path(temp_dir) / "nested" / "deep.txt").write_text("Nested content")
+        
+        prefix = "osrm/test/upload_dir"
+        assert storage.upload_directory(temp_dir, prefix, max_workers=3) == 7
+    
+    files = storage.list_files(f"{prefix}/")
+    assert f"{prefix}/nested/deep.txt" in files
+    assert len(files) == 7
+    
+    # Clean up
+    for key in files:
+        storage.delete_file(key)
+
+
+def test_upload_directory_fails_on_one_failed_file(monkeypatch):
+    """Test that a single failed file fails the whole directory upload."""
+    storage = S3Storage()
+    prefix = "osrm/test/upload_partial"
+    
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(4):
+                (Path(temp_dir) / f"part_{i}.txt").write_text(f"content {i}")
+            real_upload = storage._upload_file
+            monkeypatch.setattr(transfer_module, "get_storage", lambda: storage)
+            monkeypatch.setattr(
+                storage, "_upload_file",
+                lambda path, key: not key.endswith("part_2.txt") and real_upload(path, key)
+            )
+            assert storage.upload_directory(temp_dir, prefix) == 0
+            assert not upload_to_s3(temp_dir, prefix)
+    finally:
+        monkeypatch.undo()
+        for key in storage.list_files(f"{prefix}/"):
+            storage.delete_file(key)
+
+
+def test_list_and_download_directory_paginated():
+    """Test listing and downloading a prefix with more than one page of keys."""
+    storage = S3Storage()
+    prefix = "osrm/test/paginated"
+    keys = [f"{prefix}/part_{i:04d}.txt" for i in range(1005)]
+    
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(
+            lambda key: storage.client.put_object(Bucket=storage.bucket, Key=key, Body=key.encode()),
+            keys
+        ))
+    
+    try:
+        # Listing must follow continuation tokens past the 1000-key page limit
+        assert sorted(storage.list_files(f"{prefix}/")) == keys
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            assert storage.download_directory(prefix, temp_dir, max_workers=8) == len(keys)
+            assert (Path(temp_dir) / "part_1004.txt").read_text() == keys[-1]
+    finally:
+        # Clean up in batches of 1000 (delete_objects limit)
+        for i in range(0, len(keys), 1000):
+            storage.client.delete_objects(
+                Bucket=storage.bucket,
+                Delete={"Objects": [{"Key": key} for key in keys[i:i + 1000]]}
+            )
+
+
+class FailingPaginatorClient:
+    """S3 client proxy whose listings fail with a ClientError after the first page."""
+    
+    def __init__(self, client):
+        self.client = client
+    
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+    
+    def get_paginator(self, operation):
+        pages = self.client.get_paginator(operation)
+        
+        class Paginator:
+            def paginate(self, **kwargs):
+                for number, page in enumerate(pages.paginate(**kwargs, PaginationConfig={"PageSize": 2})):
+                    if number == 1:
+                        raise ClientError({"Error": {"Code": "InternalError", "Message": "listing failed"}}, "ListObjectsV2")
+                    yield page
+        
+        return Paginator()
+
+
+def test_download_directory_fails_on_partial_restore(monkeypatch):
+    """Test that a failed object or a listing error mid-pagination fails the whole download."""
+    storage = S3Storage()
+    prefix = "osrm/test/partial"
+    keys = [f"{prefix}/part_{i}.txt" for i in range(5)]
+    for key in keys:
+        storage.client.put_object(Bucket=storage.bucket, Key=key, Body=key.encode())
+    
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            real_download = storage._download_file
+            monkeypatch.setattr(transfer_module, "get_storage", lambda: storage)
+            monkeypatch.setattr(
+                storage, "_download_file",
+                lambda key, path: not key.endswith("part_3.txt") and real_download(key, path)
+            )
+            assert storage.download_directory(prefix, temp_dir) == 0
+            assert not download_from_s3(prefix, temp_dir)
+            monkeypatch.undo()
+        
+        monkeypatch.setattr(storage, "client", FailingPaginatorClient(storage.client))
+        with pytest.raises(ClientError):
+            list(storage.iter_objects(f"{prefix}/"))
+        assert storage.list_files(f"{prefix}/") == []
+        with tempfile.TemporaryDirectory() as temp_dir:
+            assert storage.download_directory(prefix, temp_dir) == 0
+    finally:
+        monkeypatch.undo()
+        for key in keys:
+            storage.delete_file(key)
@@ -0,0 +1,177 @@
+"""Test the content-addressed stage cache."""
+
+import shutil
+from pathlib import Path
+import pytest
+from src.core import process as process_module
+from src.core import stage_cache as cache_module
+from src.core.process import StepResult
+from src.core.stage_cache import StageCache, read_keys, run_cached_step, step_key
+from src.utils.s3_utils import S3Storage
+
+
+COMPOSE = """\
+services:
+  osrm-{step}:
+    image: ghcr.io/project-osrm/osrm-backend:latest
+    user: "${{DOCKER_USER}}"
+    command: osrm-{step} /data/intermediate/${{OSRM_REGION}}.osrm -p /opt/${{OSRM_PROFILE}}.lua
+"""
+
+
+def fake_step(step):
+    """Write the files a pipeline step would produce."""
+    intermediate = Path("data/intermediate")
+    intermediate.mkdir(parents=True, exist_ok=True)
+    raw = Path("data/raw/test-latest.osm.pbf").read_bytes()
+    if step == "extract":
+        (intermediate / "test-latest.osrm.names").write_bytes(b"names:" + raw)
+        (intermediate / "test-latest.osrm.ebg").write_bytes(b"ebg:" + raw)
+    elif step == "partition":
+        (intermediate / "test-latest.osrm.ebg").write_bytes(b"partitioned ebg")
+        (intermediate / "test-latest.osrm.cells").write_bytes(b"cells")
+    elif step == "customize":
+        (intermediate / "test-latest.osrm.mldgr").write_bytes(b"mldgr")
+        Path("data/processed").mkdir(parents=True, exist_ok=True)
+        for path in intermediate.glob("*.osrm*"):
+            shutil.copy(path, Path("data/processed") / path.name)
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Scratch pipeline directory with fake compose files, image and steps."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OSM_FILENAME", "test-latest.osm.pbf")
+    monkeypatch.setenv("OSRM_PROFILE", "car")
+    monkeypatch.setenv("OSRM_REGION", "test-latest")
+    for step in ["extract", "partition", "customize"]:
+        (tmp_path / f"docker-compose.{step}.yml").write_text(COMPOSE.format(step=step))
+    Path("data/raw").mkdir(parents=True)
+    Path("data/raw/test-latest.osm.pbf").write_bytes(b"pbf v1")
+
+    image = {"id": "sha256:image1"}
+    runs = []
+
+    def run_step(step, timeout=1800):
+        runs.append(step)
+        fake_step(step)
+        return StepResult(service=f"osrm-{step}", success=True, returncode=0)
+
+    monkeypatch.setattr(cache_module, "image_id", lambda name: image["id"])
+    monkeypatch.setattr(cache_module, "run_docker_compose_step", run_step)
+
+    storage = S3Storage()
+    prefix = f"osrm/test/cache-{tmp_path.name}"
+    cache = StageCache(storage, prefix)
+    try:
+        yield cache, runs, image
+    finally:
+        for key in storage.list_files(f"{prefix}/"):
+            storage.delete_file(key)
+
+
+def run_all(cache):
+    """Run the three steps through the cache and return their results."""
+    return [run_cached_step(step, cache=cache) for step in ["extract", "partition", "customize"]]
+
+
+def test_step_key_inputs(workspace, monkeypatch):
+    """Test that the key follows the PBF, profile and image but not DOCKER_USER."""
+    _, _, image = workspace
+    key = step_key("extract")
+    assert key and step_key("extract") == key
+
+    monkeypatch.setenv("DOCKER_USER", "1000:1000")
+    assert step_key("extract") == key
+
+    monkeypatch.setenv("OSRM_PROFILE", "foot")
+    assert step_key("extract") != key
+    monkeypatch.setenv("OSRM_PROFILE", "car")
+
+    image["id"] = "sha256:image2"
+    assert step_key("extract") != key
+    image["id"] = "sha256:image1"
+
+    Path("data/raw/test-latest.osm.pbf").write_bytes(b"pbf v2")
+    assert step_key("extract") != key
+
+    # Later steps need the key of the step before them
+    assert step_key("partition") is None
+
+
+def test_cache_hit_restores_outputs(workspace):
+    """Test that a second run restores every step instead of running it."""
+    cache, runs, _ = workspace
+    assert all(run_all(cache))
+    assert runs == ["extract", "partition", "customize"]
+    expected = {str(path): path.read_bytes() for path in Path("data").rglob("*.osrm*")}
+    keys = read_keys()
+
+    shutil.rmtree("data/intermediate")
+    shutil.rmtree("data/processed")
+    runs.clear()
+
+    results = run_all(cache)
+    assert all(results) and all(result.cached for result in results)
+    assert runs == []
+    assert {str(path): path.read_bytes() for path in Path("data").rglob("*.osrm*")} == expected
+    assert read_keys() == keys
+
+
+def test_cache_miss_after_input_change(workspace):
+    """Test that a new PBF reruns every step while unchanged blobs are shared."""
+    cache, runs, _ = workspace
+    assert all(run_all(cache))
+    Path("data/raw/test-latest.osm.pbf").write_bytes(b"pbf v2")
+    runs.clear()
+
+    results = run_all(cache)
+    assert runs == ["extract", "partition", "customize"]
+    assert not any(result.cached for result in results)
+    assert Path("data/processed/test-latest.osrm.names").read_bytes() == b"names:pbf v2"
+
+
+def test_uncached_run_forgets_stale_keys(workspace, monkeypatch):
+    """Test that a step run outside the cache drops its key and every later one."""
+    cache, runs, _ = workspace
+    assert all(run_all(cache))
+    Path("data/raw/test-latest.osm.pbf").write_bytes(b"pbf v2")
+
+    def compose(compose_file, service, timeout=1800, env=None):
+        fake_step(service.removeprefix("osrm-"))
+        return StepResult(service=service, success=True, returncode=0)
+
+    monkeypatch.setattr(process_module, "run_docker_compose", compose)
+    process_module.run_docker_compose_step("extract")
+    assert read_keys() == {}
+
+    # Partition can no longer chain off the extract key of the previous PBF
+    runs.clear()
+    result = run_cached_step("partition", cache=cache)
+    assert runs == ["partition"] and not result.cached
+
+
+def test_store_hashes_hard_links_once(workspace, monkeypatch):
+    """Test that hard-linked outputs are hashed once and keys follow OSRM_DATA_DIR."""
+    cache, _, _ = workspace
+    monkeypatch.setattr(cache_module, "_md5_cache", {})
+    hashed = []
+    real_md5 = cache_module.file_md5
+    monkeypatch.setattr(cache_module, "file_md5", lambda path: hashed.append(Path(path)) or real_md5(path))
+
+    data_dir = Path("data/profiles/foot")
+    monkeypatch.setenv("OSRM_DATA_DIR", f"./{data_dir.as_posix()}")
+    (data_dir / "intermediate").mkdir(parents=True)
+    (data_dir / "processed").mkdir()
+    output = data_dir / "intermediate/test-latest.osrm.mldgr"
+    output.write_bytes(b"mldgr")
+    (data_dir / "processed/test-latest.osrm.mldgr").hardlink_to(output)
+
+    assert cache.store("customize", "key1", sorted(data_dir.rglob("*.osrm*")))
+    assert cache.store("customize", "key2", [data_dir / "processed/test-latest.osrm.mldgr"])
+    assert len(hashed) == 1
+
+    cache_module.write_key("extract", "abc")
+    assert (data_dir / "intermediate/.stage_keys.json").exists()
+    assert not Path("data/intermediate/.stage_keys.json").exists()
+    assert read_keys() == {"extract": "abc"}
@@ -0,0 +1,110 @@
+"""Test zero-copy staging of pipeline artifacts."""
+
+import errno
+import os
+from pathlib import Path
+import pytest
+from src.core.process import run_docker_compose_step
+from src.utils import staging as staging_module
+from src.utils.staging import detach, link_or_copy, promote
+
+
+# Writes the files each fake OSRM step produces, failing extract without its staged input
+FAKE_OSRM = """\
+cd data/intermediate
+case "$4" in
+  osrm-extract)
+    test -f "$OSM_FILENAME" || { echo "missing input"; exit 1; }
+    for suffix in ebg geometry names properties fileIndex ramIndex timestamp; do
+      echo "extract" > "$OSRM_REGION.osrm.$suffix"
+    done ;;
+  osrm-partition)
+    for suffix in partition cells ebg; do echo "partition $RUN" > "$OSRM_REGION.osrm.$suffix"; done ;;
+  osrm-customize)
+    for suffix in mldgr cell_metrics; do echo "customize" > "$OSRM_REGION.osrm.$suffix"; done ;;
+esac
+"""
+
+
+def test_link_or_copy_links_and_falls_back(tmp_path, monkeypatch):
+    """Test hard links on one filesystem and copies across devices."""
+    source = tmp_path / "a.osrm"
+    source.write_text("data")
+    target = tmp_path / "out" / "a.osrm"
+    target.parent.mkdir()
+    target.write_text("stale")
+
+    assert link_or_copy(source, target) == "link"
+    assert os.path.samefile(source, target)
+    assert link_or_copy(source, target) == "link"
+
+    def cross_device(src, dst):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(staging_module.os, "link", cross_device)
+    copied = tmp_path / "other" / "a.osrm"
+    assert link_or_copy(source, copied) == "copy"
+    assert copied.read_text() == "data" and not os.path.samefile(source, copied)
+    assert sorted(path.name for path in target.parent.iterdir()) == ["a.osrm"]
+
+
+def test_detach_and_promote(tmp_path):
+    """Test that detaching protects promoted links and promotion verifies sizes."""
+    intermediate = tmp_path / "intermediate"
+    intermediate.mkdir()
+    files = []
+    for suffix in ["mldgr", "names"]:
+        path = intermediate / f"r.osrm.{suffix}"
+        path.write_text(suffix)
+        files.append(path)
+
+    assert promote(files, tmp_path / "processed")
+    promoted = tmp_path / "processed" / "r.osrm.mldgr"
+    assert os.path.samefile(files[0], promoted)
+
+    assert detach(files[0])
+    assert not detach(files[0])
+    files[0].write_text("rewritten")
+    assert promoted.read_text() == "mldgr"
+
+    with pytest.raises(FileNotFoundError):
+        promote([intermediate / "r.osrm.missing"], tmp_path / "processed")
+
+
+def test_pipeline_steps_stage_without_copies(fake_compose, monkeypatch):
+    """Test that extract reads a linked input and customize promotes by hard link."""
+    fake_compose(FAKE_OSRM)
+    monkeypatch.setenv("OSM_FILENAME", "test-latest.osm.pbf")
+    monkeypatch.setenv("OSRM_REGION", "test-latest")
+    monkeypatch.setenv("OSRM_DATA_DIR", "data")
+    raw = Path("data/raw/test-latest.osm.pbf")
+    raw.parent.mkdir(parents=True)
+    raw.write_bytes(b"pbf")
+
+    for step in ["extract", "partition", "customize"]:
+        assert run_docker_compose_step(step, timeout=30), step
+
+    assert raw.stat().st_nlink == 1
+    assert not Path("data/intermediate/test-latest.osm.pbf").exists()
+    processed = sorted(Path("data/processed").iterdir())
+    assert len(processed) == 11
+    for path in processed:
+        assert os.path.samefile(path, Path("data/intermediate") / path.name)
+
+    # Re-running partition rewrites its files without touching the promoted dataset
+    monkeypatch.setenv("RUN", "again")
+    assert run_docker_compose_step("partition", timeout=30)
+    assert Path("data/intermediate/test-latest.osrm.partition").read_text() == "partition again\n"
+    assert Path("data/processed/test-latest.osrm.partition").read_text() == "partition \n"
+    assert os.path.samefile("data/processed/test-latest.osrm.names", "data/intermediate/test-latest.osrm.names")
+
+
+def test_missing_artifact_fails_step(fake_compose, monkeypatch):
+    """Test that a step exiting 0 without its expected outputs fails."""
+    fake_compose("true")
+    monkeypatch.setenv("OSRM_REGION", "test-latest")
+    monkeypatch.setenv("OSRM_DATA_DIR", "data")
+    result = run_docker_compose_step("customize", timeout=30)
+    assert result.returncode == 0
+    assert not result
+    assert not Path("data/processed").exists()
@@ -0,0 +1,96 @@
+"""Test delta sync between local directories and S3."""
+
+import tempfile
+from pathlib import Path
+from src.utils.s3_utils import S3Storage
+from src.utils.sync_index import SyncIndex, file_md5
+
+
+def count_calls(monkeypatch, storage, method_name):
+    """Wrap a storage method and return a list that records each call."""
+    calls = []
+    original = getattr(storage, method_name)
+    
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        return original(*args, **kwargs)
+    
+    monkeypatch.setattr(storage, method_name, wrapper)
+    return calls
+
+
+def test_record_and_lookup():
+    """Test index rows round-trip and reuse of recorded hashes."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        local_file = Path(temp_dir) / "data.bin"
+        local_file.write_bytes(b"routing graph")
+        
+        with SyncIndex(str(Path(temp_dir) / "index.sqlite")) as index:
+            index.record("dev", "osrm/test/data.bin", str(local_file), '"abc-2"')
+            entry = index.get("dev", "osrm/test/data.bin", str(local_file))
+            
+            assert entry["etag"] == "abc-2"
+            assert entry["md5"] == file_md5(local_file)
+            assert entry["size"] == len(b"routing graph")
+            assert index.in_sync("dev", "osrm/test/data.bin", str(local_file), {"Size": 13, "ETag": '"abc-2"'})
+            assert not index.in_sync("dev", "osrm/test/data.bin", str(local_file), {"Size": 13, "ETag": '"def-2"'})
+            assert not index.in_sync("dev", "osrm/test/data.bin", str(local_file), None)
+
+
+def test_sync_upload_directory_skips_unchanged(monkeypatch):
+    """Test that a second sync upload only transfers modified files."""
+    storage = S3Storage()
+    prefix = "osrm/test/sync_upload"
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = Path(temp_dir) / "processed"
+        source.mkdir()
+        for i in range(3):
+            (source / f"region.osrm.part{i}").write_text(f"content {i}")
+        
+        with SyncIndex(str(Path(temp_dir) / "index.sqlite")) as index:
+            calls = count_calls(monkeypatch, storage, "_upload_file")
+            assert storage.upload_directory(str(source), prefix, index=index) == 3
+            assert len(calls) == 3
+            
+            calls.clear()
+            assert storage.upload_directory(str(source), prefix, index=index) == 3
+            assert calls == []
+            
+            (source / "region.osrm.part1").write_text("changed content")
+            assert storage.upload_directory(str(source), prefix, index=index) == 3
+            assert [Path(call[0]).name for call in calls] == ["region.osrm.part1"]
+    
+    # Clean up
+    for key in storage.list_files(f"{prefix}/"):
+        storage.delete_file(key)
+
+
+def test_sync_download_directory_skips_unchanged(monkeypatch):
+    """Test that a second sync download only fetches locally missing or stale files."""
+    storage = S3Storage()
+    prefix = "osrm/test/sync_download"
+    keys = [f"{prefix}/region.osrm.part{i}" for i in range(3)]
+    for key in keys:
+        storage.client.put_object(Bucket=storage.bucket, Key=key, Body=key.encode())
+    
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            target = Path(temp_dir) / "processed"
+            
+            with SyncIndex(str(Path(temp_dir) / "index.sqlite")) as index:
+                calls = count_calls(monkeypatch, storage, "_download_file")
+                assert storage.download_directory(prefix, str(target), index=index) == 3
+                assert len(calls) == 3
+                
+                calls.clear()
+                assert storage.download_directory(prefix, str(target), index=index) == 3
+                assert calls == []
+                
+                (target / "region.osrm.part2").unlink()
+                assert storage.download_directory(prefix, str(target), index=index) == 3
+                assert [call[0] for call in calls] == [keys[2]]
+    finally:
+        # Clean up
+        for key in keys:
+            storage.delete_file(key)
@@ -0,0 +1,153 @@
+"""Test tile pre-rendering into MBTiles against a fake /tile service."""
+
+import asyncio
+import gzip
+import re
+import sqlite3
+import threading
+import pytest
+from src.client import tiles as tiles_module
+from src.client.osrm import OSRMClient
+from src.client.tiles import count_tiles, enumerate_tiles, publish_tiles, render_tiles, tile_xy
+from src.utils.s3_utils import S3Storage
+from tests.conftest import QuietHandler, serve_directory
+
+
+# Two zoom-12 columns by three rows around San Francisco
+BBOX = (-122.5, 37.7, -122.35, 37.85)
+
+
+class TileHandler(QuietHandler):
+    """
+    /tile answering with content that only depends on x parity.
+
+    Tiles with y % 3 == 0 are empty, and tiles in server.failing answer 500.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        x, y, z = (int(v) for v in re.search(r"tile\((\d+),(\d+),(\d+)\)\.mvt", self.path).groups())
+        with self.server.lock:
+            self.server.requests.append((z, x, y))
+            self.server.in_flight += 1
+            self.server.peak_in_flight = max(self.server.peak_in_flight, self.server.in_flight)
+        try:
+            if (z, x, y) in self.server.failing:
+                status, data = 500, b'{"code": "InternalError", "message": "failed"}'
+            else:
+                status, data = 200, b"" if y % 3 == 0 else f"mvt-{x % 2}".encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/x-protobuf")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+
+@pytest.fixture
+def tile_server():
+    with serve_directory(TileHandler) as (_, base_url, server):
+        server.lock = threading.Lock()
+        server.requests = []
+        server.in_flight = 0
+        server.peak_in_flight = 0
+        server.failing = set()
+        yield base_url, server
+
+
+def run_render(base_url, output, min_zoom=12, max_zoom=13, **kwargs):
+    async def run():
+        async with OSRMClient(base_url, concurrency=4) as client:
+            return await render_tiles(BBOX, min_zoom, max_zoom, output, client=client, **kwargs)
+    return asyncio.run(run())
+
+
+def test_enumerate_tiles_covers_bbox():
+    """Test the XYZ tile math and that every zoom level covers the bbox."""
+    assert tile_xy(0, 0, 1) == (1, 1)
+    assert tile_xy(-180, 85.1, 2) == (0, 0) and tile_xy(180, -85.1, 2) == (3, 3)
+    assert tile_xy(-122.4194, 37.7749, 12) == (655, 1583)
+    tiles = list(enumerate_tiles(BBOX, 12, 14))
+    assert len(tiles) == len(set(tiles)) == count_tiles(BBOX, 12, 14)
+    assert {z for z, _, _ in tiles} == {12, 13, 14}
+    assert [(x, y) for z, x, y in tiles if z == 12] == [
+        (654, 1582), (654, 1583), (654, 1584), (655, 1582), (655, 1583), (655, 1584)
+    ]
+
+
+def test_render_deduplicated_mbtiles(tile_server, tmp_path):
+    """Test TMS rows, deduplicated images, skipped empty tiles, metadata and bounded concurrency."""
+    base_url, server = tile_server
+    output = tmp_path / "tiles/driving.mbtiles"
+
+    assert run_render(base_url, output, concurrency=2, dataset_version="20250101T000000Z")
+
+    expected = list(enumerate_tiles(BBOX, 12, 13))
+    assert sorted(server.requests) == sorted(expected)
+    assert server.peak_in_flight <= 2
+    db = sqlite3.connect(output)
+    rows = {(z, x, (2 ** z - 1) - row): gzip.decompress(data) for z, x, row, data in db.execute("SELECT * FROM tiles")}
+    assert rows == {(z, x, y): f"mvt-{x % 2}".encode() for z, x, y in expected if y % 3}
+    assert db.execute("SELECT COUNT(*) FROM images").fetchone() == (2,)
+    metadata = dict(db.execute("SELECT name, value FROM metadata"))
+    assert metadata["format"] == "pbf" and metadata["minzoom"] == "12" and metadata["maxzoom"] == "13"
+    assert metadata["bounds"] == "-122.5,37.7,-122.35,37.85"
+    assert metadata["version"] == "20250101T000000Z"
+    assert list(output.parent.iterdir()) == [output]
+
+
+def test_render_reports_failed_tiles(tile_server, tmp_path):
+    """Test that failed tiles fail the run and keep the last complete file, and invalid zoom ranges are refused."""
+    base_url, server = tile_server
+    output = tmp_path / "driving.mbtiles"
+    assert run_render(base_url, output)
+    complete = output.read_bytes()
+
+    server.failing = {(12, 654, 1583)}
+    assert not run_render(base_url, output)
+    assert output.read_bytes() == complete
+    assert [path.name for path in tmp_path.iterdir()] == ["driving.mbtiles"]
+    assert not run_render(base_url, tmp_path / "first.mbtiles")
+    assert not (tmp_path / "first.mbtiles").exists()
+    assert not run_render(base_url, tmp_path / "low.mbtiles", min_zoom=11)
+    assert not (tmp_path / "low.mbtiles").exists()
+
+
+def test_render_fails_when_writer_fails(tile_server, tmp_path, monkeypatch):
+    """Test that a failing SQLite writer stops the fetchers and removes the partial file instead of hanging."""
+    base_url, _ = tile_server
+    written = []
+
+    def add(self, zoom, x, y, data):
+        written.append((zoom, x, y))
+        if len(written) == 3:
+            raise sqlite3.OperationalError("database or disk is full")
+
+    monkeypatch.setattr(tiles_module.MBTilesWriter, "add", add)
+
+    async def run():
+        async with OSRMClient(base_url, concurrency=2) as client:
+            return await asyncio.wait_for(render_tiles(BBOX, 12, 14, tmp_path / "driving.mbtiles", client=client), 10)
+
+    with pytest.raises(sqlite3.OperationalError):
+        asyncio.run(run())
+    assert len(written) == 3
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_publish_tiles_to_s3(tile_server, tmp_path):
+    """Test uploading the tileset next to the processed dataset."""
+    base_url, _ = tile_server
+    storage = S3Storage()
+    prefix = f"osrm/test/tiles-{tmp_path.name}"
+    output = tmp_path / "driving.mbtiles"
+    try:
+        assert run_render(base_url, output, max_zoom=12)
+        assert publish_tiles(output, prefix)
+        assert storage.read_object(f"{prefix}/driving.mbtiles") == output.read_bytes()
+    finally:
+        for key in storage.list_files(f"{prefix}/"):
+            storage.delete_file(key)
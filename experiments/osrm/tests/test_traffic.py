@@ -0,0 +1,88 @@
+"""Test customize-only traffic updates."""
+
+import json
+from pathlib import Path
+import pytest
+from src.core import traffic as traffic_module
+from src.core.traffic import update_speeds
+from src.utils.s3_utils import S3Storage
+
+
+REGION = "test-latest"
+BASE_SUFFIXES = ["ebg", "geometry", "names", "partition", "cells", "mldgr", "cell_metrics", "datasource_names"]
+
+# Fake osrm-customize: checks its update files and rewrites weights in place (truncating, like OSRM)
+FAKE_CUSTOMIZE = """\
+for arg in $OSRM_CUSTOMIZE_ARGS; do
+  case "$arg" in
+    /data/*) test -f "$OSRM_DATA_DIR/${arg#/data/}" || { echo "missing $arg"; exit 1; } ;;
+  esac
+done
+cd "$OSRM_DATA_DIR/intermediate"
+echo "$OSRM_CUSTOMIZE_ARGS" > "$OSRM_REGION.osrm.geometry"
+for suffix in mldgr cell_metrics datasource_names; do echo "traffic" > "$OSRM_REGION.osrm.$suffix"; done
+"""
+
+
+@pytest.fixture
+def base_dataset(fake_compose, tmp_path, monkeypatch):
+    """A built base dataset in data/processed and a fake customize step."""
+    fake_compose(FAKE_CUSTOMIZE)
+    monkeypatch.setenv("OSRM_REGION", REGION)
+    monkeypatch.setenv("TRAFFIC_DATA_DIR", "data/live")
+    processed = Path("data/processed")
+    processed.mkdir(parents=True)
+    for suffix in BASE_SUFFIXES:
+        (processed / f"{REGION}.osrm.{suffix}").write_text(f"base {suffix}\n")
+    Path("speeds.csv").write_text("1,2,30\n")
+    Path("turns.csv").write_text("1,2,3,5.0\n")
+    return processed
+
+
+def test_update_speeds_local(base_dataset):
+    """Test that only customize runs, on the base dataset, leaving the base untouched."""
+    assert update_speeds(["speeds.csv"], ["turns.csv"])
+
+    live = Path("data/live/processed")
+    geometry = (live / f"{REGION}.osrm.geometry").read_text()
+    assert "--segment-speed-file /data/traffic/speeds.csv" in geometry
+    assert "--turn-penalty-file /data/traffic/turns.csv" in geometry
+    assert (live / f"{REGION}.osrm.partition").read_text() == "base partition\n"
+    for suffix in BASE_SUFFIXES:
+        assert (base_dataset / f"{REGION}.osrm.{suffix}").read_text() == f"base {suffix}\n"
+
+    stamp = json.loads((live / "traffic.json").read_text())
+    assert [entry["name"] for entry in stamp["files"]] == ["speeds.csv", "turns.csv"]
+
+
+def test_update_speeds_requires_files_and_base(base_dataset):
+    """Test the failure modes: no update files, missing file, no base dataset."""
+    assert not update_speeds([])
+    assert not update_speeds(["nowhere.csv"])
+    for path in base_dataset.iterdir():
+        path.unlink()
+    assert not update_speeds(["speeds.csv"])
+
+
+def test_update_speeds_s3(base_dataset, tmp_path, monkeypatch):
+    """Test restoring the base from S3, fetching speeds from S3 and publishing the result."""
+    storage = S3Storage()
+    prefix = f"osrm/test/traffic-{tmp_path.name}"
+    monkeypatch.setattr(traffic_module, "BASE_PREFIX", f"{prefix}/processed")
+    monkeypatch.setenv("TRAFFIC_PUBLISH_PREFIX", f"{prefix}/live")
+    try:
+        assert storage.upload_directory(str(base_dataset), f"{prefix}/processed")
+        assert storage.upload_file("speeds.csv", f"{prefix}/speeds/today.csv")
+        for path in base_dataset.iterdir():
+            path.unlink()
+
+        assert update_speeds([f"s3://{storage.bucket}/{prefix}/speeds/today.csv"], storage_mode="s3")
+
+        geometry = storage.read_object(f"{prefix}/live/{REGION}.osrm.geometry").decode()
+        assert "--segment-speed-file /data/traffic/today.csv" in geometry
+        assert storage.read_object(f"{prefix}/live/{REGION}.osrm.partition") == b"base partition\n"
+        assert storage.read_object(f"{prefix}/processed/{REGION}.osrm.geometry") == b"base geometry\n"
+        assert not update_speeds(["s3://elsewhere/speeds.csv"], storage_mode="s3")
+    finally:
+        for key in storage.list_files(f"{prefix}/"):
+            storage.delete_file(key)
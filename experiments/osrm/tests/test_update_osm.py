@@ -0,0 +1,122 @@
+"""Test incremental OSM updates against a local replication server."""
+
+import gzip
+import json
+import struct
+import zlib
+from pathlib import Path
+import pytest
+from src.core import update_osm as update_module
+from src.core.update_osm import (
+    fetch_replication_state,
+    read_pbf_replication_header,
+    sequence_path,
+    update_osm,
+)
+from tests.conftest import QuietHandler, serve_directory
+
+
+def varint(value):
+    """Encode an unsigned protobuf varint."""
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        out.append(byte | (0x80 if value else 0))
+        if not value:
+            return bytes(out)
+
+
+def field(number, value):
+    """Encode a varint (int) or length-delimited (bytes) protobuf field."""
+    if isinstance(value, int):
+        return varint(number << 3) + varint(value)
+    return varint(number << 3 | 2) + varint(len(value)) + value
+
+
+def write_pbf_header(path, sequence, base_url):
+    """Write a PBF file consisting of just an OSMHeader block."""
+    header_block = (
+        field(4, b"OsmSchema-V0.6")
+        + field(32, 1700000000)
+        + field(33, sequence)
+        + field(34, base_url.encode())
+    )
+    blob = field(2, len(header_block)) + field(3, zlib.compress(header_block))
+    blob_header = field(1, b"OSMHeader") + field(3, len(blob))
+    path.write_bytes(struct.pack(">I", len(blob_header)) + blob_header + blob)
+
+
+@pytest.fixture
+def replication_server():
+    """Serve a replication directory with sequences 4120..4123."""
+    with serve_directory(QuietHandler) as (serve_dir, base_url, _):
+        updates = serve_dir / "test-updates"
+        for sequence in range(4120, 4124):
+            target = updates / f"{sequence_path(sequence)}.osc.gz"
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(gzip.compress(f"<osmChange seq='{sequence}'/>".encode()))
+        (updates / "state.txt").write_text(
+            "#Sat Oct 17 20:21:02 UTC 2026\nsequenceNumber=4123\ntimestamp=2026-10-17T20\\:20\\:00Z\n"
+        )
+        yield serve_dir, f"{base_url}/test-updates"
+
+
+def test_read_pbf_replication_header(tmp_path):
+    """Test reading the replication fields from a PBF header block."""
+    pbf = tmp_path / "region.osm.pbf"
+    write_pbf_header(pbf, 4121, "https://example.org/region-updates")
+    
+    header = read_pbf_replication_header(str(pbf))
+    assert header == {
+        "sequence": 4121,
+        "timestamp": 1700000000,
+        "base_url": "https://example.org/region-updates",
+    }
+
+
+def test_sequence_path():
+    """Test the replication directory layout."""
+    assert sequence_path(4123) == "000/004/123"
+    assert sequence_path(1234567890 % 10**9) == "234/567/890"
+
+
+def test_fetch_replication_state(replication_server):
+    """Test parsing the upstream state.txt."""
+    _, base_url = replication_server
+    state = fetch_replication_state(base_url)
+    assert state["sequenceNumber"] == 4123
+    assert state["timestamp"] == "2026-10-17T20:20:00Z"
+
+
+def test_update_osm_applies_missing_diffs(replication_server, tmp_path, monkeypatch):
+    """Test that only change files after the extract's sequence are fetched and applied."""
+    _, base_url = replication_server
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OSM_FILENAME", "test-latest.osm.pbf")
+    monkeypatch.setenv("OSM_DOWNLOAD_URL", "http://unused.invalid/test-latest.osm.pbf")
+    raw = tmp_path / "data/raw"
+    raw.mkdir(parents=True)
+    write_pbf_header(raw / "test-latest.osm.pbf", 4121, base_url)
+    
+    applied = []
+    
+    def fake_merge(step, timeout=1800):
+        # Stand-in for the osmium container: record inputs, emit the merged file
+        applied.extend(sorted(p.name for p in (tmp_path / "data/updates").glob("*.osc.gz")))
+        write_pbf_header(raw / "test-latest.osm.pbf.updated", 4123, base_url)
+        return True
+    
+    monkeypatch.setattr(update_module, "run_docker_compose_step", fake_merge)
+    monkeypatch.setattr(update_module, "cleanup_docker", lambda compose_file: True)
+    
+    assert update_osm(storage_type="local")
+    assert applied == ["000004122.osc.gz", "000004123.osc.gz"]
+    assert read_pbf_replication_header(str(raw / "test-latest.osm.pbf"))["sequence"] == 4123
+    state = json.loads((raw / "test-latest.osm.pbf.state.json").read_text())
+    assert state["sequence"] == 4123
+    
+    # A second run finds nothing new and does not invoke the merge
+    applied.clear()
+    assert update_osm(storage_type="local")
+    assert applied == []